@@ -0,0 +1,275 @@
+import argparse
+import collections
+import concurrent.futures
+import functools
+import os
+import pathlib
+
+import numpy as np
+import rows
+
+import profiles
+import recorder
+import settings
+
+
+# Recording formats, fastest to load first (a roast exported to XLS usually
+# also has its `.bin`)
+SUFFIXES = (".bin", ".csv", ".xls")
+VARIABLES = ("temp_bean", "temp_air", "temp_fire", "servo_position")
+FIRST_CRACK_TEMPERATURE = 196  # proxy for the first crack, not recorded
+ROR_WINDOW = 30  # seconds
+TURNING_POINT_SEARCH = (10, 240)  # seconds
+TURNING_POINT_SMOOTHING = 5  # seconds
+# The beans were dropped when the bean probe temperature changes this much
+# in `DROP_WINDOW` seconds: it goes to the air of the empty drum (or the
+# cooler), way faster than any roasting curve
+DROP_CHANGE = 10
+DROP_WINDOW = 10
+
+Roast = collections.namedtuple("Roast", ["filename", "values"])
+
+
+def fill_forward(values):
+    """Replace each NaN with the last valid value before it"""
+
+    indexes = np.where(np.isnan(values), 0, np.arange(len(values)))
+    np.maximum.accumulate(indexes, out=indexes)
+    return values[indexes]
+
+
+def per_second(times, values):
+    """`values` indexed by the integer roast second (last sample wins)
+
+    Samples after the roast (when the roaster resets its clock) are
+    dropped; seconds without a sample repeat the previous value.
+    """
+
+    times = np.asarray(times)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(times.astype(float))
+    times, values = times[valid].astype(int), values[valid]
+    if not len(times):
+        return np.array([], dtype=float)
+    end = int(np.argmax(times))
+    times, values = times[: end + 1], values[: end + 1]
+    started = times >= 0
+    result = np.full(times.max() + 1, np.nan)
+    result[times[started]] = values[started]
+    return fill_forward(result)
+
+
+def _columns(filename):
+    if filename.suffix == ".bin":
+        array = recorder.read_array(filename)
+        return {name: array[name] for name in array.dtype.names}
+    samples = recorder.load(filename)
+    return {
+        name: np.array([sample.get(name) for sample in samples], dtype=float)
+        for name in ("roast_time",) + VARIABLES
+        if samples and name in samples[0]
+    }
+
+
+def load_roast(filename):
+    """Recorded roast with one value per second of each of `VARIABLES`"""
+
+    filename = pathlib.Path(filename)
+    columns = _columns(filename)
+    return Roast(
+        filename,
+        {
+            name: per_second(columns["roast_time"], columns[name])
+            for name in VARIABLES
+            if name in columns
+        },
+    )
+
+
+def rate_of_rise(temperatures, window=ROR_WINDOW):
+    """Degrees per minute over the last `window` seconds, for every second"""
+
+    result = np.full(len(temperatures), np.nan)
+    if len(temperatures) > window:
+        result[window:] = (temperatures[window:] - temperatures[:-window]) * (
+            60 / window
+        )
+    return result
+
+
+def turning_point(temperatures, search=TURNING_POINT_SEARCH):
+    """Second of the lowest (smoothed) temperature after the charge"""
+
+    start, stop = search
+    smoothed = profiles.smooth(temperatures, TURNING_POINT_SMOOTHING)
+    window = smoothed[start : stop + 1]
+    if not len(window) or np.isnan(window).all():
+        return None
+    return start + int(np.nanargmin(window))
+
+
+def drop(temperatures, start=0):
+    """Second when the beans were dropped (`None` if they never were)"""
+
+    changes = np.abs(temperatures[DROP_WINDOW:] - temperatures[:-DROP_WINDOW])
+    dropped = np.flatnonzero(changes[start:] >= DROP_CHANGE)
+    if not len(dropped):
+        return None
+    # The last second before the biggest step inside the window
+    window = start + int(dropped[0])
+    steps = np.abs(np.diff(temperatures[window : window + DROP_WINDOW + 1]))
+    return window + int(np.argmax(steps))
+
+
+def final_temperature(temperatures, start=0):
+    """Highest temperature from `start` until the beans were dropped
+
+    Unlike searching backwards for the last rise, the probe reading the
+    empty drum after the drop (or a noisy sample) doesn't change the result.
+    """
+
+    end = drop(temperatures, start)
+    end = len(temperatures) - 1 if end is None else end
+    window = temperatures[start : end + 1]
+    if not len(window) or np.isnan(window).all():
+        return None
+    return float(np.nanmax(window))
+
+
+def samples_final_temperature(points):
+    """`final_temperature` after the turning point of `(roast_time,
+    temp_bean)` samples (`None` without samples)"""
+
+    if not points:
+        return None
+    temperatures = per_second(*zip(*points))
+    return final_temperature(temperatures, turning_point(temperatures) or 0)
+
+
+def _first(condition, start=0):
+    indexes = np.flatnonzero(condition[start:])
+    return start + int(indexes[0]) if len(indexes) else None
+
+
+def _number(value, digits=1):
+    if value is None or np.isnan(value):
+        return None
+    return round(float(value), digits)
+
+
+def summarize(roast, setup=None):
+    """Turning point, development, final temperature, rate of rise and
+    deviation from the `setup` (bean temperature per second) of a roast"""
+
+    temperatures = roast.values["temp_bean"]
+    summary = {"filename": roast.filename.name, "duration": len(temperatures) - 1}
+    tp = turning_point(temperatures)
+    if tp is None:
+        return summary
+    end = drop(temperatures, tp)
+    end = len(temperatures) - 1 if end is None else end
+    first_crack = _first(temperatures[: end + 1] >= FIRST_CRACK_TEMPERATURE, tp)
+    ror = rate_of_rise(temperatures)[tp : end + 1]
+    summary.update(
+        {
+            "turning_point_seconds": tp,
+            "turning_point_temp": _number(temperatures[tp]),
+            "first_crack_seconds": first_crack,
+            "drop_seconds": end,
+            "final_temperature": _number(final_temperature(temperatures, tp)),
+            "development_seconds": (None if first_crack is None else end - first_crack),
+            "development_ratio": (
+                None if first_crack is None else _number((end - first_crack) / end, 3)
+            ),
+            "ror_max": _number(np.nanmax(ror)) if not np.isnan(ror).all() else None,
+            "ror_mean": _number(np.nanmean(ror)) if not np.isnan(ror).all() else None,
+            "ror_final": _number(ror[-1]),
+        }
+    )
+    if setup is not None:
+        setup_end = drop(setup, turning_point(setup) or 0)
+        size = min(len(setup) if setup_end is None else setup_end + 1, end + 1)
+        deviations = temperatures[tp:size] - setup[tp:size]
+        deviations = deviations[~np.isnan(deviations)]
+        if len(deviations):
+            summary["setup_rms_deviation"] = _number(np.sqrt(np.mean(deviations**2)))
+            summary["setup_max_deviation"] = _number(np.max(np.abs(deviations)))
+    return summary
+
+
+def summarize_file(filename, setup=None):
+    try:
+        return summarize(load_roast(filename), setup)
+    except (OSError, ValueError, KeyError) as exception:
+        return {"filename": pathlib.Path(filename).name, "error": repr(exception)}
+
+
+def find_roasts(paths, suffixes=SUFFIXES):
+    """Recordings in `paths` (files or directories), one file per roast
+
+    Only files with one of `suffixes` are found; when a roast has more than
+    one, the first suffix wins.
+    """
+
+    found = {}
+    for path in map(pathlib.Path, paths):
+        filenames = [path] if path.is_file() else path.glob("torra-*")
+        for filename in filenames:
+            if filename.suffix not in suffixes:
+                continue
+            current = found.get(filename.stem)
+            if current is None or suffixes.index(filename.suffix) < suffixes.index(
+                current.suffix
+            ):
+                found[filename.stem] = filename
+    return sorted(found.values())
+
+
+def analyze(filenames, setup=None, workers=None):
+    """`summarize` every roast, loading and computing in a process pool"""
+
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(filenames) // (workers * 4))
+    task = functools.partial(summarize_file, setup=setup)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        return list(executor.map(task, filenames, chunksize=chunksize))
+
+
+def setup_temperatures(filename):
+    """Bean temperature of a setup (a recorded roast), per second"""
+
+    return load_roast(filename).values["temp_bean"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary table of recorded roasts")
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        default=[settings.DATA_PATH],
+        help="Recordings or directories with `torra-*` files (default: DATA_PATH)",
+    )
+    parser.add_argument("--setup", help="Setup to compute the deviations from")
+    parser.add_argument("--workers", type=int, help="Default: number of CPUs")
+    parser.add_argument("--output", help="Save the table to this CSV or XLS file")
+    args = parser.parse_args()
+
+    filenames = find_roasts(args.paths)
+    setup = setup_temperatures(args.setup) if args.setup else None
+    table = analyze(filenames, setup, args.workers)
+    fields = list(dict.fromkeys(field for summary in table for field in summary))
+    print("\t".join(fields))
+    for summary in table:
+        print(
+            "\t".join(
+                "" if summary.get(field) is None else str(summary[field])
+                for field in fields
+            )
+        )
+    if args.output:
+        data = rows.import_from_dicts(table)
+        if args.output.endswith(".xls"):
+            rows.export_to_xls(data, args.output)
+        else:
+            rows.export_to_csv(data, args.output)
+        print(f"Resumo gravado: {args.output}")
@@ -0,0 +1,404 @@
+import argparse
+import csv
+import datetime
+import decimal
+import pathlib
+import sqlite3
+
+import analytics
+import recorder
+import settings
+import utils
+
+
+# Columns of the `sample` table, from the `data` dict of the roaster (the
+# smoothed values come from `signals.RoastSignals`)
+SAMPLE_COLUMNS = (
+    ("roast_time", "INTEGER"),
+    ("temp_bean", "REAL"),
+    ("temp_air", "REAL"),
+    ("temp_fire", "REAL"),
+    ("temp_goal", "REAL"),
+    ("temp_cooler", "REAL"),
+    ("servo_position", "INTEGER"),
+    ("powered", "INTEGER"),
+    ("burner", "INTEGER"),
+    ("roasting", "INTEGER"),
+    ("datetime", "TEXT"),
+    ("temp_bean_smooth", "REAL"),
+    ("temp_air_smooth", "REAL"),
+    ("temp_fire_smooth", "REAL"),
+    ("ror_bean", "REAL"),
+)
+SAMPLE_FIELDS = tuple(name for name, _ in SAMPLE_COLUMNS)
+ROAST_FIELDS = (
+    "id",
+    "number",
+    "roaster",
+    "setup_filename",
+    "setup_hash",
+    "control_type",
+    "started_at",
+    "finished_at",
+    "setup_final_temperature",
+    "final_temperature",
+    "source",
+)
+# A roast number may be run again (like after an aborted roast), so the same
+# recording can be the `source` of many roasts
+ROAST_TABLE = """
+CREATE TABLE IF NOT EXISTS {name} (
+    id INTEGER PRIMARY KEY,
+    number TEXT NOT NULL,
+    roaster TEXT,
+    setup_filename TEXT,
+    setup_hash TEXT,
+    control_type TEXT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    setup_final_temperature REAL,
+    final_temperature REAL,
+    source TEXT
+)
+"""
+SCHEMA = """
+{roast_table};
+CREATE INDEX IF NOT EXISTS roast_started_at ON roast (started_at);
+CREATE INDEX IF NOT EXISTS roast_setup ON roast (setup_hash, started_at);
+CREATE INDEX IF NOT EXISTS roast_number ON roast (number);
+CREATE INDEX IF NOT EXISTS roast_roaster ON roast (roaster, started_at);
+CREATE INDEX IF NOT EXISTS roast_source ON roast (source);
+CREATE TABLE IF NOT EXISTS sample (
+    roast_id INTEGER NOT NULL REFERENCES roast (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    {columns},
+    PRIMARY KEY (roast_id, position)
+) WITHOUT ROWID;
+""".format(
+    roast_table=ROAST_TABLE.format(name="roast").strip(),
+    columns=",\n    ".join(f"{name} {kind}" for name, kind in SAMPLE_COLUMNS),
+)
+
+
+def _value(value):
+    """Sample value as stored by SQLite (spreadsheets give dates and decimals)"""
+
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat().replace(" ", "T")[:19]
+    elif isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def _row(roast_id, position, data):
+    return (roast_id, position) + tuple(
+        _value(data.get(field)) for field in SAMPLE_FIELDS
+    )
+
+
+def parse_name(filename):
+    """`(roaster, number)` from a recording name like `torra-r1-101.xls`"""
+
+    name = pathlib.Path(filename).stem
+    if name.startswith("torra-"):
+        name = name[len("torra-") :]
+    roaster, _, number = name.rpartition("-")
+    return roaster or None, number
+
+
+class Archive:
+    """Roasts (metadata) and their samples in one SQLite database
+
+    Samples are written as the roast goes, committed every `commit_interval`
+    of them; the database is in WAL mode, so the dashboards and the queries
+    read it while roasts (from several processes or threads, each with its
+    own `Archive`) are being written. Queries by setup, date, number or
+    roaster use indexes.
+    """
+
+    def __init__(self, filename=None, commit_interval=None):
+        self.filename = filename or settings.ARCHIVE_FILENAME
+        self.commit_interval = commit_interval or settings.ARCHIVE_COMMIT_INTERVAL
+        self.connection = sqlite3.connect(str(self.filename), timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self._drop_unique_source()
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+        self._add_columns()
+        self._pending = []
+        self._positions = {}
+
+    def _drop_unique_source(self):
+        """Rebuild the roast table of a database created when `source` was
+        `UNIQUE` (the samples are kept: foreign keys aren't enforced yet)"""
+
+        if not any(
+            row["unique"] and row["origin"] == "u"
+            for row in self.connection.execute("PRAGMA index_list(roast)")
+        ):
+            return
+        with self.connection:
+            self.connection.execute(ROAST_TABLE.format(name="roast_new"))
+            self.connection.execute(
+                f"INSERT INTO roast_new ({', '.join(ROAST_FIELDS)}) "
+                f"SELECT {', '.join(ROAST_FIELDS)} FROM roast"
+            )
+            self.connection.execute("DROP TABLE roast")
+            self.connection.execute("ALTER TABLE roast_new RENAME TO roast")
+
+    def _add_columns(self):
+        """Add the sample columns created after the database was"""
+
+        existing = {
+            row["name"] for row in self.connection.execute("PRAGMA table_info(sample)")
+        }
+        with self.connection:
+            for name, kind in SAMPLE_COLUMNS:
+                if name not in existing:
+                    self.connection.execute(
+                        f"ALTER TABLE sample ADD COLUMN {name} {kind}"
+                    )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start_roast(
+        self,
+        number,
+        setup_filename=None,
+        control_type=None,
+        roaster=None,
+        setup_final_temperature=None,
+        started_at=None,
+        source=None,
+    ):
+        """Register a roast, returning its ID (used to `append` samples)"""
+
+        setup_hash = None
+        if setup_filename is not None and pathlib.Path(setup_filename).exists():
+            setup_hash = utils.file_hash(setup_filename)
+        with self.connection:
+            cursor = self.connection.execute(
+                """
+                INSERT INTO roast (
+                    number, roaster, setup_filename, setup_hash, control_type,
+                    started_at, setup_final_temperature, source
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    str(number),
+                    roaster,
+                    None if setup_filename is None else str(setup_filename),
+                    setup_hash,
+                    control_type,
+                    started_at or utils.pretty_now(),
+                    setup_final_temperature,
+                    None if source is None else str(source),
+                ),
+            )
+        self._positions[cursor.lastrowid] = 0
+        return cursor.lastrowid
+
+    def append(self, roast_id, data):
+        position = self._positions.get(roast_id, 0)
+        self._positions[roast_id] = position + 1
+        self._pending.append(_row(roast_id, position, data))
+        if len(self._pending) >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        columns = ", ".join(("roast_id", "position") + SAMPLE_FIELDS)
+        marks = ", ".join("?" * (len(SAMPLE_FIELDS) + 2))
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT INTO sample ({columns}) VALUES ({marks})", self._pending
+            )
+        self._pending = []
+
+    def finish_roast(self, roast_id, finished_at=None):
+        """Save the pending samples, the end time and the final temperature
+        (see `analytics.final_temperature`)"""
+
+        self.flush()
+        points = self.connection.execute(
+            "SELECT roast_time, temp_bean FROM sample WHERE roast_id = ? "
+            "AND roast_time IS NOT NULL AND temp_bean IS NOT NULL ORDER BY position",
+            (roast_id,),
+        ).fetchall()
+        final_temperature = analytics.samples_final_temperature(points)
+        with self.connection:
+            self.connection.execute(
+                "UPDATE roast SET finished_at = ?, final_temperature = ? WHERE id = ?",
+                (finished_at or utils.pretty_now(), final_temperature, roast_id),
+            )
+        self._positions.pop(roast_id, None)
+
+    def import_file(self, filename, setup_filename=None, control_type=None):
+        """Archive a recording (`.bin`, `.csv` or `.xls`), with every
+        sample inserted in one transaction
+
+        Returns the new roast ID, or `None` if it was already imported.
+        """
+
+        filename = pathlib.Path(filename).resolve()
+        found = self.connection.execute(
+            "SELECT id FROM roast WHERE source = ?", (str(filename),)
+        ).fetchone()
+        if found is not None:
+            return None
+
+        samples = recorder.load(filename)
+        roaster, number = parse_name(filename)
+        modified = datetime.datetime.fromtimestamp(filename.stat().st_mtime)
+        dates = [
+            _value(sample["datetime"]) for sample in samples if sample.get("datetime")
+        ] or [_value(modified)]
+        roast_id = self.start_roast(
+            number,
+            setup_filename=setup_filename,
+            control_type=control_type,
+            roaster=roaster,
+            started_at=dates[0],
+            source=filename,
+        )
+        self._pending.extend(
+            _row(roast_id, position, sample) for position, sample in enumerate(samples)
+        )
+        self.finish_roast(roast_id, finished_at=dates[-1])
+        return roast_id
+
+    def roasts(
+        self,
+        setup=None,
+        since=None,
+        until=None,
+        number=None,
+        roaster=None,
+        control_type=None,
+        limit=None,
+    ):
+        """Roasts (newest first) matching every filter given
+
+        `setup` is a setup file (matched by content) or its hash; `since`
+        and `until` are dates or date-times like `2024-05-01`.
+        """
+
+        conditions, parameters = [], []
+        if setup is not None:
+            path = pathlib.Path(setup)
+            conditions.append("setup_hash = ?")
+            parameters.append(utils.file_hash(path) if path.exists() else setup)
+        if since is not None:
+            conditions.append("started_at >= ?")
+            parameters.append(str(since))
+        if until is not None:
+            # A date includes the whole day
+            conditions.append("started_at < ?")
+            parameters.append(str(until) + ("T99" if len(str(until)) == 10 else ""))
+        for column, value in (
+            ("number", number),
+            ("roaster", roaster),
+            ("control_type", control_type),
+        ):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(str(value))
+        query = f"SELECT {', '.join(ROAST_FIELDS)} FROM roast"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY started_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(int(limit))
+        return [dict(row) for row in self.connection.execute(query, parameters)]
+
+    def samples(self, roast_id):
+        """Samples of a roast, in the recorded order"""
+
+        query = (
+            f"SELECT {', '.join(SAMPLE_FIELDS)} FROM sample WHERE roast_id = ? "
+            "ORDER BY position"
+        )
+        return [dict(row) for row in self.connection.execute(query, (roast_id,))]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def _print_table(table, fields):
+    print("\t".join(fields))
+    for row in table:
+        print(
+            "\t".join("" if row[field] is None else str(row[field]) for field in fields)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roast archive (SQLite)")
+    parser.add_argument("--filename", help="Default: settings.ARCHIVE_FILENAME")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Archive recordings")
+    import_parser.add_argument(
+        "paths",
+        nargs="+",
+        help="Recordings or directories with `torra-*` files",
+    )
+    import_parser.add_argument("--setup", help="Setup file used by these roasts")
+    import_parser.add_argument("--control_type")
+
+    list_parser = subparsers.add_parser("list", help="Search roasts")
+    list_parser.add_argument("--setup", help="Setup file (or its hash)")
+    list_parser.add_argument("--since", help="Like 2024-05-01")
+    list_parser.add_argument("--until", help="Like 2024-05-31")
+    list_parser.add_argument("--number")
+    list_parser.add_argument("--roaster")
+    list_parser.add_argument("--control_type")
+    list_parser.add_argument("--limit", type=int)
+
+    export_parser = subparsers.add_parser("export", help="Samples of a roast as CSV")
+    export_parser.add_argument("roast_id", type=int)
+    export_parser.add_argument("output")
+    args = parser.parse_args()
+
+    with Archive(args.filename) as roast_archive:
+        if args.command == "import":
+            filenames = analytics.find_roasts(args.paths)
+            imported = 0
+            for filename in filenames:
+                roast_id = roast_archive.import_file(
+                    filename, args.setup, args.control_type
+                )
+                if roast_id is not None:
+                    imported += 1
+                    print(f"  {filename}: torra {roast_id}")
+            print(f"{imported} de {len(filenames)} arquivos importados")
+
+        elif args.command == "list":
+            table = roast_archive.roasts(
+                setup=args.setup,
+                since=args.since,
+                until=args.until,
+                number=args.number,
+                roaster=args.roaster,
+                control_type=args.control_type,
+                limit=args.limit,
+            )
+            _print_table(table, ROAST_FIELDS)
+
+        elif args.command == "export":
+            samples = roast_archive.samples(args.roast_id)
+            with open(args.output, mode="w", encoding="utf8") as fobj:
+                writer = csv.DictWriter(fobj, fieldnames=SAMPLE_FIELDS)
+                writer.writeheader()
+                writer.writerows(samples)
+            print(f"{len(samples)} amostras gravadas: {args.output}")
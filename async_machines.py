@@ -0,0 +1,538 @@
+import asyncio
+import contextlib
+import itertools
+import struct
+
+import modbus_tk.defines as cst
+from modbus_tk.exceptions import ModbusError, ModbusInvalidResponseError
+
+from machines import BatchWriteError, CarmoMaq10, RoasterState
+
+
+class AsyncModbusClient:
+    """Modbus TCP master that keeps several requests in flight
+
+    Each request gets its own transaction id, so responses are matched to
+    the right caller no matter the order they arrive in. `timeout` is the
+    default deadline of each request. When the connection is lost (or the
+    responses can't be read) the client is disconnected: the pending
+    requests and the next ones fail right away, until `connect` again.
+    """
+
+    def __init__(self, host, port=502, timeout=5.0, max_in_flight=8):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._pending = {}
+        self._transaction_ids = itertools.cycle(range(1, 65536))
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def close(self):
+        writer = self._writer
+        if self._receiver is not None:
+            self._receiver.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._receiver
+            self._receiver = None
+        self._disconnect(ConnectionError("Connection closed"))
+        if writer is not None:
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    def _disconnect(self, exception):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+        self._fail_pending(exception)
+
+    def _fail_pending(self, exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exception)
+        self._pending.clear()
+
+    async def _receive(self):
+        """Read responses and hand each one to the request waiting for it"""
+
+        reader, reason = self._reader, "Connection closed"
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                transaction_id, _, length, _ = struct.unpack(">HHHB", header)
+                pdu = await reader.readexactly(length - 1)
+                future = self._pending.pop(transaction_id, None)
+                if future is not None and not future.done():
+                    future.set_result(pdu)
+        except Exception as exception:  # a broken stream can't be resynced
+            reason = f"Connection lost: {exception!r}"
+        finally:
+            if self._reader is reader:  # not replaced by a new connection
+                self._disconnect(ConnectionError(reason))
+
+    @staticmethod
+    def _build_pdu(function_code, starting_address, quantity_of_x, output_value):
+        if function_code in (cst.READ_COILS, cst.READ_HOLDING_REGISTERS):
+            return struct.pack(">BHH", function_code, starting_address, quantity_of_x)
+        elif function_code == cst.WRITE_SINGLE_COIL:
+            value = 0xFF00 if output_value else 0x0000
+            return struct.pack(">BHH", function_code, starting_address, value)
+        elif function_code == cst.WRITE_SINGLE_REGISTER:
+            return struct.pack(">BHH", function_code, starting_address, output_value)
+        elif function_code == cst.WRITE_MULTIPLE_COILS:
+            packed = bytearray((len(output_value) + 7) // 8)
+            for index, value in enumerate(output_value):
+                if value:
+                    packed[index // 8] |= 1 << (index % 8)
+            return struct.pack(
+                ">BHHB", function_code, starting_address, len(output_value), len(packed)
+            ) + bytes(packed)
+        elif function_code == cst.WRITE_MULTIPLE_REGISTERS:
+            return struct.pack(
+                f">BHHB{len(output_value)}H",
+                function_code,
+                starting_address,
+                len(output_value),
+                len(output_value) * 2,
+                *output_value,
+            )
+        raise ValueError(f"Unsupported function code: {function_code}")
+
+    @staticmethod
+    def _parse_pdu(function_code, quantity_of_x, pdu):
+        if pdu[0] == function_code | 0x80:
+            raise ModbusError(pdu[1])
+        elif pdu[0] != function_code:
+            raise ModbusInvalidResponseError(
+                f"Response for function {pdu[0]}, expected {function_code}"
+            )
+
+        if function_code == cst.READ_COILS:
+            return tuple(
+                (pdu[2 + index // 8] >> (index % 8)) & 1
+                for index in range(quantity_of_x)
+            )
+        elif function_code == cst.READ_HOLDING_REGISTERS:
+            return struct.unpack(f">{pdu[1] // 2}H", pdu[2 : 2 + pdu[1]])
+        return struct.unpack(">HH", pdu[1:5])
+
+    async def execute(
+        self,
+        slave,
+        function_code,
+        starting_address,
+        quantity_of_x=0,
+        output_value=0,
+        timeout=None,
+    ):
+        """Send a request and wait for its response (same API as modbus_tk)"""
+
+        if self._writer is None:
+            raise ConnectionError("Not connected")
+
+        pdu = self._build_pdu(
+            function_code, starting_address, quantity_of_x, output_value
+        )
+        async with self._in_flight:
+            if self._writer is None:  # lost while waiting for a slot
+                raise ConnectionError("Not connected")
+            transaction_id = next(self._transaction_ids)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[transaction_id] = future
+            self._writer.write(
+                struct.pack(">HHHB", transaction_id, 0, len(pdu) + 1, slave) + pdu
+            )
+            try:
+                await self._writer.drain()
+                response = await asyncio.wait_for(
+                    future, self.timeout if timeout is None else timeout
+                )
+            finally:
+                self._pending.pop(transaction_id, None)
+
+        return self._parse_pdu(function_code, quantity_of_x, response)
+
+
+class AsyncCarmoMaq10(CarmoMaq10):
+    """`CarmoMaq10` on top of asyncio
+
+    Every method and property is a coroutine (`await roaster.data`,
+    `await roaster.set_burner(True)`), so reads and writes that do not
+    depend on each other can be awaited concurrently and are pipelined on
+    the same connection.
+    """
+
+    async def connect(self, timeout=5.0, max_in_flight=8):
+        """Start the modbus connection with the roaster"""
+
+        self._master = AsyncModbusClient(
+            self.host, self.port, timeout=timeout, max_in_flight=max_in_flight
+        )
+        await self._master.connect()
+
+    async def _fetch_bools(self, start_address, quantity, timeout=None):
+        result = await self._master.execute(
+            1, cst.READ_COILS, start_address, quantity, timeout=timeout
+        )
+        values = [True if value == 1 else False for value in result]
+        self._fetched(cst.COILS, start_address, values)
+        return values
+
+    async def _fetch_words(self, start_address, quantity, timeout=None):
+        values = list(
+            await self._master.execute(
+                1,
+                cst.READ_HOLDING_REGISTERS,
+                start_address,
+                quantity,
+                timeout=timeout,
+            )
+        )
+        self._fetched(cst.HOLDING_REGISTERS, start_address, values)
+        return values
+
+    async def _read_bools(self, start_address, quantity):
+        values = self._cached_values(cst.COILS, start_address, quantity)
+        if values is None:
+            values = await self._fetch_bools(start_address, quantity)
+        return values
+
+    async def _read_words(self, start_address, quantity):
+        values = self._cached_values(cst.HOLDING_REGISTERS, start_address, quantity)
+        if values is None:
+            values = await self._fetch_words(start_address, quantity)
+        return values
+
+    async def _write_bool(self, coil_address, value):
+        assert value in (0, 1)
+        if self._unchanged(cst.COILS, coil_address, [bool(value)]):
+            return
+        elif await self._queue_write(cst.COILS, coil_address, [bool(value)]):
+            return
+        await self._master.execute(
+            1,
+            cst.WRITE_SINGLE_COIL,
+            coil_address,
+            output_value=value,
+        )
+        self._written(cst.COILS, coil_address, [bool(value)])
+
+    async def _write_word(self, register_address, value):
+        if self._unchanged(cst.HOLDING_REGISTERS, register_address, [value]):
+            return
+        elif await self._queue_write(cst.HOLDING_REGISTERS, register_address, [value]):
+            return
+        await self._master.execute(
+            1, cst.WRITE_SINGLE_REGISTER, register_address, output_value=value
+        )
+        self._written(cst.HOLDING_REGISTERS, register_address, [value])
+
+    async def _write_words(self, start_address, values):
+        if self._unchanged(cst.HOLDING_REGISTERS, start_address, values):
+            return
+        elif await self._queue_write(cst.HOLDING_REGISTERS, start_address, values):
+            return
+        await self._master.execute(
+            1,
+            cst.WRITE_MULTIPLE_REGISTERS,
+            start_address,
+            output_value=values,
+        )
+        self._written(cst.HOLDING_REGISTERS, start_address, values)
+
+    async def _queue_write(self, block_type, start_address, values):
+        if self._batch is None:
+            return False
+        elif (block_type, start_address) in self.UNBATCHED_WRITES:
+            await self._flush_batch()
+            self._enqueue(block_type, start_address, values)
+            await self._flush_batch()
+            return True
+        if self._queued(block_type, start_address, len(values)):
+            await self._flush_batch()
+        self._enqueue(block_type, start_address, values)
+        return True
+
+    async def _flush_batch(self):
+        """Send the merged writes, pipelined in order on the connection"""
+
+        try:
+            await asyncio.gather(
+                *[
+                    self._master.execute(
+                        1, function_code, start_address, output_value=output_value
+                    )
+                    for function_code, start_address, output_value in (
+                        self._plan_writes()
+                    )
+                ]
+            )
+        except Exception as exception:
+            self._forget()
+            raise BatchWriteError(repr(exception)) from exception
+
+    @contextlib.asynccontextmanager
+    async def batch(self):
+        if self._batch is not None:
+            yield
+            return
+        self._batch = {}
+        try:
+            yield
+        finally:
+            try:
+                await self._flush_batch()
+            finally:
+                self._batch = None
+
+    async def _get_status(self, address):
+        value = (await self._read_bools(address, 1))[0]
+        return True if value == 1 else False
+
+    async def _set_status(self, address, status):
+        assert status in (True, False)
+        await self._write_bool(address, 1 if status else 0)
+
+    async def _fetch_snapshot(self, timeout=None):
+        """Run every planned read concurrently"""
+
+        results = await asyncio.gather(
+            *[
+                (
+                    self._fetch_bools(start_address, quantity, timeout=timeout)
+                    if block_type == cst.COILS
+                    else self._fetch_words(start_address, quantity, timeout=timeout)
+                )
+                for block_type, start_address, quantity in self._reads
+            ]
+        )
+        values = {cst.COILS: {}, cst.HOLDING_REGISTERS: {}}
+        for (block_type, start_address, _), result in zip(self._reads, results):
+            values[block_type].update(enumerate(result, start=start_address))
+        return values
+
+    async def _decode_state(self):
+        values = {}
+        for field in RoasterState.__dataclass_fields__:
+            if field != "timestamp":
+                values[field] = await getattr(self, field)
+        return RoasterState(**values)
+
+    async def snapshot(self, timeout=None):
+        """Read every known address, with all reads in flight at once"""
+
+        previous, self._held = self._held, await self._fetch_snapshot(timeout)
+        try:
+            return await self._decode_state()
+        finally:
+            self._held = previous
+
+    @contextlib.asynccontextmanager
+    async def hold(self, timeout=None):
+        previous, self._held = self._held, await self._fetch_snapshot(timeout)
+        try:
+            yield await self._decode_state()
+        finally:
+            self._held = previous
+
+    async def _doors(self):
+        return await asyncio.gather(
+            self.bean_entrance, self.bean_exit, self.cooler_exit
+        )
+
+    async def open_bean_entrance(self):
+        bean_entrance, bean_exit, cooler_exit = await self._doors()
+        assert not any([bean_exit, cooler_exit])
+        assert not bean_entrance
+        await self._set_status(self.ADDR_WRITE_BEAN_ENTRANCE, True)
+
+    async def close_bean_entrance(self):
+        bean_entrance, bean_exit, cooler_exit = await self._doors()
+        assert all([not bean_exit, not cooler_exit])
+        assert bean_entrance
+        await self._set_status(self.ADDR_WRITE_BEAN_ENTRANCE, False)
+
+    async def open_bean_exit(self):
+        bean_entrance, bean_exit, cooler_exit = await self._doors()
+        assert not any([bean_entrance, cooler_exit])
+        assert not bean_exit
+        await self._set_status(self.ADDR_WRITE_BEAN_EXIT, True)
+
+    async def close_bean_exit(self):
+        bean_entrance, bean_exit, cooler_exit = await self._doors()
+        assert all([not bean_entrance, not cooler_exit])
+        assert bean_exit
+        await self._set_status(self.ADDR_WRITE_BEAN_EXIT, False)
+
+    async def open_cooler_exit(self):
+        bean_entrance, bean_exit, cooler_exit = await self._doors()
+        assert not any([bean_entrance, bean_exit])
+        assert not cooler_exit
+        await self._set_status(self.ADDR_WRITE_COOLER_EXIT, True)
+
+    async def close_cooler_exit(self):
+        bean_entrance, bean_exit, cooler_exit = await self._doors()
+        assert all([not bean_entrance, not bean_exit])
+        assert cooler_exit
+        await self._set_status(self.ADDR_WRITE_COOLER_EXIT, False)
+
+    async def set_alarm(self, temperature):
+        assert isinstance(temperature, int) and temperature > 0
+        await self._write_word(self.ADDR_ALARM, temperature)
+
+    async def set_servo_position(self, position):
+        assert isinstance(position, (int, float)) and 0 <= position <= 100
+        await self._write_word(self.ADDR_SERVO_POSITION, int(position))
+
+    @property
+    async def pid_reference(self):
+        value = (await self._read_bools(self.ADDR_PID_REFERENCE, 1))[0]
+        return "fire" if value else "bean"
+
+    async def set_pid_reference(self, reference):
+        if reference not in ("bean", "fire"):
+            raise ValueError("'reference' must be 'bean' or 'fire'")
+
+        await self._write_bool(self.ADDR_PID_REFERENCE, reference == "fire")
+
+    @property
+    async def pid_parameters(self):
+        return await self._read_words(self.ADDR_PID_P, 3)
+
+    async def set_pid_parameters(self, p_value, i_value, d_value):
+        assert isinstance(p_value, int)
+        assert isinstance(i_value, int)
+        assert isinstance(d_value, int)
+        await self._write_words(self.ADDR_PID_P, [p_value, i_value, d_value])
+
+    @property
+    async def mode(self):
+        value = (await self._read_bools(self.ADDR_OPERATIONAL_MODE, 1))[0]
+        return "recipe" if value == False else "manual"
+
+    async def set_mode(self, mode):
+        if mode not in ("manual", "recipe"):
+            raise ValueError("'mode' must be 'recipe' or 'manual'")
+
+        await self._write_bool(self.ADDR_OPERATIONAL_MODE, 0 if mode == "recipe" else 1)
+
+    async def _toggle_roast(self):
+        await self._write_bool(self.ADDR_START_ROAST, 0)
+        await self._write_bool(self.ADDR_START_ROAST, 1)
+
+    async def start_roast(self):
+        data = await self.data
+        if data["roasting"]:
+            return
+
+        await self._toggle_roast()
+
+    async def stop_roast(self):
+        data = await self.data
+        if not data["roasting"]:
+            return
+
+        await self._toggle_roast()
+
+    async def restart_roast(self):
+        await self.stop_roast()
+        await self.start_roast()
+
+    async def set_setpoint(self, temperature):
+        assert isinstance(temperature, int) and temperature > 0
+        await self._write_word(self.ADDR_SETPOINT, temperature)
+
+    @property
+    def bean_entrance(self):
+        return self._get_status(self.ADDR_READ_BEAN_ENTRANCE)
+
+    @property
+    def bean_exit(self):
+        return self._get_status(self.ADDR_READ_BEAN_EXIT)
+
+    @property
+    def cooler_exit(self):
+        return self._get_status(self.ADDR_READ_COOLER_EXIT)
+
+    @property
+    def mixer(self):
+        return self._get_status(self.ADDR_MIXER)
+
+    async def set_mixer(self, status):
+        await self._set_status(self.ADDR_MIXER, status)
+
+    @property
+    def cooler(self):
+        return self._get_status(self.ADDR_COOLER)
+
+    async def set_cooler(self, status):
+        await self._set_status(self.ADDR_COOLER, status)
+
+    @property
+    def burner(self):
+        return self._get_status(self.ADDR_BURNER)
+
+    async def set_burner(self, status):
+        await self._set_status(self.ADDR_BURNER, status)
+
+    @property
+    def cylinder(self):
+        return self._get_status(self.ADDR_CYLINDER)
+
+    async def set_cylinder(self, status):
+        if not status:  # prevent the cylinder from burning because not moving
+            await self.set_burner(False)
+
+        await self._set_status(self.ADDR_CYLINDER, status)
+
+    async def clear_recipe(self):
+        await asyncio.gather(
+            self._write_words(self.ADDR_RECIPE_MIN_START, [0] * 30),
+            self._write_words(self.ADDR_RECIPE_SEC_START, [0] * 30),
+            self._write_words(self.ADDR_RECIPE_TEMP_START, [0] * 30),
+        )
+
+    async def upload_recipe(self, points):
+        tables = self._recipe_tables(points)
+        async with self.batch():
+            for start_address, values in tables:
+                await self._write_words(start_address, values)
+        results = await asyncio.gather(
+            *[
+                self._fetch_words(start_address, len(values))
+                for start_address, values in tables
+            ]
+        )
+        for (start_address, values), result in zip(tables, results):
+            if result != values:
+                self._forget()
+                raise RuntimeError(
+                    f"Recipe verification failed at address {start_address}"
+                )
+
+    @property
+    async def data(self):
+        """Get current sensor data (both reads are sent at once)"""
+
+        words, bools = await asyncio.gather(
+            self._read_words(self.ADDR_DATA_WORDS, len(self.DATA_WORDS_HEADER)),
+            self._read_bools(self.ADDR_DATA_BOOLS, len(self.DATA_BOOLS_HEADER)),
+        )
+        return self._decode_data(words, bools)
+
+    async def close(self):
+        """Close modbus connection"""
+
+        await self._master.close()
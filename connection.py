@@ -0,0 +1,147 @@
+import collections
+import socket
+import time
+
+import modbus_tk.defines as cst
+import modbus_tk.modbus_tcp as modbus_tcp
+from modbus_tk.exceptions import ModbusInvalidResponseError
+
+import metrics
+
+
+FUNCTION_NAMES = {
+    cst.READ_COILS: "read_coils",
+    cst.READ_HOLDING_REGISTERS: "read_holding_registers",
+    cst.WRITE_SINGLE_COIL: "write_single_coil",
+    cst.WRITE_SINGLE_REGISTER: "write_single_register",
+    cst.WRITE_MULTIPLE_COILS: "write_multiple_coils",
+    cst.WRITE_MULTIPLE_REGISTERS: "write_multiple_registers",
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of `values` (`fraction` between 0 and 1)"""
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+class ModbusConnection:
+    """Modbus TCP master that survives dropped connections
+
+    Has the same `execute` as `modbus_tk`'s `TcpMaster`. When a request
+    fails because of the network, the socket is closed, reopened and the
+    request is sent again, up to `retries` times per call, waiting between
+    attempts with an exponential backoff bounded by `max_backoff`. The last
+    `window` latencies of each function code are kept for `stats`. The
+    metrics are labelled with the `roaster` name.
+    """
+
+    # Modbus exception responses (`ModbusError`) are answers from the PLC,
+    # so retrying them would not help
+    RETRY_EXCEPTIONS = (OSError, ModbusInvalidResponseError)
+
+    def __init__(
+        self,
+        host,
+        port=502,
+        timeout=5.0,
+        retries=3,
+        backoff=0.05,
+        max_backoff=2.0,
+        keepalive=True,
+        window=1000,
+        roaster=None,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.keepalive = keepalive
+        self.roaster = roaster
+        self.reconnects = 0
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=window)
+        )
+        self._master = None
+
+    def open(self):
+        self._master = modbus_tcp.TcpMaster(self.host, self.port, self.timeout)
+        self._master.open()
+        if self.keepalive:
+            self._set_keepalive(self._master._sock)
+
+    def _set_keepalive(self, sock):
+        """Let the OS detect a dead peer while the roaster loop is idle"""
+
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        options = (
+            ("TCP_KEEPIDLE", 10),
+            ("TCP_KEEPINTVL", 5),
+            ("TCP_KEEPCNT", 3),
+        )
+        for name, value in options:
+            if hasattr(socket, name):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, name), value)
+
+    def close(self):
+        if self._master is not None:
+            self._master.close()
+            self._master = None
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+        if self._master is not None:
+            self._master.set_timeout(timeout)
+
+    def execute(self, slave, function_code, *args, **kwargs):
+        labels = (
+            metrics.roaster_label(self.roaster),
+            FUNCTION_NAMES.get(function_code, function_code),
+            args[0],
+        )
+        attempt, delay = 0, self.backoff
+        while True:
+            start = time.monotonic()
+            try:
+                if self._master is None:
+                    self.open()
+                result = self._master.execute(slave, function_code, *args, **kwargs)
+            except self.RETRY_EXCEPTIONS:
+                self.errors[function_code] += 1
+                metrics.MODBUS_ERRORS.labels(*labels).inc()
+                self.close()
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+                self.reconnects += 1
+                continue
+
+            elapsed = time.monotonic() - start
+            self.latencies[function_code].append(elapsed)
+            metrics.MODBUS_SECONDS.labels(*labels).observe(elapsed)
+            return result
+
+    def stats(self):
+        """Latency percentiles (in seconds) and error count by function"""
+
+        result = {}
+        for function_code in sorted(set(self.latencies) | set(self.errors)):
+            latencies = list(self.latencies[function_code])
+            result[FUNCTION_NAMES.get(function_code, function_code)] = {
+                "count": len(latencies),
+                "errors": self.errors[function_code],
+                "p50": percentile(latencies, 0.50),
+                "p90": percentile(latencies, 0.90),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies) if latencies else None,
+            }
+        return result
@@ -1,13 +1,22 @@
 import time
 
-import utils
+import profiles
 
 
 class Controller:
-    def __init__(self, roaster, setup, logger):
+
+    # How the setup is sampled between its rows (see `profiles.INTERPOLATIONS`)
+    interpolation = "linear"
+    # Filtered temperatures and rate of rise of the roast, set by
+    # `torrador.RoastLogic` (see `signals.RoastSignals`)
+    signals = None
+
+    def __init__(self, roaster, setup, logger, sleep=time.sleep):
         self.roaster = roaster
         self.setup = setup
         self.logger = logger
+        self.sleep = sleep  # a virtual clock's when replaying (see `replay.py`)
+        self.profile = profiles.resample(setup, method=self.interpolation)
 
     def log(self, message):
         self.logger.log(message)
@@ -26,7 +35,7 @@ class ServoPositionController(Controller):
 
     def before_start(self):
         self.log("Reprodução será através do servo motor.")
-        initial = self.setup["00:00:00"]
+        initial = self.setup.initial
         self.roaster.set_servo_position(getattr(initial, self.variable))
 
     def after_start(self):
@@ -35,11 +44,9 @@ class ServoPositionController(Controller):
         self.log("  Torrador no modo manual!")
 
     def step(self, seconds, passed_turning_point):
-        row = utils.get_last_setup_for(
-            self.setup, seconds + self.seconds_ahead, self.variable
-        )
+        value = self.profile.target(seconds, self.variable, self.seconds_ahead)
         self.roaster.set_mode("manual")
-        self.roaster.set_servo_position(getattr(row, self.variable))
+        self.roaster.set_servo_position(value)
 
 
 class TemperatureController(Controller):
@@ -58,7 +65,7 @@ class TemperatureController(Controller):
         self.roaster.set_pid_reference(self.control_type)
         self.log(f"  PID seguindo {self.variable}!")
 
-        initial = self.setup["00:00:00"]
+        initial = self.setup.initial
         self.log(f"Alterando posição inicial do servo para: {initial.servo_position}...")
         temp = getattr(initial, self.variable)
         current_servo_position = self.roaster.data["servo_position"]
@@ -66,7 +73,7 @@ class TemperatureController(Controller):
         self.roaster.set_servo_position(initial.servo_position)
         # For each percent the servo needs to turn, it waits 1 second
         # TODO: use more accurate measure if the servo is in the right position
-        time.sleep(abs(initial.servo_position - current_servo_position))
+        self.sleep(abs(initial.servo_position - current_servo_position))
         self.log("  Posição do servo alterada!")
 
     def after_start(self):
@@ -81,13 +88,12 @@ class BeanTemperatureController(TemperatureController):
     variable = "temp_bean"
 
     def step(self, seconds, passed_turning_point):
-        row = utils.get_last_setup_for(
-            self.setup, seconds + self.seconds_ahead, self.variable
-        )
+        value = self.profile.target(seconds, self.variable, self.seconds_ahead)
+        value = int(round(value))
         self.roaster.set_mode("recipe")
         self.roaster.set_pid_reference(self.control_type)
         if passed_turning_point:
-            self.roaster.set_setpoint(getattr(row, self.variable))
+            self.roaster.set_setpoint(value)
 
 
 class FireTemperatureController(TemperatureController):
@@ -97,12 +103,61 @@ class FireTemperatureController(TemperatureController):
     seconds_ahead = 30
 
     def step(self, seconds, passed_turning_point):
-        row = utils.get_last_setup_for(
-            self.setup, seconds + self.seconds_ahead, self.variable
-        )
+        value = self.profile.target(seconds, self.variable, self.seconds_ahead)
+        value = int(round(value))
         self.roaster.set_mode("recipe")
         self.roaster.set_pid_reference(self.control_type)
-        self.roaster.set_setpoint(getattr(row, self.variable))
+        self.roaster.set_setpoint(value)
+
+
+class RecipeController(TemperatureController):
+    """Upload the setup as a PLC recipe and let the PLC track it
+
+    Each step only supervises: the deviation from the setup is logged
+    when it goes over `tolerance` (and when it's back).
+    """
+
+    tolerance = 15
+    deviating = False
+
+    def before_start(self):
+        super().before_start()
+        points = profiles.recipe_points(
+            self.profile, self.variable, self.seconds_ahead, self.roaster.RECIPE_SIZE
+        )
+        self.log(f"Enviando receita com {len(points)} pontos...")
+        self.roaster.upload_recipe(points)
+        self.log("  Receita enviada e conferida!")
+
+    def step(self, seconds, passed_turning_point):
+        expected = self.profile.target(seconds, self.variable, self.seconds_ahead)
+        current = self.roaster.data[self.variable]
+        if expected is None:
+            return
+        deviating = abs(current - expected) > self.tolerance
+        if deviating != self.deviating:
+            self.deviating = deviating
+            if deviating:
+                self.log(
+                    f"ATENÇÃO: {self.variable} em {current}, "
+                    f"receita em {expected:.0f}"
+                )
+            else:
+                self.log(f"{self.variable} de volta à receita")
+
+
+class BeanRecipeController(RecipeController):
+
+    control_type = "bean"
+    variable = "temp_bean"
+    seconds_ahead = 0
+
+
+class FireRecipeController(RecipeController):
+
+    control_type = "fire"
+    variable = "temp_fire"
+    seconds_ahead = 30
 
 
 def get_controller(name):
@@ -110,4 +165,6 @@ def get_controller(name):
         "bean-temperature": BeanTemperatureController,
         "fire-temperature": FireTemperatureController,
         "servo-position": ServoPositionController,
+        "bean-temperature-recipe": BeanRecipeController,
+        "fire-temperature-recipe": FireRecipeController,
     }[name]
@@ -0,0 +1,106 @@
+import collections
+import time
+
+
+def parse_id(event_id):
+    """Stream ID ("<milliseconds>-<sequence>") as a comparable tuple"""
+
+    milliseconds, _, sequence = str(event_id).partition("-")
+    return int(milliseconds), int(sequence or 0)
+
+
+class History:
+    """Capped log of the messages published during each roast
+
+    IDs are generated by the writer (not by Redis) so they can be put in
+    the message itself before it's published; they are Redis Stream IDs
+    and always increase, even if the clock goes back.
+    """
+
+    def __init__(self):
+        self._last_milliseconds = 0
+        self.roast_id = None
+
+    def next_id(self):
+        milliseconds = max(int(time.time() * 1000), self._last_milliseconds + 1)
+        self._last_milliseconds = milliseconds
+        return f"{milliseconds}-0"
+
+    def start(self, roast_id):
+        self.roast_id = str(roast_id)
+
+    def current_roast(self):
+        return self.roast_id
+
+
+class MemoryHistory(History):
+    """In-process stand-in for `RedisHistory` (for tests and fake runs)"""
+
+    def __init__(self, maxlen=20000):
+        super().__init__()
+        self.maxlen = maxlen
+        self._entries = collections.defaultdict(
+            lambda: collections.deque(maxlen=maxlen)
+        )
+
+    def append(self, event_id, message, pipeline=None):
+        self._entries[self.roast_id].append((event_id, message))
+
+    def range(self, roast_id=None, after=None, count=None):
+        """`(id, message)` pairs of a roast (current one by default)"""
+
+        entries = self._entries.get(roast_id or self.current_roast(), ())
+        if after is not None:
+            after = parse_id(after)
+            entries = [entry for entry in entries if parse_id(entry[0]) > after]
+        return list(entries)[:count]
+
+
+class RedisHistory(History):
+    """History stored in one capped Redis Stream per roast"""
+
+    def __init__(self, redis, prefix, maxlen=20000):
+        super().__init__()
+        self.redis = redis
+        self.prefix = prefix
+        self.maxlen = maxlen
+
+    def key(self, roast_id):
+        return f"{self.prefix}:history:{roast_id}"
+
+    def set_current(self, roast_id, pipeline=None):
+        """Tell the readers which roast is being recorded"""
+
+        (pipeline or self.redis).set(f"{self.prefix}:current", str(roast_id))
+
+    def current_roast(self):
+        """Roast being recorded (set by the writer, read by the monitor)"""
+
+        if self.roast_id is not None:
+            return self.roast_id
+        value = self.redis.get(f"{self.prefix}:current")
+        return value.decode("utf-8") if value is not None else None
+
+    def append(self, event_id, message, pipeline=None):
+        (pipeline or self.redis).xadd(
+            self.key(self.roast_id),
+            {"message": message},
+            id=event_id,
+            maxlen=self.maxlen,
+            approximate=True,
+        )
+
+    def range(self, roast_id=None, after=None, count=None):
+        roast_id = roast_id or self.current_roast()
+        if roast_id is None:
+            return []
+        entries = self.redis.xrange(
+            self.key(roast_id),
+            min="-" if after is None else f"({after}",
+            max="+",
+            count=count,
+        )
+        return [
+            (event_id.decode("utf-8"), fields[b"message"].decode("utf-8"))
+            for event_id, fields in entries
+        ]
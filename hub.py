@@ -0,0 +1,206 @@
+import collections
+import itertools
+import json
+import threading
+import time
+
+from redis.exceptions import RedisError
+
+
+class Client:
+    """Bounded ring buffer of messages waiting to be sent to one viewer
+
+    A viewer that can't keep up loses its oldest messages (counted in
+    `dropped`) instead of slowing down the hub or the other viewers.
+    """
+
+    def __init__(self, size, channel=None):
+        self.channel = channel  # only messages of this channel (all if `None`)
+        self.buffer = collections.deque(maxlen=size)
+        self.dropped = 0
+        self.delivered = 0
+        self.last_id = 0
+        self._condition = threading.Condition()
+
+    def put(self, message):
+        with self._condition:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append(message)
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """Every buffered message (an empty list if `timeout` is reached)"""
+
+        with self._condition:
+            if not self.buffer:
+                self._condition.wait(timeout)
+            messages = list(self.buffer)
+            self.buffer.clear()
+        if messages:
+            self.delivered += len(messages)
+            self.last_id = messages[-1].id
+        return messages
+
+
+Message = collections.namedtuple(
+    "Message", ["id", "event_id", "channel", "data", "event"]
+)
+
+
+def render_event(event_id, channel, data):
+    """Server-sent event with the same content for live and history messages"""
+
+    content = {"id": event_id, "channel": channel, "data": data}
+    return f"id: {event_id}\ndata: {json.dumps(content)}\n\n"
+
+
+class Hub:
+    """One Redis subscription shared by every dashboard viewer
+
+    Each message is decoded and rendered as a server-sent event once, then
+    appended to the ring buffer of every connected client, so the cost of
+    a new viewer is one buffer append per message. The last `size`
+    messages are also kept to answer polling requests and reconnecting
+    viewers (`since`). Besides `channels`, every channel matching one of
+    `patterns` is received (one per roaster, see `supervisor.py`).
+
+    While Redis is down the subscription is retried, waiting longer after
+    each failure (up to `retry_delay[1]` seconds); messages that can't be
+    decoded are skipped (counted in `malformed`).
+    """
+
+    retry_delay = (0.1, 5.0)  # seconds
+
+    def __init__(self, redis, channels, patterns=(), size=256):
+        self.redis = redis
+        self.channels = channels
+        self.patterns = patterns
+        self.size = size
+        self.received = 0
+        self.errors = 0
+        self.malformed = 0
+        self.last_id = 0
+        self.recent = collections.deque(maxlen=size)
+        self.received_by_channel = collections.Counter()
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _subscribe(self):
+        subscription = self.redis.pubsub(ignore_subscribe_messages=True)
+        if self.channels:
+            subscription.subscribe(*self.channels)
+        if self.patterns:
+            subscription.psubscribe(*self.patterns)
+        return subscription
+
+    def _run(self):
+        delay = self.retry_delay[0]
+        while True:
+            subscription = None
+            try:
+                subscription = self._subscribe()
+                delay = self.retry_delay[0]
+                while True:
+                    content = subscription.get_message(timeout=1.0)
+                    if content is not None:
+                        self._receive(content)
+            except RedisError:
+                self.errors += 1
+                if subscription is not None:
+                    try:
+                        subscription.close()
+                    except RedisError:
+                        pass
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_delay[1])
+
+    def _receive(self, content):
+        try:
+            self.publish(content["channel"].decode("utf-8"), content["data"])
+        except ValueError:  # also `UnicodeDecodeError`
+            self.malformed += 1
+
+    def publish(self, channel, data):
+        """Fan a raw (JSON) message out to every client
+
+        Raises `ValueError` if `data` isn't a JSON object.
+        """
+
+        data = json.loads(data)
+        if not isinstance(data, dict):
+            raise ValueError(f"Not a JSON object: {data!r}")
+        message_id = next(self._ids)
+        # Messages recorded in the history carry their own (stream) ID
+        event_id = data.get("id", message_id)
+        event = render_event(event_id, channel, data)
+        message = Message(message_id, event_id, channel, data, event)
+        with self._lock:
+            self.received += 1
+            self.received_by_channel[channel] += 1
+            self.last_id = message_id
+            self.recent.append(message)
+            clients = list(self._clients)
+        for client in clients:
+            if client.channel is None or client.channel == channel:
+                client.put(message)
+
+    def connect(self, since=None, channel=None):
+        """Register a new viewer, queueing what it missed after `since`"""
+
+        client = Client(self.size, channel)
+        with self._lock:
+            if since is not None and since > self.last_id:  # hub was restarted
+                since = None
+            client.last_id = self.last_id if since is None else since
+            if since is not None:
+                for message in self._since(since, channel):
+                    client.put(message)
+            self._clients.add(client)
+        return client
+
+    def disconnect(self, client):
+        with self._lock:
+            self._clients.discard(client)
+
+    def _since(self, message_id, channel=None):
+        return [
+            message
+            for message in self.recent
+            if message.id > message_id and channel in (None, message.channel)
+        ]
+
+    def since(self, message_id, channel=None):
+        with self._lock:
+            return self._since(message_id, channel)
+
+    @property
+    def stats(self):
+        with self._lock:
+            clients = list(self._clients)
+        return {
+            "clients": len(clients),
+            "received": self.received,
+            "errors": self.errors,
+            "malformed": self.malformed,
+            "last_id": self.last_id,
+            "channels": dict(self.received_by_channel),
+            "max_lag": max((self.last_id - c.last_id for c in clients), default=0),
+            "dropped": sum(client.dropped for client in clients),
+            "viewers": [
+                {
+                    "channel": client.channel,
+                    "lag": self.last_id - client.last_id,
+                    "queued": len(client.buffer),
+                    "delivered": client.delivered,
+                    "dropped": client.dropped,
+                }
+                for client in clients
+            ],
+        }
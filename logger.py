@@ -1,21 +1,207 @@
+import collections
 import datetime
+import functools
 import json
+import threading
+import time
 
 from redis import Redis
+from redis.exceptions import RedisError
 
+import metrics
 import utils
+from history import RedisHistory
+
+
+class Publisher:
+    """Publish to a Redis channel from a background thread
+
+    Messages wait in a queue of at most `max_queue` items and are sent in
+    pipelined batches of up to `batch_size`, so a slow or restarting Redis
+    never blocks the caller. `policy` decides what is lost when Redis can't
+    keep up: "drop_oldest" or "drop_newest" drop a message when the queue
+    is full; "coalesce" also makes a new data message replace the queued
+    one that was not sent yet (only the latest telemetry matters to the
+    dashboards) and drops the oldest message when the queue is full.
+
+    With a `history`, each message is also appended to it in the same
+    pipeline; coalescing then only skips publishing the older data message,
+    which is still recorded. Other commands go in the queue too (see
+    `call`).
+    """
+
+    POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+
+    def __init__(
+        self,
+        redis,
+        channel,
+        max_queue=1000,
+        policy="coalesce",
+        batch_size=100,
+        history=None,
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"'policy' must be one of {self.POLICIES}")
+        self.redis = redis
+        self.channel = channel
+        self.max_queue = max_queue
+        self.policy = policy
+        self.batch_size = batch_size
+        self.history = history
+        self.published = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._queue = collections.deque()
+        self._last_data = None  # queued data message, replaced when coalescing
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def publish(self, message, message_type="text", event_id=None):
+        with self._condition:
+            if self.policy == "coalesce" and message_type == "data":
+                if self._last_data is not None:
+                    self.coalesced += 1
+                    if self.history is None:
+                        self._last_data[1] = message
+                        return
+                    self._last_data[2] = False  # record it, but don't publish
+            if len(self._queue) >= self.max_queue:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return
+                dropped = self._queue.popleft()
+                if dropped is self._last_data:
+                    self._last_data = None
+                self.dropped += 1
+            item = [message_type, message, True, event_id]
+            self._queue.append(item)
+            if message_type == "data":
+                self._last_data = item
+            self._condition.notify()
+
+    def call(self, command):
+        """Run `command(pipeline)` in the background, in order with the
+        messages (it's lost, like them, if Redis fails)"""
+
+        self.publish(command, message_type="command")
+
+    def _take_batch(self):
+        with self._condition:
+            while not self._queue and not self._stopped:
+                self._condition.wait()
+            batch = [
+                self._queue.popleft()
+                for _ in range(min(self.batch_size, len(self._queue)))
+            ]
+            if any(item is self._last_data for item in batch):
+                self._last_data = None
+            return batch
+
+    def _run(self):
+        delay = 0.1
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return  # stopped and drained
+            pipeline = self.redis.pipeline(transaction=False)
+            published = 0
+            for message_type, message, publish, event_id in batch:
+                if message_type == "command":
+                    message(pipeline)
+                    continue
+                elif publish:
+                    pipeline.publish(self.channel, message)
+                    published += 1
+                if self.history is not None and event_id is not None:
+                    self.history.append(event_id, message, pipeline=pipeline)
+            try:
+                pipeline.execute()
+            except RedisError:
+                self.errors += 1
+                self.dropped += published
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
+            else:
+                self.published += published
+                delay = 0.1
+
+    @property
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "published": self.published,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+        }
+
+    def close(self, timeout=5):
+        """Send what is still queued (waiting up to `timeout` seconds)"""
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout)
 
 
 class Logger:
 
-    def __init__(self, redis_host=None, redis_port=None, redis_db=None, redis_channel=None):
-        if any((redis_host, redis_port, redis_db)):
-            self.redis = Redis(redis_host, redis_port, db=redis_db)
+    def __init__(
+        self,
+        redis_host=None,
+        redis_port=None,
+        redis_db=None,
+        redis_channel=None,
+        max_queue=1000,
+        queue_policy="coalesce",
+        history_size=None,
+        redis=None,
+        name=None,
+    ):
+        # `redis` is a client shared with other loggers (see `supervisor.py`)
+        # and `name` prefixes the printed messages (and labels the metrics)
+        # of this roaster
+        self.name = name
+        self.history = None
+        if redis is not None or any((redis_host, redis_port, redis_db)):
+            self.redis = redis or Redis(redis_host, redis_port, db=redis_db)
             self.redis_channel = redis_channel
+            if history_size:
+                self.history = RedisHistory(
+                    self.redis, redis_channel, maxlen=history_size
+                )
+            self.publisher = Publisher(
+                self.redis,
+                redis_channel,
+                max_queue=max_queue,
+                policy=queue_policy,
+                history=self.history,
+            )
         else:
             self.redis = None
+            self.publisher = None
+
+    def start_roast(self, roast_id):
+        """Record the next messages in the history of `roast_id`"""
+
+        if self.history is not None:
+            self.history.start(roast_id)
+            # Saved by the publisher: a Redis that is down doesn't keep the
+            # roast from starting
+            self.publisher.call(
+                functools.partial(self.history.set_current, self.history.roast_id)
+            )
 
     def log(self, content, message_type="text"):
+        labels = (metrics.roaster_label(self.name), message_type)
+        with metrics.PUBLISH_SECONDS.labels(*labels).time():
+            self._log(content, message_type)
+
+    def _log(self, content, message_type):
         timestamp = datetime.datetime.now().isoformat().split(".")[0]
         if self.redis:
             data = {
@@ -26,10 +212,15 @@ class Logger:
                 data.update(content)
             else:
                 data["message"] = str(content)
-            self.redis.publish(self.redis_channel, json.dumps(data))
+            event_id = None
+            if self.history is not None and self.history.roast_id is not None:
+                event_id = data["id"] = self.history.next_id()
+            self.publisher.publish(json.dumps(data), message_type, event_id)
 
         if message_type == "text":
-            print(f"[{timestamp}] {content}")
+            name = f" [{self.name}]" if self.name else ""
+            # One write per line, so lines of other roasters don't interleave
+            print(f"[{timestamp}]{name} {content}\n", end="")
 
     def log_stats(self, data, setup, turning_point_temp):
         seconds = data["roast_time"]
@@ -39,11 +230,9 @@ class Logger:
         grao = data["temp_bean"]
         set_point = data["temp_goal"]
         posicao_servo = data["servo_position"]
-        setup_data = setup.get(pretty_time)
-        if not setup_data:
-            setup_data = setup.get(utils.pretty_seconds(seconds - 1))
-        if not setup_data:
-            setup_data = setup.get(utils.pretty_seconds(seconds + 1))
+        setup_data = (
+            setup.get(seconds) or setup.get(seconds - 1) or setup.get(seconds + 1)
+        )
         temperatura_setup = setup_data.temp_bean if setup_data else 0
         ar_setup = setup_data.temp_air if setup_data else 0
         posicao_setup = setup_data.servo_position if setup_data else 0
@@ -51,8 +240,20 @@ class Logger:
         self.log(
             f"{pretty_time} "
             f"GRAO: {grao:3d} (s: {temperatura_setup:3d}) "
+            f"RoR: {data.get('ror_bean', 0):5.1f} "
             f"AR: {ar:3d} (s: {ar_setup:3d}) "
             f"FORNO: {forno:04d} (s: {forno_setup:04d}) "
             f"TP: {turning_point_temp:04d} "
             f"SV: {posicao_servo:5.2f} (s: {posicao_setup:5.2f})"
         )
+
+    def close(self):
+        if self.publisher is not None:
+            self.publisher.close()
+            stats = self.publisher.stats
+            name = f" ({self.name})" if self.name else ""
+            print(
+                f"Redis{name}: {stats['published']} publicadas, "
+                f"{stats['dropped']} descartadas, "
+                f"{stats['coalesced']} agrupadas, {stats['errors']} erros"
+            )
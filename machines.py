@@ -1,7 +1,154 @@
-﻿import time
+﻿import contextlib
+import dataclasses
+import time
 
 import modbus_tk.defines as cst
-import modbus_tk.modbus_tcp as modbus_tcp
+
+import metrics
+from connection import ModbusConnection
+
+
+def plan_reads(addresses, max_gap=0, max_quantity=125):
+    """Group addresses into the fewest contiguous `(start, quantity)` reads
+
+    Two addresses share a read when at most `max_gap` unused addresses lie
+    between them and the read does not exceed `max_quantity` values.
+    """
+
+    reads = []
+    for address in sorted(set(addresses)):
+        if reads:
+            start, quantity = reads[-1]
+            gap = address - (start + quantity)
+            if gap <= max_gap and address - start < max_quantity:
+                reads[-1] = (start, address - start + 1)
+                continue
+        reads.append((address, 1))
+    return reads
+
+
+class BatchWriteError(Exception):
+    """Writes queued by `CarmoMaq10.batch` failed to reach the roaster"""
+
+
+@dataclasses.dataclass
+class RoasterState:
+    """Everything the roaster exposes, decoded from a single snapshot"""
+
+    bean_entrance: bool
+    bean_exit: bool
+    cooler_exit: bool
+    mixer: bool
+    cooler: bool
+    burner: bool
+    cylinder: bool
+    mode: str
+    pid_reference: str
+    pid_parameters: list
+    data: dict
+    timestamp: float = dataclasses.field(default_factory=time.time)
+
+
+class RegisterCache:
+    """Values read from (or written to) the roaster, valid for `ttl` seconds"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._values = {cst.COILS: {}, cst.HOLDING_REGISTERS: {}}
+
+    def get(self, block_type, start_address, quantity):
+        """Cached values or `None` if any of them is missing or expired"""
+
+        now = time.monotonic()
+        cached = self._values[block_type]
+        values = []
+        for address in range(start_address, start_address + quantity):
+            entry = cached.get(address)
+            if entry is None or now - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            values.append(entry[0])
+        self.hits += 1
+        return values
+
+    def update(self, block_type, start_address, values):
+        now = time.monotonic()
+        cached = self._values[block_type]
+        for address, value in enumerate(values, start=start_address):
+            cached[address] = (value, now)
+
+    def invalidate(self, block_type, addresses):
+        cached = self._values[block_type]
+        for address in addresses:
+            cached.pop(address, None)
+
+    def clear(self):
+        for cached in self._values.values():
+            cached.clear()
+
+    @property
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class ShadowRegisters:
+    """Last value written to (or read from) each address of the roaster
+
+    Used to skip writes that would not change anything. Values read are
+    also kept, so a change made on the touch screen is noticed. With
+    `refresh` (in seconds), a value older than that is written again
+    anyway, in case the PLC changed it without us reading it back.
+    """
+
+    def __init__(self, refresh=None, roaster=None):
+        self.refresh = refresh
+        self.writes_elided = metrics.WRITES_ELIDED.labels(
+            metrics.roaster_label(roaster)
+        )
+        self.checked = 0
+        self.elided = 0
+        self._values = {cst.COILS: {}, cst.HOLDING_REGISTERS: {}}
+
+    def unchanged(self, block_type, start_address, values):
+        """Whether the roaster already has `values` (counts the elided)"""
+
+        self.checked += 1
+        now = time.monotonic()
+        known = self._values[block_type]
+        for address, value in enumerate(values, start=start_address):
+            entry = known.get(address)
+            if entry is None or entry[0] != value:
+                return False
+            elif self.refresh is not None and now - entry[1] > self.refresh:
+                return False
+        self.elided += 1
+        self.writes_elided.inc()
+        return True
+
+    def update(self, block_type, start_address, values):
+        now = time.monotonic()
+        known = self._values[block_type]
+        for address, value in enumerate(values, start=start_address):
+            known[address] = (value, now)
+
+    def clear(self):
+        for known in self._values.values():
+            known.clear()
+
+    @property
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "elided": self.elided,
+            "elided_ratio": self.elided / self.checked if self.checked else 0.0,
+        }
 
 
 class CarmoMaq10:
@@ -33,52 +180,424 @@ class CarmoMaq10:
     ADDR_SETPOINT = 8003
     ADDR_START_ROAST = 49998
     ADDR_PID_REFERENCE = 55556
+    ADDR_DATA_WORDS = 8000
+    ADDR_DATA_BOOLS = 49990
+    ADDR_ROASTING = 49999
+    ADDR_DATA_SERVO_POSITION = 8011
+    RECIPE_SIZE = 30
     automatic = True
 
-    def __init__(self, host="192.168.0.10", port=502):
+    # Every address read by the properties, as (block type, start, quantity).
+    # `snapshot` plans the fewest contiguous reads covering all of them.
+    REGISTER_MAP = (
+        (cst.COILS, ADDR_READ_BEAN_ENTRANCE, 1),
+        (cst.COILS, ADDR_READ_BEAN_EXIT, 1),
+        (cst.COILS, ADDR_READ_COOLER_EXIT, 1),
+        (cst.COILS, ADDR_CYLINDER, 1),
+        (cst.COILS, ADDR_COOLER, 1),
+        (cst.COILS, ADDR_MIXER, 1),
+        (cst.COILS, ADDR_BURNER, 1),
+        (cst.COILS, ADDR_OPERATIONAL_MODE, 1),
+        (cst.COILS, ADDR_PID_REFERENCE, 1),
+        (cst.COILS, ADDR_DATA_BOOLS, 10),
+        (cst.HOLDING_REGISTERS, ADDR_DATA_WORDS, 12),
+        (cst.HOLDING_REGISTERS, ADDR_PID_P, 3),
+    )
+    # Reading a few unused addresses is cheaper than another round trip
+    MAX_READ_GAP = {cst.COILS: 32, cst.HOLDING_REGISTERS: 8}
+    MAX_READ_QUANTITY = {cst.COILS: 2000, cst.HOLDING_REGISTERS: 125}
+    MAX_WRITE_QUANTITY = {cst.COILS: 1968, cst.HOLDING_REGISTERS: 123}
+    # Function used to write one or many values, by block type
+    WRITE_FUNCTIONS = {
+        cst.COILS: (cst.WRITE_SINGLE_COIL, cst.WRITE_MULTIPLE_COILS),
+        cst.HOLDING_REGISTERS: (
+            cst.WRITE_SINGLE_REGISTER,
+            cst.WRITE_MULTIPLE_REGISTERS,
+        ),
+    }
+    # Addresses whose value the PLC changes as a consequence of a write, so
+    # they must be read again instead of being served from the cache
+    WRITE_SIDE_EFFECTS = {
+        (cst.COILS, ADDR_WRITE_BEAN_ENTRANCE): (
+            cst.COILS,
+            ADDR_READ_BEAN_ENTRANCE,
+        ),
+        (cst.COILS, ADDR_WRITE_BEAN_EXIT): (cst.COILS, ADDR_READ_BEAN_EXIT),
+        (cst.COILS, ADDR_WRITE_COOLER_EXIT): (cst.COILS, ADDR_READ_COOLER_EXIT),
+        (cst.COILS, ADDR_START_ROAST): (cst.COILS, ADDR_ROASTING),
+        (cst.HOLDING_REGISTERS, ADDR_SERVO_POSITION): (
+            cst.HOLDING_REGISTERS,
+            ADDR_DATA_SERVO_POSITION,
+        ),
+    }
+    # Commands always sent, even if the last value written is the same: the
+    # roast start is a pulse and the doors may be moved from the touch screen
+    UNSHADOWED_WRITES = {
+        (cst.COILS, ADDR_START_ROAST),
+        (cst.COILS, ADDR_WRITE_BEAN_ENTRANCE),
+        (cst.COILS, ADDR_WRITE_BEAN_EXIT),
+        (cst.COILS, ADDR_WRITE_COOLER_EXIT),
+    }
+    # Interlocks are sent right away even inside `batch`, so a failure raises
+    # `BatchWriteError` from the call itself (where it's handled) instead of
+    # at the end of the block
+    UNBATCHED_WRITES = {
+        (cst.COILS, ADDR_WRITE_BEAN_ENTRANCE),
+        (cst.COILS, ADDR_WRITE_BEAN_EXIT),
+        (cst.COILS, ADDR_WRITE_COOLER_EXIT),
+        (cst.COILS, ADDR_BURNER),
+    }
+
+    def __init__(
+        self,
+        host="192.168.0.10",
+        port=502,
+        cache_ttl=None,
+        shadow=False,
+        shadow_refresh=None,
+        name=None,
+    ):
+        # `name` labels the metrics of this roaster (see `metrics.py`)
         self.host = host
         self.port = port
+        self.name = name
+        self.cache = RegisterCache(cache_ttl) if cache_ttl else None
+        self.shadow = ShadowRegisters(shadow_refresh, name) if shadow else None
+        self.decode_seconds = metrics.DECODE_SECONDS.labels(
+            metrics.roaster_label(name)
+        )
+        self._held = None
+        self._batch = None  # {(block type, address): value} while batching
+        self._reads = self._plan_snapshot()
+
+    @classmethod
+    def _plan_snapshot(cls):
+        """Plan the reads needed to cover `REGISTER_MAP`"""
+
+        addresses = {cst.COILS: [], cst.HOLDING_REGISTERS: []}
+        for block_type, start_address, quantity in cls.REGISTER_MAP:
+            addresses[block_type].extend(
+                range(start_address, start_address + quantity)
+            )
+        return [
+            (block_type, start_address, quantity)
+            for block_type, block_addresses in addresses.items()
+            for start_address, quantity in plan_reads(
+                block_addresses,
+                max_gap=cls.MAX_READ_GAP[block_type],
+                max_quantity=cls.MAX_READ_QUANTITY[block_type],
+            )
+        ]
+
+    def connect(self, timeout=5.0, retries=3):
+        """Start the modbus connection with the roaster
+
+        Requests failing because of the network are retried up to `retries`
+        times, reconnecting before each new attempt.
+        """
+
+        self._master = ModbusConnection(
+            self.host, self.port, timeout=timeout, retries=retries, roaster=self.name
+        )
+        self._master.open()
+
+    @property
+    def link_stats(self):
+        """Latency percentiles and errors of the modbus link, by function"""
 
-    def connect(self, timeout=5.0):
-        """Start the modbus connection with the roaster"""
+        return self._master.stats()
+
+    def _fetch_bools(self, start_address, quantity):
+        """Read consecutive boolean values from the roaster"""
+
+        result = self._master.execute(1, cst.READ_COILS, start_address, quantity,)
+        values = [True if value == 1 else False for value in result]
+        self._fetched(cst.COILS, start_address, values)
+        return values
 
-        self._master = modbus_tcp.TcpMaster(self.host, self.port)
-        self._master.set_timeout(timeout)
+    def _fetch_words(self, start_address, quantity):
+        """Read consecutive word values from the roaster"""
+
+        values = list(
+            self._master.execute(
+                1, cst.READ_HOLDING_REGISTERS, start_address, quantity,
+            )
+        )
+        self._fetched(cst.HOLDING_REGISTERS, start_address, values)
+        return values
+
+    def _fetched(self, block_type, start_address, values):
+        """Remember values just read from the roaster"""
+
+        if self.cache is not None:
+            self.cache.update(block_type, start_address, values)
+        if self.shadow is not None:
+            self.shadow.update(block_type, start_address, values)
+
+    def _held_values(self, block_type, start_address, quantity):
+        """Values from the held snapshot (`None` if any of them is missing)"""
+
+        if self._held is None:
+            return None
+        values = self._held[block_type]
+        try:
+            return [
+                values[address]
+                for address in range(start_address, start_address + quantity)
+            ]
+        except KeyError:
+            return None
+
+    def _cached_values(self, block_type, start_address, quantity):
+        """Values from the held snapshot or the cache (`None` if missing)"""
+
+        values = self._held_values(block_type, start_address, quantity)
+        if values is None and self.cache is not None:
+            values = self.cache.get(block_type, start_address, quantity)
+        return values
+
+    def _unchanged(self, block_type, start_address, values):
+        """Whether a write can be skipped (the roaster already has `values`)"""
+
+        if self.shadow is None:
+            return False
+        elif (block_type, start_address) in self.UNSHADOWED_WRITES:
+            return False
+        return self.shadow.unchanged(block_type, start_address, values)
+
+    def _queue_write(self, block_type, start_address, values):
+        """Queue a write to be sent with the batch (`False` if not batching)"""
+
+        if self._batch is None:
+            return False
+        elif (block_type, start_address) in self.UNBATCHED_WRITES:
+            # What was queued before must reach the roaster first, then this
+            # write is sent alone (failing like any batch)
+            self._flush_batch()
+            self._enqueue(block_type, start_address, values)
+            self._flush_batch()
+            return True
+        if self._queued(block_type, start_address, len(values)):
+            # Writing the same address again (like a pulse): the previous
+            # value must reach the roaster first
+            self._flush_batch()
+        self._enqueue(block_type, start_address, values)
+        return True
+
+    def _queued(self, block_type, start_address, quantity):
+        return any(
+            (block_type, address) in self._batch
+            for address in range(start_address, start_address + quantity)
+        )
+
+    def _enqueue(self, block_type, start_address, values):
+        for address, value in enumerate(values, start=start_address):
+            self._batch[(block_type, address)] = value
+        self._written(block_type, start_address, values)
+
+    def _plan_writes(self):
+        """Merge the queued writes into the fewest requests
+
+        Returns `(function code, start address, value or values)` with
+        contiguous addresses of the same block type in one request; the
+        requests are in the order their first value was queued.
+        """
+
+        pending, self._batch = self._batch, {}
+        order = {key: index for index, key in enumerate(pending)}
+        requests = []
+        for block_type, (single, multiple) in self.WRITE_FUNCTIONS.items():
+            addresses = [address for kind, address in pending if kind == block_type]
+            runs = plan_reads(
+                addresses, max_quantity=self.MAX_WRITE_QUANTITY[block_type]
+            )
+            for start_address, quantity in runs:
+                keys = [
+                    (block_type, address)
+                    for address in range(start_address, start_address + quantity)
+                ]
+                values = [pending[key] for key in keys]
+                if block_type == cst.COILS:
+                    values = [1 if value else 0 for value in values]
+                if quantity == 1:
+                    request = (single, start_address, values[0])
+                else:
+                    request = (multiple, start_address, values)
+                requests.append((min(order[key] for key in keys), request))
+        return [request for _, request in sorted(requests)]
+
+    def _flush_batch(self):
+        try:
+            for function_code, start_address, output_value in self._plan_writes():
+                self._master.execute(
+                    1, function_code, start_address, output_value=output_value
+                )
+        except Exception as exception:
+            self._forget()
+            raise BatchWriteError(repr(exception)) from exception
+
+    def _forget(self):
+        """Drop what is known about the roaster (after a failed batch)"""
+
+        if self.shadow is not None:
+            self.shadow.clear()
+        if self.cache is not None:
+            self.cache.clear()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Send the writes made inside the block together when it ends
+
+        Writes to contiguous addresses are merged into one request
+        (`WRITE_MULTIPLE_COILS`/`WRITE_MULTIPLE_REGISTERS`). Requests go out
+        in the order of their first write, but writes to different
+        addresses of the same request arrive at once; a write to an address
+        already queued sends the batch so far first, and one of
+        `UNBATCHED_WRITES` is sent right after it. Held and cached values are
+        updated as each write is queued, as if it had been sent.
+
+        Sending the batch (at the end of the block or for an unbatched
+        write) may raise `BatchWriteError`; what was known about the roaster
+        is then dropped, as some of the writes may not have arrived.
+        """
+
+        if self._batch is not None:  # already batching
+            yield
+            return
+        self._batch = {}
+        try:
+            yield
+        finally:
+            try:
+                self._flush_batch()
+            finally:
+                self._batch = None
+
+    def _written(self, block_type, start_address, values):
+        """Keep held and cached values consistent with a value just written
+
+        Only the addresses written are updated; the ones in
+        `WRITE_SIDE_EFFECTS` are dropped from the cache (read again next
+        time) but stay as they are in a held snapshot.
+        """
+
+        if self._held is not None:
+            held = self._held[block_type]
+            for address, value in enumerate(values, start=start_address):
+                if address in held:
+                    held[address] = value
+        if self.shadow is not None:
+            self.shadow.update(block_type, start_address, values)
+        if self.cache is not None:
+            self.cache.update(block_type, start_address, values)
+            for address in range(start_address, start_address + len(values)):
+                affected = self.WRITE_SIDE_EFFECTS.get((block_type, address))
+                if affected is not None:
+                    self.cache.invalidate(affected[0], [affected[1]])
 
     def _read_bools(self, start_address, quantity):
         """Read consecutive boolean values"""
 
-        result = self._master.execute(1, cst.READ_COILS, start_address, quantity,)
-        return [True if value == 1 else False for value in result]
+        values = self._cached_values(cst.COILS, start_address, quantity)
+        if values is None:
+            values = self._fetch_bools(start_address, quantity)
+        return values
 
     def _read_words(self, start_address, quantity):
         """Read consecutive word values"""
 
-        return self._master.execute(
-            1, cst.READ_HOLDING_REGISTERS, start_address, quantity,
-        )
+        values = self._cached_values(cst.HOLDING_REGISTERS, start_address, quantity)
+        if values is None:
+            values = self._fetch_words(start_address, quantity)
+        return values
 
     def _write_bool(self, coil_address, value):
         """Write a single bool value to a specific address"""
 
         assert value in (0, 1)
+        if self._unchanged(cst.COILS, coil_address, [bool(value)]):
+            return
+        elif self._queue_write(cst.COILS, coil_address, [bool(value)]):
+            return
         self._master.execute(
             1, cst.WRITE_SINGLE_COIL, coil_address, output_value=value,
         )
+        self._written(cst.COILS, coil_address, [bool(value)])
 
     def _write_word(self, register_address, value):
         """Write a single word value to a specific address"""
 
+        if self._unchanged(cst.HOLDING_REGISTERS, register_address, [value]):
+            return
+        elif self._queue_write(cst.HOLDING_REGISTERS, register_address, [value]):
+            return
         self._master.execute(
             1, cst.WRITE_SINGLE_REGISTER, register_address, output_value=value
         )
+        self._written(cst.HOLDING_REGISTERS, register_address, [value])
 
     def _write_words(self, start_address, values):
         """Write consecutive word values to consecutive addresses"""
 
+        if self._unchanged(cst.HOLDING_REGISTERS, start_address, values):
+            return
+        elif self._queue_write(cst.HOLDING_REGISTERS, start_address, values):
+            return
         self._master.execute(
             1, cst.WRITE_MULTIPLE_REGISTERS, start_address, output_value=values,
         )
+        self._written(cst.HOLDING_REGISTERS, start_address, values)
+
+    def _fetch_snapshot(self):
+        """Run the planned reads and return the raw values by block type"""
+
+        values = {cst.COILS: {}, cst.HOLDING_REGISTERS: {}}
+        for block_type, start_address, quantity in self._reads:
+            if block_type == cst.COILS:
+                result = self._fetch_bools(start_address, quantity)
+            else:
+                result = self._fetch_words(start_address, quantity)
+            values[block_type].update(enumerate(result, start=start_address))
+        return values
+
+    def _decode_state(self):
+        """Decode a `RoasterState` from the properties (served by `_held`)"""
+
+        return RoasterState(
+            **{
+                field.name: getattr(self, field.name)
+                for field in dataclasses.fields(RoasterState)
+                if field.name != "timestamp"
+            }
+        )
+
+    def snapshot(self):
+        """Read every known address in the fewest round trips"""
+
+        previous, self._held = self._held, self._fetch_snapshot()
+        try:
+            return self._decode_state()
+        finally:
+            self._held = previous
+
+    @contextlib.contextmanager
+    def hold(self):
+        """Serve every read inside the block from a single snapshot
+
+        Writes made inside the block update the held values of the
+        addresses written (like the burner), so reading them back gives
+        what was just sent. Addresses the PLC changes as a consequence of a
+        write (`WRITE_SIDE_EFFECTS`, like the door sensors after a door
+        command) keep their snapshot value until the next snapshot: the
+        pistons take seconds to move, so the interlock checks see where the
+        doors really are.
+        """
+
+        previous, self._held = self._held, self._fetch_snapshot()
+        try:
+            yield self._decode_state()
+        finally:
+            self._held = previous
 
     def _get_status(self, address):
         """Get value and convert to bool (useful for toggle options)"""
@@ -172,9 +691,8 @@ class CarmoMaq10:
         assert isinstance(p_value, int)
         assert isinstance(i_value, int)
         assert isinstance(d_value, int)
-        self._write_word(self.ADDR_PID_P, p_value)
-        self._write_word(self.ADDR_PID_I, i_value)
-        self._write_word(self.ADDR_PID_D, d_value)
+        # P, I and D are contiguous: one request
+        self._write_words(self.ADDR_PID_P, [p_value, i_value, d_value])
 
     @property
     def mode(self):
@@ -248,45 +766,86 @@ class CarmoMaq10:
 
     def clear_recipe(self):
         # TODO: add property to get current value
-        self._write_words(self.ADDR_RECIPE_MIN_START, [0] * 30)
-        self._write_words(self.ADDR_RECIPE_SEC_START, [0] * 30)
-        self._write_words(self.ADDR_RECIPE_TEMP_START, [0] * 30)
-
-    @property
-    def data(self):
-        """Get current sensor data"""
-
-        # TODO: refactor
-        header_1 = (
-            "temp_bean",
-            "temp_air",
-            "temp_fire",
-            "temp_goal",
-            "_",
-            "_",
-            "roast_time",
-            "roast_minutes",
-            "roast_seconds",
-            "_",
-            "temp_cooler",
-            "servo_position",
-        )
-        response_1 = self._read_words(8000, 12)
-        header_2 = (
-            "_",
-            "powered",
-            "_",
-            "_",
-            "_",
-            "burner",
-            "_",
-            "_",
-            "_",
-            "roasting",
+        with self.batch():
+            self._write_words(self.ADDR_RECIPE_MIN_START, [0] * 30)
+            self._write_words(self.ADDR_RECIPE_SEC_START, [0] * 30)
+            self._write_words(self.ADDR_RECIPE_TEMP_START, [0] * 30)
+
+    def _recipe_tables(self, points):
+        """Minutes, seconds and temperature tables of `(seconds, temperature)`
+        points, as `(start address, values)` (unused slots are zeroed)"""
+
+        if len(points) > self.RECIPE_SIZE:
+            raise ValueError(f"A recipe has at most {self.RECIPE_SIZE} points")
+        padding = [0] * (self.RECIPE_SIZE - len(points))
+        return (
+            (
+                self.ADDR_RECIPE_MIN_START,
+                [int(seconds) // 60 for seconds, _ in points] + padding,
+            ),
+            (
+                self.ADDR_RECIPE_SEC_START,
+                [int(seconds) % 60 for seconds, _ in points] + padding,
+            ),
+            (
+                self.ADDR_RECIPE_TEMP_START,
+                [int(temperature) for _, temperature in points] + padding,
+            ),
         )
-        response_2 = self._read_bools(49990, 10)
-        data = dict(zip(header_1, response_1))
-        data.update(dict(zip(header_2, response_2)))
+
+    def upload_recipe(self, points):
+        """Write a recipe (`(seconds, temperature)` points, see
+        `profiles.recipe_points`) and read it back to verify
+
+        The PLC follows the recipe by itself in the "recipe" mode, so the
+        host doesn't need to send a setpoint every second.
+        """
+
+        tables = self._recipe_tables(points)
+        with self.batch():  # minutes and temperatures are contiguous
+            for start_address, values in tables:
+                self._write_words(start_address, values)
+        for start_address, values in tables:
+            # Straight from the roaster: not from the cache or a snapshot
+            if self._fetch_words(start_address, len(values)) != values:
+                self._forget()
+                raise RuntimeError(
+                    f"Recipe verification failed at address {start_address}"
+                )
+
+    DATA_WORDS_HEADER = (
+        "temp_bean",
+        "temp_air",
+        "temp_fire",
+        "temp_goal",
+        "_",
+        "_",
+        "roast_time",
+        "roast_minutes",
+        "roast_seconds",
+        "_",
+        "temp_cooler",
+        "servo_position",
+    )
+    DATA_BOOLS_HEADER = (
+        "_",
+        "powered",
+        "_",
+        "_",
+        "_",
+        "burner",
+        "_",
+        "_",
+        "_",
+        "roasting",
+    )
+
+    @classmethod
+    def _decode_data(cls, words, bools):
+        """Convert the raw sensor words and bools into the `data` dict"""
+
+        data = dict(zip(cls.DATA_WORDS_HEADER, words))
+        data.update(dict(zip(cls.DATA_BOOLS_HEADER, bools)))
         del data["roast_minutes"]
         del data["roast_seconds"]
         del data["_"]
@@ -295,6 +854,15 @@ class CarmoMaq10:
         data["roasting"] = True if data["roasting"] == 1 else False
         return data
 
+    @property
+    def data(self):
+        """Get current sensor data"""
+
+        words = self._read_words(self.ADDR_DATA_WORDS, len(self.DATA_WORDS_HEADER))
+        bools = self._read_bools(self.ADDR_DATA_BOOLS, len(self.DATA_BOOLS_HEADER))
+        with self.decode_seconds.time():
+            return self._decode_data(words, bools)
+
     def close(self):
         """Close modbus connection"""
 
@@ -308,8 +876,10 @@ class FakeMachine:
     TIME_BEAN_EXIT_PISTON = 0
     TIME_COOLER_EXIST_PISTON = 0
     TIME_BEAN_ENTRANCE_PISTON = 0
+    RECIPE_SIZE = 30
 
     def __init__(self, *args, **kwargs):
+        self.recipe = []
         self._bean_entrance = False
         self._bean_exit = False
         self._burner = False
@@ -330,6 +900,32 @@ class FakeMachine:
     def connect(self, *args, **kwargs):
         pass
 
+    def snapshot(self):
+        return RoasterState(
+            bean_entrance=self.bean_entrance,
+            bean_exit=self.bean_exit,
+            cooler_exit=self.cooler_exit,
+            mixer=self.mixer,
+            cooler=self.cooler,
+            burner=self.burner,
+            cylinder=self.cylinder,
+            mode=self.mode,
+            pid_reference=self.pid_reference,
+            pid_parameters=list(self.pid_parameters),
+            data=self.data,
+        )
+
+    @contextlib.contextmanager
+    def hold(self):
+        yield self.snapshot()
+
+    @contextlib.contextmanager
+    def batch(self):
+        yield
+
+    def upload_recipe(self, points):
+        self.recipe = list(points)
+
     @property
     def bean_entrance(self):
         return self._bean_entrance
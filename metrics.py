@@ -0,0 +1,109 @@
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Histogram
+
+
+# Seconds; from a fast local Modbus reply to a tick that took too long
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+# Only the control loop metrics (not the process ones of the default registry)
+REGISTRY = CollectorRegistry()
+
+
+def roaster_label(name):
+    """Value of the `roaster` label (empty when the roaster has no name)"""
+
+    return name or ""
+
+
+# Every metric is labelled by roaster first, so the roasters driven by one
+# process (`supervisor.py`) are told apart
+def _histogram(name, documentation, labelnames=()):
+    return Histogram(
+        name,
+        documentation,
+        ["roaster", *labelnames],
+        buckets=DEFAULT_BUCKETS,
+        registry=REGISTRY,
+    )
+
+
+def _counter(name, documentation, labelnames=()):
+    return Counter(name, documentation, ["roaster", *labelnames], registry=REGISTRY)
+
+
+MODBUS_SECONDS = _histogram(
+    "carmomaq_modbus_request_seconds",
+    "Modbus request latency by roaster, function and starting address",
+    ["function", "address"],
+)
+MODBUS_ERRORS = _counter(
+    "carmomaq_modbus_errors_total",
+    "Failed Modbus requests (each retry counts) by roaster, function and address",
+    ["function", "address"],
+)
+WRITES_ELIDED = _counter(
+    "carmomaq_modbus_writes_elided_total",
+    "Writes skipped because the roaster already had the value",
+)
+DECODE_SECONDS = _histogram(
+    "carmomaq_data_decode_seconds", "Time to decode the raw sensor data"
+)
+CONTROLLER_STEP_SECONDS = _histogram(
+    "carmomaq_controller_step_seconds",
+    "Time spent by the controller in each step",
+    ["controller"],
+)
+RECORD_WRITE_SECONDS = _histogram(
+    "carmomaq_record_write_seconds", "Time to append and flush a telemetry record"
+)
+PUBLISH_SECONDS = _histogram(
+    "carmomaq_log_publish_seconds",
+    "Time spent in `Logger.log` by message type",
+    ["message_type"],
+)
+LOOP_PERIOD_SECONDS = _histogram(
+    "carmomaq_loop_period_seconds", "Time between two control loop wake ups"
+)
+LOOP_BUSY_SECONDS = _histogram(
+    "carmomaq_loop_busy_seconds", "Time the control loop worked in each tick"
+)
+LOOP_TICKS = _counter("carmomaq_loop_ticks_total", "Control loop ticks")
+LOOP_OVERRUNS = _counter(
+    "carmomaq_loop_overruns_total",
+    "Control loop ticks that took longer than the period",
+)
+LOOP_SKIPPED = _counter(
+    "carmomaq_loop_skipped_ticks_total",
+    "Control loop deadlines skipped after an overrun",
+)
+
+
+def render(registry=REGISTRY):
+    """Every metric in the Prometheus text exposition format"""
+
+    return prometheus_client.generate_latest(registry).decode("utf-8")
+
+
+def serve(port, host="", registry=REGISTRY):
+    """Serve `registry` on `http://host:port/metrics` from a daemon thread"""
+
+    server, _ = prometheus_client.start_http_server(
+        port, host or "0.0.0.0", registry=registry
+    )
+    return server
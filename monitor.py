@@ -1,15 +1,38 @@
 import json
 
-from flask import Flask, jsonify, render_template
+from flask import Flask, Response, jsonify, render_template, request
 from redis import Redis
 
 import settings
+import utils
+from history import RedisHistory, parse_id
+from hub import Hub, render_event
 
 
 app = Flask(__name__)
 redis = Redis(settings.REDIS_HOST, settings.REDIS_PORT, db=settings.REDIS_DB)
-pubsub = redis.pubsub()
-pubsub.subscribe(settings.REDIS_CHANNEL)
+# The single roaster channel and one channel per roaster (`supervisor.py`)
+hub = Hub(redis, [settings.REDIS_CHANNEL], patterns=[f"{settings.REDIS_CHANNEL}:*"])
+hub.start()
+# Seconds without messages before sending a comment, so proxies and the
+# browser don't drop an idle stream
+KEEPALIVE_INTERVAL = 15
+
+
+def roaster_channel():
+    """Channel of the roaster asked for with `?roaster=`
+
+    Without it, the channel of the single roaster (`torrador.py` without
+    `--roaster`): the messages of different roasters are never mixed.
+    """
+
+    return utils.roaster_channel(settings.REDIS_CHANNEL, request.args.get("roaster"))
+
+
+def get_history(channel):
+    if not settings.REDIS_HISTORY_SIZE:
+        return None
+    return RedisHistory(redis, channel)
 
 
 @app.route("/")
@@ -19,22 +42,94 @@ def index():
 
 @app.route("/message")
 def message():
-    messages, finished, max_messages = [], False, 30
-    while not finished:
-        content = pubsub.get_message()
-        finished = content is None
-        if not finished:
-            data = content["data"]
-            if isinstance(data, bytes):
-                messages.append({
-                    "channel": content["channel"].decode("utf-8"),
-                    "data": json.loads(data),
-                })
-        if len(messages) >= max_messages:
-            finished = True
-
-    return jsonify(messages)
+    since = request.args.get("since", type=int)
+    if since is None:  # first request: only what comes next
+        return jsonify({"last_id": hub.last_id, "messages": []})
+    messages = [
+        {"id": item.id, "channel": item.channel, "data": item.data}
+        for item in hub.since(since, roaster_channel())
+    ]
+    return jsonify({"last_id": hub.last_id, "messages": messages})
+
+
+@app.route("/history")
+def history_range():
+    """Messages recorded for a roast (the current one by default)"""
+
+    channel = roaster_channel()
+    history = get_history(channel)
+    if history is None:
+        return jsonify({"roast": None, "messages": []})
+    roast_id = request.args.get("roast") or history.current_roast()
+    entries = history.range(
+        roast_id,
+        after=request.args.get("after"),
+        count=request.args.get("count", type=int),
+    )
+    messages = [
+        {"id": event_id, "channel": channel, "data": json.loads(data)}
+        for event_id, data in entries
+    ]
+    return jsonify({"roast": roast_id, "messages": messages})
+
+
+@app.route("/stream")
+def stream():
+    """Push each message to the browser as soon as it's published
+
+    Messages after `after` (or the `Last-Event-ID` sent by a reconnecting
+    browser) are first read from the history, then the stream switches to
+    the live messages, skipping the ones already sent. Only the messages
+    of one roaster are sent (see `roaster_channel`).
+    """
+
+    after = request.headers.get("Last-Event-ID") or request.args.get("after")
+    channel = roaster_channel()
+    history = get_history(channel)
+
+    def events():
+        if after is not None and "-" not in after:  # live-only message ID
+            client = hub.connect(since=int(after), channel=channel)
+        else:
+            client = hub.connect(channel=channel)
+        try:
+            last_sent = None
+            if after is not None and history is not None and "-" in after:
+                last_sent = parse_id(after)
+                backlog = history.range(after=after)
+                if backlog:
+                    last_sent = parse_id(backlog[-1][0])
+                    yield "".join(
+                        render_event(event_id, channel, json.loads(data))
+                        for event_id, data in backlog
+                    )
+            while True:
+                messages = client.get(timeout=KEEPALIVE_INTERVAL)
+                if not messages:
+                    yield ": keep-alive\n\n"
+                    continue
+                if last_sent is not None:
+                    messages = [
+                        item
+                        for item in messages
+                        if not isinstance(item.event_id, str)
+                        or parse_id(item.event_id) > last_sent
+                    ]
+                yield "".join(item.event for item in messages)
+        finally:
+            hub.disconnect(client)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/hub")
+def hub_stats():
+    return jsonify(hub.stats)
 
 
 if __name__ == "__main__":
-    app.run()
+    app.run(threaded=True)
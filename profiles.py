@@ -0,0 +1,219 @@
+import numpy as np
+
+
+# Samples `simplify` works on, at most: a whole roast at one sample per
+# second (a 30 point recipe takes about half a second)
+MAX_SIMPLIFY_SAMPLES = 3000
+
+
+class ResampledProfile:
+    """Setup variables sampled on a regular time grid
+
+    `values[variable][i]` is the value at `i * resolution` seconds.
+    Lookahead arrays (the value `seconds_ahead` in the future for every
+    sample) are computed once per variable/lookahead, so the controllers
+    pay a single array index per tick.
+    """
+
+    def __init__(self, values, resolution, duration):
+        self.values = values
+        self.resolution = resolution
+        self.duration = duration
+        self.size = len(next(iter(values.values()))) if values else 0
+        self._lookahead = {}
+
+    def index(self, seconds):
+        index = int(round(seconds / self.resolution))
+        return max(0, min(index, self.size - 1))
+
+    def value(self, seconds, variable):
+        value = self.values[variable][self.index(seconds)]
+        return None if np.isnan(value) else float(value)
+
+    def lookahead(self, variable, seconds_ahead):
+        """Array where index `i` has the value `seconds_ahead` after `i`"""
+
+        key = (variable, seconds_ahead)
+        if key not in self._lookahead:
+            values = self.values[variable]
+            shift = min(int(round(seconds_ahead / self.resolution)), self.size)
+            self._lookahead[key] = np.concatenate(
+                [values[shift:], np.repeat(values[-1:], shift)]
+            )
+        return self._lookahead[key]
+
+    def target(self, seconds, variable, seconds_ahead=0):
+        """Value of `variable` at `seconds + seconds_ahead`"""
+
+        value = self.lookahead(variable, seconds_ahead)[self.index(seconds)]
+        return None if np.isnan(value) else float(value)
+
+
+def _previous(grid, times, values):
+    indexes = np.searchsorted(times, grid, side="right") - 1
+    return values[np.clip(indexes, 0, len(values) - 1)]
+
+
+def _spline(grid, times, values):
+    """Cubic Hermite interpolation with finite-difference slopes"""
+
+    if len(times) < 3:
+        return np.interp(grid, times, values)
+    slopes = np.gradient(values, times)
+    grid = np.clip(grid, times[0], times[-1])
+    indexes = np.clip(np.searchsorted(times, grid, side="right") - 1, 0, len(times) - 2)
+    x0, x1 = times[indexes], times[indexes + 1]
+    y0, y1 = values[indexes], values[indexes + 1]
+    m0, m1 = slopes[indexes], slopes[indexes + 1]
+    h = x1 - x0
+    t = (grid - x0) / h
+    t2, t3 = t * t, t * t * t
+    return (
+        (2 * t3 - 3 * t2 + 1) * y0
+        + (t3 - 2 * t2 + t) * h * m0
+        + (-2 * t3 + 3 * t2) * y1
+        + (t3 - t2) * h * m1
+    )
+
+
+INTERPOLATIONS = {
+    "previous": _previous,
+    "linear": np.interp,
+    "spline": _spline,
+}
+
+
+def smooth(values, window):
+    """Centered moving average over `window` samples (edges repeated)"""
+
+    if window <= 1:
+        return values
+    before = (window - 1) // 2
+    padded = np.pad(values, (before, window - 1 - before), mode="edge")
+    return np.convolve(padded, np.ones(window) / window, mode="valid")
+
+
+def resample(setup, resolution=1.0, method="linear", smoothing=0):
+    """Resample the numeric variables of a `utils.SetupProfile`
+
+    `method` is one of `INTERPOLATIONS` ("previous" reproduces the
+    step-wise lookup); `smoothing` is the moving-average window in seconds.
+    Resolution may be below one second.
+    """
+
+    interpolate = INTERPOLATIONS[method]
+    grid = np.arange(0, setup.end + resolution / 2, resolution)
+    window = int(round(smoothing / resolution))
+    values = {}
+    for field in setup.fields:
+        points = [
+            (seconds, getattr(row, field))
+            for seconds, row in sorted(setup.rows.items())
+            if isinstance(getattr(row, field), (int, float))
+            and not isinstance(getattr(row, field), bool)
+        ]
+        if field == "roast_time" or not points:
+            continue
+        times, field_values = np.array(points, dtype=float).T
+        values[field] = smooth(interpolate(grid, times, field_values), window)
+    return ResampledProfile(values, resolution, setup.end)
+
+
+def _prefix_sums(times, values):
+    def prefix(series):
+        return np.concatenate([[0.0], np.cumsum(series)])
+
+    return {
+        "n": prefix(np.ones_like(times)),
+        "t": prefix(times),
+        "t2": prefix(times * times),
+        "y": prefix(values),
+        "y2": prefix(values * values),
+        "ty": prefix(times * values),
+    }
+
+
+def _segment_errors(times, values, sums, end):
+    """Squared error of joining each sample before `end` to `end` with a
+    straight line
+
+    Item `i` is the sum of the squared differences between the samples
+    from `i` to `end` and the line through both, from the prefix `sums`
+    (see `_prefix_sums`) in `O(end)`.
+    """
+
+    i = np.arange(end)
+    slope = (values[end] - values[i]) / (times[end] - times[i])
+    intercept = values[i] - slope * times[i]
+
+    def total(name):
+        return sums[name][end + 1] - sums[name][i]
+
+    error = (
+        total("y2")
+        - 2 * intercept * total("y")
+        - 2 * slope * total("ty")
+        + total("n") * intercept * intercept
+        + 2 * intercept * slope * total("t")
+        + slope * slope * total("t2")
+    )
+    return np.maximum(error, 0)
+
+
+def simplify(times, values, points, max_samples=MAX_SIMPLIFY_SAMPLES):
+    """Best piecewise linear approximation of a curve with `points` vertices
+
+    Vertices are chosen among the samples (always keeping the first and the
+    last) to minimize the squared error of the linear interpolation, by
+    dynamic programming over `_segment_errors`. Curves longer than
+    `max_samples` are evenly downsampled first: the time grows with the
+    square of the samples, the memory only linearly.
+    """
+
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(times) <= points:
+        return times, values
+    if points < 2:
+        raise ValueError("At least 2 points are needed")
+    if len(times) > max_samples:
+        kept = np.unique(np.linspace(0, len(times) - 1, max_samples).round())
+        times, values = times[kept.astype(int)], values[kept.astype(int)]
+
+    # `best[k, j]`: smallest error reaching sample `j` with `k` segments,
+    # coming from sample `previous[k, j]`
+    size, sums = len(times), _prefix_sums(times, values)
+    best = np.full((points, size), np.inf)
+    best[0, 0] = 0.0
+    previous = np.zeros((points, size), dtype=int)
+    segments = np.arange(points - 1)
+    for end in range(1, size):
+        totals = best[:-1, :end] + _segment_errors(times, values, sums, end)
+        choices = np.argmin(totals, axis=1)
+        previous[1:, end] = choices
+        best[1:, end] = totals[segments, choices]
+
+    indexes = [size - 1]
+    for segment in range(points - 1, 0, -1):
+        indexes.append(previous[segment, indexes[-1]])
+    indexes = indexes[::-1]
+    return times[indexes], values[indexes]
+
+
+def recipe_points(profile, variable, seconds_ahead=0, size=30, smoothing=30):
+    """`(seconds, value)` of the best `size`-point approximation of a
+    `ResampledProfile` variable, for `CarmoMaq10.upload_recipe`
+
+    The curve is smoothed over `smoothing` seconds first, so the points
+    aren't spent on the one-degree steps of the recorded temperatures.
+    """
+
+    values = profile.lookahead(variable, seconds_ahead)
+    times = np.arange(profile.size) * profile.resolution
+    valid = ~np.isnan(values)
+    window = int(round(smoothing / profile.resolution))
+    times, values = simplify(times[valid], smooth(values[valid], window), size)
+    return [
+        (int(round(seconds)), int(round(value)))
+        for seconds, value in zip(times, values)
+    ]
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import json
+import math
+import mmap
+import os
+import pathlib
+import struct
+
+import numpy as np
+import rows
+
+
+MAGIC = b"CMQREC01"
+# magic, header size, record count; the JSON schema follows, then the records
+PREAMBLE = struct.Struct("<8sIQ")
+COUNT_OFFSET = 12
+HEADER_SIZE = 4096
+STRING_SIZE = 32
+
+
+def field_format(value):
+    """`struct` format used to store `value`
+
+    Every number (and a missing value) is a double, so a field that starts
+    as an integer may receive a float later (like an interpolated setpoint).
+    """
+
+    if isinstance(value, bool):
+        return "?"
+    elif value is None or isinstance(value, (int, float)):
+        return "d"
+    return f"{STRING_SIZE}s"
+
+
+def _number(value):
+    """Number as recorded: `None` if missing, `int` if it's whole"""
+
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else value
+
+
+class Recorder:
+    """Append-only telemetry file with fixed-width records
+
+    The schema (field names and `struct` formats, see `field_format`) is
+    taken from the first record and stored as JSON in the header; a later
+    record with a field out of the schema raises `ValueError` instead of
+    losing it (a missing field is recorded as missing). Strings are cut at
+    `STRING_SIZE` bytes, on a character boundary. Records are written to a
+    memory-mapped file grown `chunk` records at a time and the record count
+    in the header is only updated after the record is in place, so a crash
+    never leaves a partially written record visible to readers.
+    """
+
+    def __init__(self, filename, chunk=4096):
+        self.filename = pathlib.Path(filename)
+        self.chunk = chunk
+        self.count = 0
+        self.fields = None
+        self._names = None
+        self._struct = None
+        self._fobj = None
+        self._mmap = None
+        self._capacity = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _create(self, data):
+        self.fields = [(name, field_format(value)) for name, value in data.items()]
+        self._names = {name for name, _ in self.fields}
+        self._struct = struct.Struct("<" + "".join(fmt for _, fmt in self.fields))
+        schema = json.dumps({"fields": self.fields}).encode("utf-8")
+        if PREAMBLE.size + len(schema) > HEADER_SIZE:
+            raise ValueError("Schema too big for the header")
+
+        self._fobj = open(self.filename, mode="w+b")
+        header = PREAMBLE.pack(MAGIC, HEADER_SIZE, 0) + schema
+        self._fobj.write(header.ljust(HEADER_SIZE, b"\x00"))
+        self._grow()
+
+    def _grow(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+        self._capacity += self.chunk
+        self._fobj.truncate(HEADER_SIZE + self._capacity * self._struct.size)
+        self._mmap = mmap.mmap(self._fobj.fileno(), 0)
+
+    def _values(self, data):
+        unknown = data.keys() - self._names
+        if unknown:
+            raise ValueError(f"Fields not in the schema: {', '.join(sorted(unknown))}")
+        values = []
+        for name, fmt in self.fields:
+            value = data.get(name)
+            if fmt.endswith("s"):
+                value = str("" if value is None else value).encode("utf-8")
+                value = value[:STRING_SIZE].decode("utf-8", errors="ignore").encode()
+            elif value is None:
+                value = math.nan if fmt == "d" else 0
+            values.append(value)
+        return values
+
+    def append(self, data):
+        if self._struct is None:
+            self._create(data)
+        if self.count == self._capacity:
+            self._grow()
+
+        offset = HEADER_SIZE + self.count * self._struct.size
+        self._struct.pack_into(self._mmap, offset, *self._values(data))
+        self.count += 1
+        struct.pack_into("<Q", self._mmap, COUNT_OFFSET, self.count)
+
+    def flush(self):
+        """Ask the OS to write the dirty pages (cheap: only what changed)"""
+
+        if self._mmap is not None:
+            self._mmap.flush()
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._mmap.flush()
+        self._mmap.close()
+        self._mmap = None
+        self._fobj.truncate(HEADER_SIZE + self.count * self._struct.size)
+        self._fobj.close()
+
+
+def read_header(fobj):
+    magic, header_size, count = PREAMBLE.unpack(fobj.read(PREAMBLE.size))
+    if magic != MAGIC:
+        raise ValueError("Not a telemetry record file")
+    schema = fobj.read(header_size - PREAMBLE.size).rstrip(b"\x00")
+    fields = [tuple(field) for field in json.loads(schema)["fields"]]
+    return header_size, count, fields
+
+
+def read_records(filename):
+    """Yield each record of a `Recorder` file as a dict
+
+    Missing numbers are `None` and whole ones are integers, as recorded.
+    """
+
+    with open(filename, mode="rb") as fobj:
+        header_size, count, fields = read_header(fobj)
+        record = struct.Struct("<" + "".join(fmt for _, fmt in fields))
+        names = [name for name, _ in fields]
+        strings = [name for name, fmt in fields if fmt.endswith("s")]
+        numbers = [name for name, fmt in fields if fmt == "d"]
+        # The file may still be growing (or have crashed): trust the count
+        count = min(
+            count, (os.fstat(fobj.fileno()).st_size - header_size) // record.size
+        )
+        fobj.seek(header_size)
+        data = fobj.read(count * record.size)
+        for values in record.iter_unpack(data):
+            row = dict(zip(names, values))
+            for name in strings:
+                # Files written before strings were cut on a character
+                # boundary may end with part of one
+                row[name] = row[name].rstrip(b"\x00").decode("utf-8", errors="ignore")
+            for name in numbers:
+                row[name] = _number(row[name])
+            yield row
+
+
+def read_array(filename):
+    """Every record of a `Recorder` file in one NumPy structured array
+
+    The records are fixed-width, so the array is a view of the file
+    content (no per-record decoding); strings stay as bytes and missing
+    numbers are NaN.
+    """
+
+    with open(filename, mode="rb") as fobj:
+        header_size, count, fields = read_header(fobj)
+        dtype = np.dtype(
+            [
+                (name, f"S{fmt[:-1]}" if fmt.endswith("s") else f"<{fmt}")
+                for name, fmt in fields
+            ]
+        )
+        size = os.fstat(fobj.fileno()).st_size - header_size
+        count = min(count, size // dtype.itemsize)
+        fobj.seek(header_size)
+        return np.frombuffer(fobj.read(count * dtype.itemsize), dtype=dtype)
+
+
+def load(filename):
+    """Samples (dicts) of a recorded roast: `Recorder` file, CSV or XLS"""
+
+    filename = pathlib.Path(filename)
+    if filename.suffix == ".bin":
+        samples = list(read_records(filename))
+    elif filename.suffix == ".csv":
+        samples = [row._asdict() for row in rows.import_from_csv(str(filename))]
+    elif filename.suffix == ".xls":
+        samples = [row._asdict() for row in rows.import_from_xls(str(filename))]
+    else:
+        raise ValueError(f"Unknown recording format: {filename}")
+    return [sample for sample in samples if sample.get("roast_time") is not None]
+
+
+def export(filename, output_filename, file_format=None):
+    """Convert a `Recorder` file to CSV or XLS"""
+
+    output_filename = pathlib.Path(output_filename)
+    file_format = file_format or output_filename.suffix[1:]
+    records = list(read_records(filename))
+    fieldnames = list(records[0].keys()) if records else []
+    if file_format == "csv":
+        with open(output_filename, mode="w", encoding="utf8") as fobj:
+            writer = csv.DictWriter(fobj, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(records)
+    elif file_format == "xls":
+        table = rows.import_from_dicts(records)
+        rows.export_to_xls(table, str(output_filename))
+    else:
+        raise ValueError(f"Unknown format: {file_format}")
+    return output_filename
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename")
+    parser.add_argument("--format", choices=["csv", "xls"], default="xls")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    output = args.output or pathlib.Path(args.filename).with_suffix(f".{args.format}")
+    print(f"Arquivo gravado: {export(args.filename, output, args.format)}")
@@ -0,0 +1,396 @@
+import argparse
+import bisect
+import collections
+import csv
+import time
+
+import modbus_tk.defines as cst
+import numpy as np
+
+import controllers
+import recorder
+import settings
+import torrador
+import utils
+from connection import FUNCTION_NAMES
+from logger import Logger
+from machines import CarmoMaq10
+from simulator import Simulator
+
+
+# Name of each known address (like "burner"), to make the commands readable
+ADDRESS_NAMES = {
+    value: name[len("ADDR_") :].lower()
+    for name, value in vars(CarmoMaq10).items()
+    if name.startswith("ADDR_")
+}
+
+Command = collections.namedtuple(
+    "Command", ["time", "roast_time", "function", "address", "name", "value"]
+)
+
+
+class VirtualClock:
+    """Clock that only moves when told to: `sleep` returns immediately
+
+    Each `listener` is called with the seconds advanced (the simulator
+    steps its model with them).
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.listeners = []
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        if seconds <= 0:
+            return
+        self.now += seconds
+        for listener in self.listeners:
+            listener(seconds)
+
+    sleep = advance
+
+
+class LocalMaster:
+    """Modbus master `execute` working on the registers of a `Simulator`
+    in the same process (no sockets), recording every write as a command"""
+
+    def __init__(self, simulator, clock):
+        self.simulator = simulator
+        self.clock = clock
+        self.commands = []
+        self.requests = collections.Counter()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(
+        self, slave, function_code, starting_address, quantity_of_x=0, output_value=0
+    ):
+        self.requests[function_code] += 1
+        if function_code in (cst.READ_COILS, cst.READ_HOLDING_REGISTERS):
+            return tuple(self.simulator.read(starting_address, quantity_of_x))
+
+        values = output_value
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        self.simulator.write(starting_address, list(values))
+        names = [
+            ADDRESS_NAMES[address]
+            for address in range(starting_address, starting_address + len(values))
+            if address in ADDRESS_NAMES
+        ]
+        self.commands.append(
+            Command(
+                time=self.clock.time(),
+                roast_time=int(self.simulator.roast_time),
+                function=FUNCTION_NAMES.get(function_code, function_code),
+                address=starting_address,
+                name="+".join(names) or str(starting_address),
+                value=values[0] if len(values) == 1 else list(values),
+            )
+        )
+        return starting_address, len(values)
+
+    def stats(self):
+        return {
+            FUNCTION_NAMES.get(function_code, function_code): {"count": count}
+            for function_code, count in self.requests.items()
+        }
+
+
+class ReplayMachine(CarmoMaq10):
+    """The real `CarmoMaq10` driver talking to a `Simulator` through a
+    `LocalMaster`
+
+    There's no read cache: its expiration is measured with the wall clock,
+    which barely moves during a replay (each tick reads one snapshot).
+    """
+
+    def __init__(self, simulator, clock):
+        super().__init__("replay", 0, cache_ttl=None, shadow=True)
+        self.simulator = simulator
+        self.clock = clock
+
+    def connect(self, *args, **kwargs):
+        self._master = LocalMaster(self.simulator, self.clock)
+
+
+class TraceSimulator(Simulator):
+    """`Simulator` reporting the temperatures of a recorded roast
+
+    The recorded sample is chosen by the simulated roast time, so the
+    trace starts when the replayed roast starts. It's open loop: the
+    commands don't change what is reported.
+    """
+
+    TRACE_WORDS = ("temp_bean", "temp_air", "temp_fire", "temp_cooler")
+
+    def __init__(self, trace, **kwargs):
+        self.trace = sorted(trace, key=lambda row: row["roast_time"])
+        self._times = [row["roast_time"] for row in self.trace]
+        super().__init__(**kwargs)
+
+    def _publish(self):
+        super()._publish()
+        index = max(0, bisect.bisect_right(self._times, self.roast_time) - 1)
+        row = self.trace[index]
+        for offset, name in enumerate(CarmoMaq10.DATA_WORDS_HEADER):
+            if name in self.TRACE_WORDS and row.get(name) is not None:
+                self.write(CarmoMaq10.ADDR_DATA_WORDS + offset, int(row[name]))
+
+
+class ReportLogger(Logger):
+    """Keep the text messages (with the virtual time) instead of printing"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.messages = []
+
+    def log(self, content, message_type="text"):
+        if message_type == "text":
+            self.messages.append((self.clock.time(), str(content)))
+
+
+class Report:
+    """What happened in a replay: commands, messages and samples"""
+
+    def __init__(self, commands, messages, samples, logic, profile, elapsed):
+        self.commands = commands
+        self.messages = messages
+        self.samples = samples
+        self.logic = logic
+        self.profile = profile
+        self.elapsed = elapsed
+
+    @property
+    def bean_exit_seconds(self):
+        """When the beans left (after it the probe reads the empty drum)"""
+
+        for command in self.commands:
+            if command.name == "write_bean_exit" and command.value:
+                return command.roast_time
+        return float("inf")
+
+    def _errors(self, variable, since=0, until=None):
+        """Deviation of `variable` from the setup in each sample from
+        `since` seconds until `until` or the bean exit (except where the
+        setup has no value)"""
+
+        seconds = np.array([sample["roast_time"] for sample in self.samples])
+        values = np.array([sample[variable] for sample in self.samples], dtype=float)
+        expected = self.profile.values[variable][
+            np.clip(
+                np.round(seconds / self.profile.resolution).astype(int),
+                0,
+                self.profile.size - 1,
+            )
+        ]
+        until = min(until or float("inf"), self.bean_exit_seconds)
+        errors = (values - expected)[(seconds >= (since or 0)) & (seconds < until)]
+        return errors[~np.isnan(errors)]
+
+    def tracking_error(self, variable="temp_bean", since=0, until=None):
+        """RMS and max absolute deviation of `variable` from the setup"""
+
+        errors = self._errors(variable, since, until)
+        if not len(errors):
+            return None, None
+        return float(np.sqrt(np.mean(errors ** 2))), float(np.max(np.abs(errors)))
+
+    def overshoot(self, variable="temp_bean", since=0, until=None):
+        """How much `variable` went above the setup, at most
+
+        Before the turning point the bean probe reads the hot drum, not
+        the beans, so that's a good `since`; after the setup's end (when it
+        reaches the final temperature) there's nothing to follow.
+        """
+
+        errors = self._errors(variable, since, until)
+        return float(max(0.0, np.max(errors))) if len(errors) else None
+
+    def time_to(self, temperature, variable="temp_bean", since=0):
+        """Roast time when `variable` first reached `temperature`"""
+
+        for sample in self.samples:
+            if sample["roast_time"] >= self.bean_exit_seconds:
+                break
+            elif (
+                sample["roast_time"] >= (since or 0) and sample[variable] >= temperature
+            ):
+                return sample["roast_time"]
+        return None
+
+    def setup_time_to(self, temperature, variable="temp_bean", since=0):
+        """Roast time when the setup first reaches `temperature`"""
+
+        values = self.profile.values[variable]
+        start = int(round((since or 0) / self.profile.resolution))
+        reached = np.flatnonzero(values[start:] >= temperature)
+        if not len(reached):
+            return None
+        return int((start + reached[0]) * self.profile.resolution)
+
+    def first_command(self, name):
+        for command in self.commands:
+            if name in command.name.split("+"):
+                return command
+        return None
+
+    def summary(self):
+        rms, max_error = self.tracking_error()
+        bean_exit = self.bean_exit_seconds
+        mixer = self.first_command("mixer")
+        return {
+            "ticks": len(self.samples),
+            "commands": len(self.commands),
+            "commands_by_name": dict(
+                collections.Counter(command.name for command in self.commands)
+            ),
+            "turning_point_seconds": self.logic.turning_point_seconds,
+            "turning_point_temp": self.logic.turning_point_temp,
+            "mixer_start_seconds": mixer.roast_time if mixer else None,
+            "bean_exit_seconds": None if bean_exit == float("inf") else bean_exit,
+            "final_temp_bean": self.samples[-1]["temp_bean"] if self.samples else None,
+            "rms_error_temp_bean": rms,
+            "max_error_temp_bean": max_error,
+            "overshoot_temp_bean": self.overshoot(
+                since=self.logic.turning_point_seconds
+            ),
+            "elapsed": self.elapsed,
+        }
+
+    def export_commands(self, filename):
+        with open(filename, mode="w", encoding="utf8") as fobj:
+            writer = csv.writer(fobj)
+            writer.writerow(Command._fields)
+            writer.writerows(self.commands)
+        return filename
+
+
+def replay(
+    setup_filename,
+    control_type="fire-temperature",
+    trace=None,
+    minutes=None,
+    interval=1.0,
+    last_bean_temperature=None,
+    configure=None,
+):
+    """Run a whole automatic roast against a simulated machine (or a
+    recorded `trace`) on a virtual clock and return a `Report`
+
+    `configure(roaster, controller)` is called before the roast starts,
+    to change parameters being evaluated (see `sweep.py`).
+    """
+
+    started = time.perf_counter()
+    setup, setup_metadata = utils.load_setup_file(
+        setup_filename, interval=1, cache_path=settings.SETUP_CACHE_PATH
+    )
+    last_setup_temperature = (
+        last_bean_temperature or setup_metadata["final_temperature"]
+    )
+    clock = VirtualClock()
+    simulator = TraceSimulator(trace) if trace is not None else Simulator()
+
+    def step_simulator(seconds):
+        # Steps of up to a second are accurate enough: the model's time
+        # constants are 8 seconds or more
+        while seconds > 1e-9:
+            dt = min(1.0, seconds)
+            simulator.step(dt)
+            seconds -= dt
+
+    clock.listeners.append(step_simulator)
+    roaster = ReplayMachine(simulator, clock)
+    roaster.connect()
+    logger = ReportLogger(clock)
+    controller = controllers.get_controller(control_type)(
+        roaster, setup, logger, sleep=clock.sleep
+    )
+    if configure is not None:
+        configure(roaster, controller)
+
+    # Same start sequence as `torrador.roast` in the automatic mode
+    roaster.set_cylinder(True)
+    controller.before_start()
+    roaster.set_mode("manual")
+    roaster.set_burner(True)
+    roaster.open_bean_entrance()
+    controller.after_start()
+    roaster.restart_roast()
+    roaster.set_alarm(last_setup_temperature)
+
+    logic = torrador.RoastLogic(
+        roaster, setup, logger, last_setup_temperature, controller=controller
+    )
+    total_time = minutes * 60 if minutes else setup.end
+    start, samples = clock.time(), []
+    while clock.time() - start <= total_time:
+        with roaster.hold(), roaster.batch():
+            data = roaster.data
+            samples.append(data)
+            logic.tick(data)
+        clock.advance(interval)
+
+    return Report(
+        roaster._master.commands,
+        logger.messages,
+        samples,
+        logic,
+        controller.profile,
+        time.perf_counter() - started,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("setup_filename")
+    parser.add_argument(
+        "--control_type",
+        choices=[
+            "bean-temperature",
+            "fire-temperature",
+            "servo-position",
+            "bean-temperature-recipe",
+            "fire-temperature-recipe",
+        ],
+        default="fire-temperature",
+    )
+    parser.add_argument(
+        "--trace", help="Recorded roast to replay (.bin, .csv or .xls)"
+    )
+    parser.add_argument("--minutes", type=float, help="Default: the setup length")
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--last_bean_temperature", type=int)
+    parser.add_argument("--commands", help="Save the commands to this CSV file")
+    parser.add_argument("--messages", action="store_true", help="Show the messages")
+    args = parser.parse_args()
+
+    report = replay(
+        args.setup_filename,
+        control_type=args.control_type,
+        trace=recorder.load(args.trace) if args.trace else None,
+        minutes=args.minutes,
+        interval=args.interval,
+        last_bean_temperature=args.last_bean_temperature,
+    )
+    if args.messages:
+        for seconds, message in report.messages:
+            print(f"[{utils.pretty_seconds(int(seconds))}] {message}")
+    summary = report.summary()
+    for key, value in summary.items():
+        if key != "commands_by_name":
+            print(f"{key}: {value}")
+    for name, count in sorted(summary["commands_by_name"].items()):
+        print(f"  {name}: {count}")
+    if args.commands:
+        print(f"Comandos gravados: {report.export_commands(args.commands)}")
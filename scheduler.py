@@ -0,0 +1,95 @@
+import collections
+import time
+
+from connection import percentile
+
+
+class FixedRateScheduler:
+    """Wake up every `interval` seconds on a fixed grid of the monotonic clock
+
+    Deadlines are `start + n * interval`, so the time spent in each tick
+    (and the sleep imprecision) never accumulates into drift. When a tick
+    takes longer than the interval (an overrun), `policy` decides what to
+    do with the deadlines already missed:
+
+    - "skip": drop them and wait for the next deadline on the grid;
+    - "catch-up": run them back to back, without sleeping, until the
+      schedule is recovered.
+
+    The jitter (how late each wake up was) of the last `window` ticks is
+    kept for `stats`.
+    """
+
+    POLICIES = ("skip", "catch-up")
+
+    def __init__(
+        self,
+        interval=1.0,
+        policy="skip",
+        window=10000,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy: {policy}")
+        self.interval = interval
+        self.policy = policy
+        self.clock = clock
+        self.sleep = sleep
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitters = collections.deque(maxlen=window)
+        self.start_time = None
+        self.deadline = None
+        self.woke = None
+        # Time between the last two wake ups and worked before the last one
+        self.period = None
+        self.busy = None
+
+    def start(self):
+        self.start_time = self.deadline = self.woke = self.clock()
+        return self
+
+    @property
+    def elapsed(self):
+        """Seconds since `start` (monotonic, unaffected by clock changes)"""
+
+        return self.clock() - self.start_time
+
+    def wait(self):
+        """Sleep until the next deadline and return the tick number"""
+
+        if self.start_time is None:
+            self.start()
+        now = self.clock()
+        self.busy = now - self.woke
+        self.deadline += self.interval
+        if now > self.deadline:
+            self.overruns += 1
+            if self.policy == "skip":
+                missed = int((now - self.deadline) // self.interval) + 1
+                self.skipped += missed
+                self.deadline += missed * self.interval
+        if self.deadline > now:
+            self.sleep(self.deadline - now)
+        woke = self.clock()
+        self.period, self.woke = woke - self.woke, woke
+        self.jitters.append(max(0.0, woke - self.deadline))
+        self.ticks += 1
+        return self.ticks
+
+    def stats(self):
+        """Tick, overrun and jitter (in seconds) counters"""
+
+        jitters = list(self.jitters)
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "jitter_mean": sum(jitters) / len(jitters) if jitters else None,
+            "jitter_p99": percentile(jitters, 0.99),
+            "jitter_max": max(jitters) if jitters else None,
+        }
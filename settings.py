@@ -6,10 +6,41 @@ DATA_PATH = pathlib.Path("./data")
 if not DATA_PATH.exists():
     DATA_PATH.mkdir()
 
+# Parsed setup spreadsheets, reused while the file doesn't change
+SETUP_CACHE_PATH = DATA_PATH / ".cache"
+
 ROASTER_HOST = "192.168.0.10"
 ROASTER_PORT = 502
+# Seconds a value read from the roaster is reused (`None` disables the cache)
+ROASTER_CACHE_TTL = 0.25
+# Skip writes of values the roaster already has, writing them again anyway
+# after `ROASTER_SHADOW_REFRESH` seconds (`None`: never)
+ROASTER_SHADOW_WRITES = True
+ROASTER_SHADOW_REFRESH = 30
+# Control loop period (seconds) and what to do with ticks missed by a slow
+# iteration ("skip" or "catch-up", see `scheduler.FixedRateScheduler`)
+LOOP_INTERVAL = 1.0
+LOOP_POLICY = "skip"
+# Preheat: how close (degrees) the fire must get to the setup's initial
+# temperature, the seconds to wait for it (`None`: forever) and what to do
+# then ("charge" anyway or "abort" the roast)
+PREHEAT_TOLERANCE = 3
+PREHEAT_TIMEOUT = 900
+PREHEAT_ON_TIMEOUT = "charge"
+# Roasts and their samples, searchable (see `archive.py`; `None` disables);
+# samples are committed every `ARCHIVE_COMMIT_INTERVAL` ones
+ARCHIVE_FILENAME = DATA_PATH / "torras.sqlite"
+ARCHIVE_COMMIT_INTERVAL = 10
+# Port of the Prometheus metrics listener of `torrador.py` (`None` disables)
+METRICS_PORT = None
 
 REDIS_HOST = "127.0.0.1"
 REDIS_PORT = 6379
 REDIS_DB = 0
 REDIS_CHANNEL = "carmomaq10"
+# Messages waiting to be published and what to do when the queue is full
+# ("drop_oldest", "drop_newest" or "coalesce", see `logger.Publisher`)
+REDIS_QUEUE_SIZE = 1000
+REDIS_QUEUE_POLICY = "coalesce"
+# Messages kept per roast for dashboards opened mid-roast (`None` disables)
+REDIS_HISTORY_SIZE = 20000
@@ -0,0 +1,187 @@
+import bisect
+import collections
+
+
+class RingBuffer:
+    """The last `size` values appended, in a preallocated list"""
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("size must be positive")
+        self.size = size
+        self._values = [None] * size
+        self._next = 0
+        self.count = 0
+
+    def append(self, value):
+        """Store `value`, returning the one it replaced (`None` if not full)"""
+
+        replaced = self._values[self._next] if self.full else None
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        return replaced
+
+    @property
+    def full(self):
+        return self.count == self.size
+
+    @property
+    def oldest(self):
+        if not self.count:
+            return None
+        return self._values[self._next if self.full else 0]
+
+    @property
+    def newest(self):
+        return self._values[self._next - 1] if self.count else None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Oldest first"""
+
+        start = self._next if self.full else 0
+        for index in range(self.count):
+            yield self._values[(start + index) % self.size]
+
+
+class MovingMedian:
+    """Median of the last `size` values: removes spikes of single samples
+
+    The window is kept sorted next to the ring buffer, so each update costs
+    `O(size)` regardless of how many samples came before.
+    """
+
+    def __init__(self, size=5):
+        self.buffer = RingBuffer(size)
+        self._sorted = []
+
+    def update(self, value):
+        replaced = self.buffer.append(value)
+        if replaced is not None:
+            del self._sorted[bisect.bisect_left(self._sorted, replaced)]
+        bisect.insort(self._sorted, value)
+        middle = len(self._sorted) // 2
+        if len(self._sorted) % 2:
+            return self._sorted[middle]
+        return (self._sorted[middle - 1] + self._sorted[middle]) / 2
+
+
+class EMA:
+    """Exponential moving average (`alpha` is the weight of a new value)"""
+
+    def __init__(self, alpha=0.3):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = float(value)
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class RateOfRise:
+    """Degrees per minute over the last `window` seconds
+
+    Samples are kept by their time, so any interval between them (even an
+    irregular one) works: the rate is from the newest sample at least
+    `window` seconds old. Until there's one, the rate covers every sample
+    so far; it's `0.0` with a single sample (or while the time doesn't
+    move, as before the roast starts).
+    """
+
+    def __init__(self, window=30):
+        self.window = window
+        self.samples = collections.deque()  # `(seconds, value)`, oldest first
+        self.value = 0.0
+
+    def update(self, seconds, value):
+        samples = self.samples
+        if samples and seconds < samples[-1][0]:  # the roast restarted
+            samples.clear()
+            self.value = 0.0
+        elif samples and seconds == samples[-1][0]:
+            return self.value
+        samples.append((seconds, value))
+        while len(samples) > 1 and samples[1][0] <= seconds - self.window:
+            samples.popleft()
+        first_seconds, first_value = samples[0]
+        if seconds > first_seconds:
+            self.value = (value - first_value) * 60 / (seconds - first_seconds)
+        return self.value
+
+
+class TurningPointDetector:
+    """Lowest bean temperature after the charge, confirmed by a rise
+
+    The minimum of the (filtered) temperature is tracked after `ignore`
+    seconds; the turning point is only declared when the temperature is
+    `rise` degrees above it, so a noisy sample going up by one degree
+    doesn't trigger it early. The result is the minimum itself (when and
+    how low), found `rise` degrees later.
+    """
+
+    def __init__(self, ignore=10, rise=1.5):
+        self.ignore = ignore
+        self.rise = rise
+        self.minimum = None  # `(seconds, temperature)`
+        self.found = False
+
+    def update(self, seconds, temperature):
+        if self.found or seconds <= self.ignore:
+            return self.found
+        if self.minimum is None or temperature < self.minimum[1]:
+            self.minimum = (seconds, temperature)
+        elif temperature >= self.minimum[1] + self.rise:
+            self.found = True
+        return self.found
+
+    @property
+    def seconds(self):
+        return self.minimum[0] if self.found else None
+
+    @property
+    def temperature(self):
+        return self.minimum[1] if self.found else None
+
+
+class RoastSignals:
+    """Filtered temperatures, bean rate of rise and turning point, updated
+    with each `roaster.data` sample in constant time and memory
+
+    Each temperature goes through a `MovingMedian` (spikes) then an `EMA`
+    (noise). `update` adds `<variable>_smooth` (`None` while that variable
+    is missing) and `ror_bean` to every sample, so they are recorded (the
+    recording schema comes from the first sample) and published with it.
+    """
+
+    variables = ("temp_bean", "temp_air", "temp_fire")
+
+    def __init__(self, median_size=5, alpha=0.3, ror_window=30, rise=1.5):
+        self.filters = {
+            variable: (MovingMedian(median_size), EMA(alpha))
+            for variable in self.variables
+        }
+        self.ror = RateOfRise(ror_window)
+        self.turning_point = TurningPointDetector(rise=rise)
+        self.smoothed = {}
+
+    def update(self, data):
+        for variable, (median, ema) in self.filters.items():
+            smoothed = None
+            if data.get(variable) is not None:
+                self.smoothed[variable] = ema.update(median.update(data[variable]))
+                smoothed = round(self.smoothed[variable], 2)
+            data[f"{variable}_smooth"] = smoothed
+        seconds, temperature = data["roast_time"], self.smoothed.get("temp_bean")
+        if temperature is not None:  # no bean temperature read yet otherwise
+            self.ror.update(seconds, temperature)
+            self.turning_point.update(seconds, temperature)
+        data["ror_bean"] = round(self.ror.value, 2)
+        return data
@@ -0,0 +1,339 @@
+import argparse
+import threading
+import time
+
+import modbus_tk.defines as cst
+import modbus_tk.modbus_tcp as modbus_tcp
+
+from machines import CarmoMaq10
+
+
+class ThermalModel:
+    """Lumped drum/air/bean model of the roaster
+
+    Burner power (scaled by the gas valve servo) heats the fire chamber,
+    the air follows the fire and the beans follow the air. The bean probe
+    has its own lag, so charging cold beans produces a turning point like
+    the real machine. Temperatures are in the same unit the PLC reports.
+    """
+
+    AMBIENT = 25.0
+    CHARGE_TEMPERATURE = 25.0
+    FIRE_GAIN = 700.0  # fire temperature above ambient with servo at 100%
+    FIRE_BASE = 0.25  # fraction of the burner power with servo at 0%
+    AIR_RATIO = 0.6  # air temperature at equilibrium, relative to the fire
+    TAU_FIRE = 90.0
+    TAU_AIR = 30.0
+    TAU_BEAN = 600.0
+    TAU_PROBE = 8.0
+    TAU_COOLER = 60.0
+    SERVO_SPEED = 1.0  # percent per second (see `TemperatureController`)
+
+    def __init__(self):
+        self.temp_fire = 480.0
+        self.temp_air = 300.0
+        self.temp_bean_mass = self.temp_air
+        self.temp_bean = 150.0
+        self.temp_cooler = self.AMBIENT
+        self.servo_position = 10.0
+        self.charged = False
+        self.cooling = False
+
+    def charge(self):
+        """Cold beans enter the drum"""
+
+        self.charged = True
+        self.temp_bean_mass = self.CHARGE_TEMPERATURE
+
+    def drop(self):
+        """Beans leave the drum to the cooler"""
+
+        if self.charged:
+            self.charged = False
+            self.cooling = True
+            self.temp_cooler = self.temp_bean_mass
+
+    def step(self, dt, burner, servo_target):
+        """Advance the model `dt` seconds"""
+
+        max_move = self.SERVO_SPEED * dt
+        delta = max(-max_move, min(max_move, servo_target - self.servo_position))
+        self.servo_position += delta
+
+        power = self.FIRE_BASE + (1 - self.FIRE_BASE) * self.servo_position / 100
+        fire_goal = self.AMBIENT + (self.FIRE_GAIN * power if burner else 0)
+        self.temp_fire += (fire_goal - self.temp_fire) * min(1, dt / self.TAU_FIRE)
+        air_goal = self.AMBIENT + self.AIR_RATIO * (self.temp_fire - self.AMBIENT)
+        self.temp_air += (air_goal - self.temp_air) * min(1, dt / self.TAU_AIR)
+        if self.charged:
+            self.temp_bean_mass += (self.temp_air - self.temp_bean_mass) * min(
+                1, dt / self.TAU_BEAN
+            )
+        else:  # empty drum: the probe reads the air
+            self.temp_bean_mass = self.temp_air
+        self.temp_bean += (self.temp_bean_mass - self.temp_bean) * min(
+            1, dt / self.TAU_PROBE
+        )
+        self.temp_cooler += (self.AMBIENT - self.temp_cooler) * min(
+            1, dt / self.TAU_COOLER
+        )
+
+
+class PID:
+    """Textbook PID used to emulate the PLC in recipe mode"""
+
+    def __init__(self):
+        self.integral = 0.0
+        self.last_error = None
+
+    def reset(self):
+        self.integral = 0.0
+        self.last_error = None
+
+    def step(self, dt, error, p_value, i_value, d_value, low=0, high=100):
+        derivative = 0 if self.last_error is None else (error - self.last_error) / dt
+        self.last_error = error
+        # Same integer scale the PLC uses for its parameters (tenths)
+        proportional = p_value / 10 * error + d_value / 10 * derivative
+        integral = self.integral + error * dt
+        output = proportional + i_value / 100 * integral
+        if low < output < high:  # anti-windup: only integrate when unsaturated
+            self.integral = integral
+        return max(low, min(high, output))
+
+
+class Simulator:
+    """Modbus TCP server with the same register/coil map as the CarmoMaq10
+
+    A background thread advances `ThermalModel` every `interval` seconds,
+    `speed` times faster than the wall clock, reacting to what the client
+    wrote (burner, servo, setpoint, PID reference, operation mode).
+    """
+
+    BLOCKS = (
+        ("doors", cst.COILS, 16000, 16),
+        ("commands", cst.COILS, 49980, 20),
+        ("pid_reference", cst.COILS, CarmoMaq10.ADDR_PID_REFERENCE, 1),
+        ("data", cst.HOLDING_REGISTERS, CarmoMaq10.ADDR_DATA_WORDS, 12),
+        ("recipe", cst.HOLDING_REGISTERS, 28000, 250),
+        ("pid", cst.HOLDING_REGISTERS, CarmoMaq10.ADDR_PID_P, 3),
+    )
+    DOORS = (
+        (
+            CarmoMaq10.ADDR_WRITE_BEAN_ENTRANCE,
+            CarmoMaq10.ADDR_READ_BEAN_ENTRANCE,
+            CarmoMaq10.TIME_BEAN_ENTRANCE_PISTON,
+        ),
+        (
+            CarmoMaq10.ADDR_WRITE_BEAN_EXIT,
+            CarmoMaq10.ADDR_READ_BEAN_EXIT,
+            CarmoMaq10.TIME_BEAN_EXIT_PISTON,
+        ),
+        (
+            CarmoMaq10.ADDR_WRITE_COOLER_EXIT,
+            CarmoMaq10.ADDR_READ_COOLER_EXIT,
+            CarmoMaq10.TIME_COOLER_EXIST_PISTON,
+        ),
+    )
+
+    def __init__(self, host="127.0.0.1", port=5020, speed=1.0, interval=0.1):
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.interval = interval
+        self.model = ThermalModel()
+        self.pid = PID()
+        self.roast_time = 0.0
+        self._doors_moving = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = modbus_tcp.TcpServer(port=port, address=host)
+        self._slave = self._server.add_slave(1)
+        self._blocks = {}
+        for name, block_type, start_address, size in self.BLOCKS:
+            self._slave.add_block(name, block_type, start_address, size)
+            self._blocks[name] = (block_type, start_address, size)
+        self._set(CarmoMaq10.ADDR_CYLINDER, 1)
+        self._set(CarmoMaq10.ADDR_OPERATIONAL_MODE, 1)  # manual
+        self._set(CarmoMaq10.ADDR_PID_P, [30, 5, 0])
+        self._set(CarmoMaq10.ADDR_SERVO_POSITION, int(self.model.servo_position))
+        self._set(CarmoMaq10.ADDR_SETPOINT, 200)
+        self._publish()
+
+    def _block_name(self, address):
+        """Name of the block holding `address` (coil and register
+        addresses of the CarmoMaq10 never overlap)"""
+
+        for name, (_, start_address, size) in self._blocks.items():
+            if start_address <= address < start_address + size:
+                return name
+        raise KeyError(address)
+
+    def read(self, address, quantity=1):
+        """Values of `quantity` coils or registers starting at `address`"""
+
+        return self._slave.get_values(self._block_name(address), address, quantity)
+
+    def write(self, address, values):
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        self._slave.set_values(self._block_name(address), address, values)
+
+    def _get(self, address):
+        return self.read(address)[0]
+
+    def _set(self, address, values):
+        self.write(address, values)
+
+    def _update_doors(self, dt):
+        for write_address, read_address, piston_time in self.DOORS:
+            wanted = self._get(write_address)
+            if wanted == self._get(read_address):
+                self._doors_moving.pop(read_address, None)
+                continue
+            remaining = self._doors_moving.get(read_address, piston_time) - dt
+            if remaining > 0:
+                self._doors_moving[read_address] = remaining
+                continue
+            self._doors_moving.pop(read_address, None)
+            self._set(read_address, wanted)
+            if read_address == CarmoMaq10.ADDR_READ_BEAN_ENTRANCE and wanted:
+                self.model.charge()
+            elif read_address == CarmoMaq10.ADDR_READ_BEAN_EXIT and wanted:
+                self.model.drop()
+
+    def _update_roast(self, dt):
+        if self._get(CarmoMaq10.ADDR_START_ROAST):  # consume the pulse
+            self._set(CarmoMaq10.ADDR_START_ROAST, 0)
+            roasting = not self._get(CarmoMaq10.ADDR_ROASTING)
+            self._set(CarmoMaq10.ADDR_ROASTING, int(roasting))
+            self.roast_time = 0.0
+            self.pid.reset()
+        elif self._get(CarmoMaq10.ADDR_ROASTING):
+            self.roast_time += dt
+
+    def _recipe(self):
+        """`(seconds, temperature)` points of the recipe tables (slots with
+        zero temperature are unused)"""
+
+        tables = [
+            self.read(address, CarmoMaq10.RECIPE_SIZE)
+            for address in (
+                CarmoMaq10.ADDR_RECIPE_MIN_START,
+                CarmoMaq10.ADDR_RECIPE_SEC_START,
+                CarmoMaq10.ADDR_RECIPE_TEMP_START,
+            )
+        ]
+        return [
+            (minutes * 60 + seconds, temperature)
+            for minutes, seconds, temperature in zip(*tables)
+            if temperature
+        ]
+
+    def _recipe_value(self, recipe):
+        """Recipe temperature at the current roast time (linear ramps)"""
+
+        if self.roast_time <= recipe[0][0]:
+            return recipe[0][1]
+        for (start, first), (end, last) in zip(recipe, recipe[1:]):
+            if start <= self.roast_time <= end:
+                if end == start:
+                    return last
+                fraction = (self.roast_time - start) / (end - start)
+                return first + (last - first) * fraction
+        return recipe[-1][1]
+
+    def _servo_target(self, dt):
+        manual = self._get(CarmoMaq10.ADDR_OPERATIONAL_MODE)
+        if manual or not self._get(CarmoMaq10.ADDR_ROASTING):
+            self.pid.reset()
+            return self._get(CarmoMaq10.ADDR_SERVO_POSITION)
+
+        recipe = self._recipe()
+        if recipe:  # the PLC follows the recipe and shows it as the setpoint
+            self._set(CarmoMaq10.ADDR_SETPOINT, int(self._recipe_value(recipe)))
+        reference = self._get(CarmoMaq10.ADDR_PID_REFERENCE)
+        measured = self.model.temp_fire if reference else self.model.temp_bean
+        error = self._get(CarmoMaq10.ADDR_SETPOINT) - measured
+        p_value, i_value, d_value = [
+            self._get(address)
+            for address in (
+                CarmoMaq10.ADDR_PID_P,
+                CarmoMaq10.ADDR_PID_I,
+                CarmoMaq10.ADDR_PID_D,
+            )
+        ]
+        return self.pid.step(dt, error, p_value, i_value, d_value)
+
+    def _publish(self):
+        model = self.model
+        seconds = int(self.roast_time)
+        self._set(
+            CarmoMaq10.ADDR_DATA_WORDS,
+            [
+                int(model.temp_bean),
+                int(model.temp_air),
+                int(model.temp_fire),
+                self._get(CarmoMaq10.ADDR_SETPOINT),
+                0,
+                0,
+                seconds,
+                seconds // 60,
+                seconds % 60,
+                0,
+                int(model.temp_cooler),
+                int(model.servo_position * 10),
+            ],
+        )
+
+    def step(self, dt):
+        """Advance the simulation `dt` seconds and update the registers"""
+
+        if not self._get(CarmoMaq10.ADDR_CYLINDER):
+            self._set(CarmoMaq10.ADDR_BURNER, 0)
+        self._update_doors(dt)
+        self._update_roast(dt)
+        servo_target = self._servo_target(dt)
+        self.model.step(dt, bool(self._get(CarmoMaq10.ADDR_BURNER)), servo_target)
+        self._publish()
+
+    def _run(self):
+        next_step = time.monotonic()
+        while not self._stop.is_set():
+            self.step(self.interval * self.speed)
+            next_step += self.interval
+            self._stop.wait(max(0, next_step - time.monotonic()))
+
+    def start(self):
+        self._server.start()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="Simulated seconds per second"
+    )
+    args = parser.parse_args()
+
+    simulator = Simulator(args.host, args.port, speed=args.speed)
+    simulator.start()
+    print(f"Simulador ouvindo em {args.host}:{args.port} (Ctrl+C para sair)")
+    print(f"  python torrador.py --host {args.host} --port {args.port} ...")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
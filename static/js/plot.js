@@ -46,39 +46,84 @@ var options = {
 var graph2d = new vis.Graph2d(container, [], groups, options);
 var textLog = $("#log");
 
+function handleMessage(row) {
+	if (row.data.message_type == "text") {
+		textLog.html(textLog.html() + "<br>" + row.data.message);
+		textLog.scrollTop(textLog.prop("scrollHeight"));
+	}
+	else if (row.data.message_type == "data") {
+		graph2d.itemsData.update({
+			x: row.data.timestamp,
+			y: row.data.temp_fire,
+			group: 0
+		});
+		graph2d.itemsData.update({
+			x: row.data.timestamp,
+			y: row.data.temp_air,
+			group: 1
+		});
+		graph2d.itemsData.update({
+			x: row.data.timestamp,
+			y: row.data.temp_bean,
+			group: 2
+		});
+	}
+}
+
+var lastId = null;
+// Only one roaster when several are supervised: "/?roaster=<name>"
+var roaster = new URLSearchParams(window.location.search).get("roaster");
+
+function withRoaster(params) {
+	if (roaster) {
+		params.roaster = roaster;
+	}
+	return params;
+}
+
 function updateData() {
 	$.ajax({
 		url: "/message",
+		data: withRoaster(lastId === null ? {} : {since: lastId}),
 		success: function(data) {
 			if (!data) {
 				return;
 			}
-			for (index = 0; index < data.length; index++) {
-				var row = data[index];
-				if (row.data.message_type == "text") {
-					textLog.html(textLog.html() + "<br>" + row.data.message);
-					textLog.scrollTop(textLog.prop("scrollHeight"));
-				}
-				else if (row.data.message_type == "data") {
-					graph2d.itemsData.update({
-						x: row.data.timestamp,
-						y: row.data.temp_fire,
-						group: 0
-					});
-					graph2d.itemsData.update({
-						x: row.data.timestamp,
-						y: row.data.temp_air,
-						group: 1
-					});
-					graph2d.itemsData.update({
-						x: row.data.timestamp,
-						y: row.data.temp_bean,
-						group: 2
-					});
-				}
+			lastId = data.last_id;
+			for (index = 0; index < data.messages.length; index++) {
+				handleMessage(data.messages[index]);
 			}
 		}
 	});
 	setTimeout(updateData, 1000);
 }
-updateData();
+
+function openStream(after) {
+	// The browser reconnects by itself, sending the last event ID received
+	var source = new EventSource("/stream?" + $.param(withRoaster(after ? {after: after} : {})));
+	source.onmessage = function(event) {
+		handleMessage(JSON.parse(event.data));
+	};
+}
+
+if (window.EventSource) {
+	// Load what was already recorded for this roast in one request, then
+	// follow the live messages from where the history ended
+	$.ajax({
+		url: "/history",
+		data: withRoaster({}),
+		success: function(data) {
+			var messages = data ? data.messages : [];
+			for (index = 0; index < messages.length; index++) {
+				handleMessage(messages[index]);
+			}
+			openStream(messages.length ? messages[messages.length - 1].id : null);
+		},
+		error: function() {
+			openStream(null);
+		}
+	});
+}
+else {
+	updateData();
+}
@@ -0,0 +1,122 @@
+import argparse
+import shlex
+import threading
+import time
+
+from redis import Redis
+
+import metrics
+import settings
+import torrador
+
+
+def load_roasts(filename):
+    """Arguments of each roast in `filename`
+
+    Each non-empty line (except comments, starting with `#`) has the same
+    arguments as `torrador.py`, like:
+
+        101 12 data/setup.xls --auto --roaster r1 --host 192.168.0.10
+    """
+
+    parser = torrador.get_parser()
+    roasts = []
+    with open(filename, encoding="utf-8") as fobj:
+        for line in fobj:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                roasts.append(parser.parse_args(shlex.split(line)))
+    return roasts
+
+
+class Supervisor:
+    """Drive several roasters from one process, one thread per roaster
+
+    Each roaster has its own connection, setup, controller, recording and
+    Redis channel (`REDIS_CHANNEL:<roaster>`, see `utils.roaster_channel`);
+    the Redis connection pool and everything imported is shared. The work
+    of each tick is mostly waiting for Modbus replies, which releases the
+    GIL, so threads are enough for a few roasters.
+    """
+
+    def __init__(self, roasts, redis=None):
+        names = set()
+        for index, args in enumerate(roasts, start=1):
+            args.roaster = args.roaster or f"torrador{index}"
+            if args.roaster in names:
+                raise ValueError(f"Duplicated roaster name: {args.roaster}")
+            names.add(args.roaster)
+        self.roasts = roasts
+        self.redis = redis
+        self.stop_event = threading.Event()
+        self.errors = {}
+        self._threads = []
+
+    def _run(self, args):
+        logger = torrador.get_logger(args, redis=self.redis)
+        logger.start_roast(args.numero_torra)
+        try:
+            torrador.roast(args, logger, stop=self.stop_event)
+        except Exception as exception:
+            self.errors[args.roaster] = exception
+            logger.log(f"ERRO: {exception!r}")
+        finally:
+            logger.close()
+
+    def start(self):
+        for args in self.roasts:
+            thread = threading.Thread(
+                target=self._run, args=(args,), name=args.roaster, daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def running(self):
+        return [thread.name for thread in self._threads if thread.is_alive()]
+
+    def wait(self, timeout=None):
+        """Wait for every roast to finish (`False` if `timeout` is reached)"""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            thread.join(None if remaining is None else max(0, remaining))
+        return not self.running()
+
+    def stop(self, timeout=None):
+        """End every roast at its next tick"""
+
+        self.stop_event.set()
+        return self.wait(timeout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "roasts_filename", help="One line with the torrador.py arguments per roaster"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=settings.METRICS_PORT,
+        help="Serve Prometheus metrics on this port (see metrics.py)",
+    )
+    args = parser.parse_args()
+
+    roasts = load_roasts(args.roasts_filename)
+    redis = None
+    if any(roast.redis for roast in roasts):
+        redis = Redis(settings.REDIS_HOST, settings.REDIS_PORT, db=settings.REDIS_DB)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    supervisor = Supervisor(roasts, redis=redis)
+    supervisor.start()
+    try:
+        while not supervisor.wait(timeout=1):
+            pass
+    except KeyboardInterrupt:
+        print("Finalizando torras...")
+        supervisor.stop(timeout=30)
+    for name, exception in supervisor.errors.items():
+        print(f"[{name}] ERRO: {exception!r}")
@@ -0,0 +1,238 @@
+import argparse
+import collections
+import concurrent.futures
+import functools
+import itertools
+import math
+import os
+
+import rows
+
+import analytics
+import replay
+import settings
+import utils
+
+
+# Formats `utils.load_setup_file` reads (a recording exported by `torrador.py
+# --export` is a valid setup)
+SETUP_SUFFIXES = (".csv", ".xls")
+
+Configuration = collections.namedtuple(
+    "Configuration", ["control_type", "p", "i", "d", "seconds_ahead"]
+)
+
+
+def parse_values(text, value_type=int):
+    """Grid values from text like `10,20,30` or `10:50:10` (inclusive)"""
+
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if ":" in part:
+            start, stop, *step = [value_type(value) for value in part.split(":")]
+            step = step[0] if step else value_type(1)
+            if step <= 0:
+                raise ValueError(f"Step must be positive: {part}")
+            value = start
+            while value <= stop + step / 1e6:
+                values.append(value)
+                value += step
+        elif part:
+            values.append(value_type(part))
+    return values
+
+
+def grid(control_types, p_values, i_values, d_values, seconds_ahead_values):
+    """Every combination of the parameters (`None` keeps the default)"""
+
+    return [
+        Configuration(*values)
+        for values in itertools.product(
+            control_types,
+            p_values or [None],
+            i_values or [None],
+            d_values or [None],
+            seconds_ahead_values or [None],
+        )
+    ]
+
+
+def configure(configuration, roaster, controller):
+    pid = (configuration.p, configuration.i, configuration.d)
+    if any(value is not None for value in pid):
+        current = roaster.pid_parameters
+        roaster.set_pid_parameters(
+            *[
+                int(current[index]) if value is None else int(value)
+                for index, value in enumerate(pid)
+            ]
+        )
+    if configuration.seconds_ahead is not None:
+        controller.seconds_ahead = configuration.seconds_ahead
+
+
+def evaluate(task):
+    """Replay one roast with one configuration (runs in a worker process)
+
+    Everything is measured until the setup reaches the final temperature;
+    overshoot and time to the final temperature only after the turning
+    points (the replayed one and the setup's).
+    """
+
+    configuration, setup_filename, final_temperature, turning_point = task
+    report = replay.replay(
+        setup_filename,
+        control_type=configuration.control_type,
+        configure=functools.partial(configure, configuration),
+    )
+    since = report.logic.turning_point_seconds
+    reached = report.time_to(final_temperature, since=since)
+    expected = report.setup_time_to(final_temperature, since=turning_point)
+    rms, _ = report.tracking_error(until=expected)
+    return {
+        "rms_error": rms,
+        "overshoot": report.overshoot(since=since, until=expected),
+        "final_delay": (
+            None if reached is None or expected is None else reached - expected
+        ),
+    }
+
+
+def rank(configurations, results):
+    """Aggregate the results of each configuration over every roast, best
+    ones first
+
+    The ranking is by mean tracking error (RMS of the bean temperature
+    minus the setup), then worst overshoot, then mean distance from the
+    setup's time to the final temperature. Configurations that don't reach
+    the final temperature in some roast go to the end.
+    """
+
+    table = []
+    for configuration in configurations:
+        roast_results = results[configuration]
+        errors = [result["rms_error"] for result in roast_results]
+        delays = [
+            result["final_delay"]
+            for result in roast_results
+            if result["final_delay"] is not None
+        ]
+        table.append(
+            {
+                **configuration._asdict(),
+                "rms_error": (
+                    sum(errors) / len(errors) if None not in errors else math.inf
+                ),
+                "overshoot": max(
+                    result["overshoot"] or 0.0 for result in roast_results
+                ),
+                "final_delay": (
+                    sum(abs(delay) for delay in delays) / len(delays)
+                    if delays
+                    else None
+                ),
+                "missed_final": len(roast_results) - len(delays),
+            }
+        )
+    table.sort(
+        key=lambda row: (
+            row["missed_final"],
+            row["rms_error"],
+            row["overshoot"],
+            row["final_delay"] or 0,
+        )
+    )
+    return table
+
+
+def sweep(roast_filenames, configurations, workers=None, progress=None):
+    """Replay every roast with every configuration in a process pool and
+    return the ranking (see `rank`)"""
+
+    roasts = {}
+    for filename in roast_filenames:
+        # Also fills the setup cache, so the workers don't parse the files
+        _, metadata = utils.load_setup_file(
+            filename, interval=1, cache_path=settings.SETUP_CACHE_PATH
+        )
+        if not metadata["final_temperature"]:
+            raise ValueError(f"No final temperature in {filename}")
+        turning_point = metadata["turning_point"]
+        roasts[filename] = (
+            metadata["final_temperature"],
+            turning_point[0] if turning_point else 0,
+        )
+    tasks = [
+        (configuration, filename, *roasts[filename])
+        for configuration in configurations
+        for filename in roast_filenames
+    ]
+
+    workers = workers or os.cpu_count()
+    # Big chunks amortize the communication between the processes (a
+    # replay takes around 0.1s)
+    chunksize = max(1, len(tasks) // (workers * 8))
+    results = collections.defaultdict(list)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        outcomes = executor.map(evaluate, tasks, chunksize=chunksize)
+        for done, (task, result) in enumerate(zip(tasks, outcomes), start=1):
+            results[task[0]].append(result)
+            if progress is not None:
+                progress(done, len(tasks))
+    return rank(configurations, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rank PID and lookahead parameters replaying recorded roasts"
+    )
+    parser.add_argument(
+        "roasts_path",
+        help="Directory with recorded roasts (`torra-*.csv` or .xls) or a file",
+    )
+    parser.add_argument(
+        "--control_type",
+        default="fire-temperature",
+        help="Comma-separated controllers (see `controllers.get_controller`)",
+    )
+    parser.add_argument("--p", type=parse_values, help="Like 10,20,30 or 10:50:10")
+    parser.add_argument("--i", type=parse_values)
+    parser.add_argument("--d", type=parse_values)
+    parser.add_argument(
+        "--seconds-ahead", type=parse_values, help="Lookahead of the setup, in seconds"
+    )
+    parser.add_argument("--workers", type=int, help="Default: number of CPUs")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="Save the whole ranking to this CSV file")
+    args = parser.parse_args()
+
+    roast_filenames = analytics.find_roasts([args.roasts_path], suffixes=SETUP_SUFFIXES)
+    if not roast_filenames:
+        parser.error(f"No roasts found in {args.roasts_path}")
+    configurations = grid(
+        [value.strip() for value in args.control_type.split(",")],
+        args.p,
+        args.i,
+        args.d,
+        args.seconds_ahead,
+    )
+    print(
+        f"{len(configurations)} configurações x {len(roast_filenames)} torras "
+        f"= {len(configurations) * len(roast_filenames)} simulações"
+    )
+
+    def progress(done, total):
+        if done == total or done % max(1, total // 20) == 0:
+            print(f"  {done}/{total}")
+
+    table = sweep(roast_filenames, configurations, args.workers, progress)
+    fields = list(table[0].keys())
+    print("\t".join(fields))
+    for row in table[: args.top]:
+        print(
+            "\t".join("" if row[field] is None else str(row[field]) for field in fields)
+        )
+    if args.output:
+        rows.export_to_csv(rows.import_from_dicts(table), args.output)
+        print(f"Ranking gravado: {args.output}")
@@ -0,0 +1,65 @@
+import csv
+import math
+import pathlib
+import sys
+
+import pytest
+
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+SETUP_FIELDS = (
+    "roast_time",
+    "temp_bean",
+    "temp_air",
+    "temp_fire",
+    "temp_goal",
+    "servo_position",
+)
+
+
+def roast_rows(duration=600, drop_seconds=None):
+    """Rows of a plausible recorded roast: the bean temperature falls after
+    the charge, turns around one minute in and rises until the drop, when
+    the probe goes to the air of the empty drum"""
+
+    drop_seconds = duration - 20 if drop_seconds is None else drop_seconds
+    result = []
+    for seconds in range(duration + 1):
+        if seconds <= drop_seconds:
+            bean = 90 + 110 * math.exp(-seconds / 20) + 0.00032 * seconds**2
+        else:
+            bean = 60.0
+        result.append(
+            {
+                "roast_time": seconds,
+                "temp_bean": int(round(bean)),
+                "temp_air": int(round(bean + 40)),
+                "temp_fire": 380 + seconds // 10,
+                "temp_goal": 0,
+                "servo_position": 15 + min(5, seconds // 120),
+            }
+        )
+    return result
+
+
+def write_roast(filename, roast):
+    with open(filename, mode="w", newline="", encoding="utf8") as fobj:
+        writer = csv.DictWriter(fobj, fieldnames=SETUP_FIELDS)
+        writer.writeheader()
+        writer.writerows(roast)
+    return filename
+
+
+@pytest.fixture
+def setup_filename(tmp_path):
+    return write_roast(tmp_path / "torra-r1-1.csv", roast_rows())
+
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch):
+    import settings
+
+    path = tmp_path / "cache"
+    monkeypatch.setattr(settings, "SETUP_CACHE_PATH", path)
+    return path
@@ -0,0 +1,28 @@
+import analytics
+import sweep
+
+
+def test_find_roasts(tmp_path):
+    for name in (
+        "torra-r1-101.bin",
+        "torra-r1-101.xls",
+        "torra-r1-102.xls",
+        "torra-r1-102.csv",
+        "torra-r1-103.bin",
+        "torra-r1-104.txt",
+        "setup.csv",
+    ):
+        (tmp_path / name).touch()
+
+    found = analytics.find_roasts([tmp_path])
+    assert [path.name for path in found] == [
+        "torra-r1-101.bin",
+        "torra-r1-102.csv",
+        "torra-r1-103.bin",
+    ]
+    # Setups are only read from CSV and XLS files
+    found = analytics.find_roasts([tmp_path], suffixes=sweep.SETUP_SUFFIXES)
+    assert [path.name for path in found] == ["torra-r1-101.xls", "torra-r1-102.csv"]
+    # A file given explicitly doesn't need the `torra-` prefix
+    found = analytics.find_roasts([tmp_path / "setup.csv"], sweep.SETUP_SUFFIXES)
+    assert [path.name for path in found] == ["setup.csv"]
@@ -0,0 +1,109 @@
+import sqlite3
+
+import archive
+import utils
+from conftest import roast_rows, write_roast
+
+
+def test_same_source_twice(tmp_path):
+    with archive.Archive(tmp_path / "torras.sqlite") as roast_archive:
+        first = roast_archive.start_roast(101, source=tmp_path / "torra-101.bin")
+        second = roast_archive.start_roast(101, source=tmp_path / "torra-101.bin")
+        assert first != second
+
+
+def test_drop_unique_source(tmp_path):
+    filename = tmp_path / "torras.sqlite"
+    old_schema = archive.SCHEMA.replace("source TEXT\n", "source TEXT UNIQUE\n")
+    connection = sqlite3.connect(filename)
+    connection.executescript(old_schema)
+    connection.execute(
+        "INSERT INTO roast (id, number, started_at, source) "
+        "VALUES (1, '101', '2024-05-01T10:00:00', 'torra-101.bin')"
+    )
+    connection.execute(
+        "INSERT INTO sample (roast_id, position, roast_time) VALUES (1, 0, 0)"
+    )
+    connection.commit()
+    connection.close()
+
+    with archive.Archive(filename) as roast_archive:
+        roast_archive.start_roast(101, source="torra-101.bin")
+        assert len(roast_archive.roasts(number="101")) == 2
+        assert roast_archive.samples(1)[0]["roast_time"] == 0
+        indexes = {
+            row["name"]
+            for row in roast_archive.connection.execute("PRAGMA index_list(roast)")
+        }
+        assert "roast_source" in indexes
+
+
+def test_parse_name():
+    assert archive.parse_name("data/torra-r1-101.xls") == ("r1", "101")
+    assert archive.parse_name("torra-101.bin") == (None, "101")
+
+
+def test_roast_samples_and_final_temperature(tmp_path, setup_filename):
+    with archive.Archive(tmp_path / "torras.sqlite", commit_interval=50) as archived:
+        roast_id = archived.start_roast(
+            101,
+            setup_filename=setup_filename,
+            control_type="fire-temperature",
+            roaster="r1",
+            started_at="2024-05-01T10:00:00",
+        )
+        for row in roast_rows():
+            archived.append(roast_id, row)
+        archived.finish_roast(roast_id, finished_at="2024-05-01T10:10:00")
+
+        (roast,) = archived.roasts()
+        assert roast["number"] == "101" and roast["roaster"] == "r1"
+        assert roast["setup_hash"] == utils.file_hash(setup_filename)
+        assert roast["finished_at"] == "2024-05-01T10:10:00"
+        assert roast["final_temperature"] == 198
+        samples = archived.samples(roast_id)
+        assert [sample["roast_time"] for sample in samples] == list(range(601))
+        assert samples[0]["temp_bean"] == roast_rows()[0]["temp_bean"]
+
+
+def test_roast_filters(tmp_path, setup_filename):
+    with archive.Archive(tmp_path / "torras.sqlite") as archived:
+        for number, roaster, started_at in (
+            (101, "r1", "2024-05-01T10:00:00"),
+            (102, "r2", "2024-05-01T11:00:00"),
+            (103, "r1", "2024-05-02T09:00:00"),
+        ):
+            archived.start_roast(
+                number,
+                setup_filename=setup_filename if number != 102 else None,
+                roaster=roaster,
+                started_at=started_at,
+            )
+
+        def numbers(**filters):
+            return [roast["number"] for roast in archived.roasts(**filters)]
+
+        assert numbers() == ["103", "102", "101"]  # newest first
+        assert numbers(roaster="r1") == ["103", "101"]
+        assert numbers(until="2024-05-01") == ["102", "101"]  # the whole day
+        assert numbers(since="2024-05-01T10:30") == ["103", "102"]
+        assert numbers(setup=setup_filename) == ["103", "101"]
+        assert numbers(setup=utils.file_hash(setup_filename), limit=1) == ["103"]
+        assert numbers(number=102) == ["102"]
+
+
+def test_import_file(tmp_path):
+    filename = write_roast(tmp_path / "torra-r1-101.csv", roast_rows())
+    with archive.Archive(tmp_path / "torras.sqlite") as archived:
+        roast_id = archived.import_file(filename, control_type="fire-temperature")
+        assert archived.import_file(filename) is None  # already archived
+
+        (roast,) = archived.roasts()
+        assert (roast["id"], roast["number"], roast["roaster"]) == (
+            roast_id,
+            "101",
+            "r1",
+        )
+        assert roast["source"] == str(filename.resolve())
+        assert roast["final_temperature"] == 198
+        assert len(archived.samples(roast_id)) == 601
@@ -0,0 +1,81 @@
+import asyncio
+import struct
+import time
+
+import modbus_tk.defines as cst
+import pytest
+
+from async_machines import AsyncModbusClient
+
+
+async def serve(handler):
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def read_request(reader):
+    header = await reader.readexactly(7)
+    transaction_id, _, length, _ = struct.unpack(">HHHB", header)
+    pdu = await reader.readexactly(length - 1)
+    return transaction_id, pdu
+
+
+def response(transaction_id, pdu):
+    return struct.pack(">HHHB", transaction_id, 0, len(pdu) + 1, 1) + pdu
+
+
+async def answer_once(reader, writer):
+    """Answer one read of a register with 42, then hang up"""
+
+    transaction_id, _ = await read_request(reader)
+    writer.write(response(transaction_id, struct.pack(">BBH", 3, 2, 42)))
+    await writer.drain()
+    writer.close()
+
+
+async def garbage(reader, writer):
+    await read_request(reader)
+    writer.write(b"\x00\x01\x00\x00\x00\x00\x01")  # length 0: not Modbus
+    await writer.drain()
+    await asyncio.sleep(1)
+    writer.close()
+
+
+def test_requests_fail_fast_after_the_connection_is_lost():
+    async def scenario():
+        server, port = await serve(answer_once)
+        client = AsyncModbusClient("127.0.0.1", port, timeout=5)
+        await client.connect()
+        assert await client.execute(1, cst.READ_HOLDING_REGISTERS, 8000, 1) == (42,)
+        await asyncio.sleep(0.1)  # the server hangs up
+
+        assert not client.connected
+        started = time.monotonic()
+        with pytest.raises(ConnectionError):
+            await client.execute(1, cst.READ_HOLDING_REGISTERS, 8000, 1)
+        assert time.monotonic() - started < 1
+        await client.close()
+        server.close()
+
+    asyncio.run(scenario())
+
+
+def test_a_broken_stream_fails_the_pending_requests():
+    async def scenario():
+        server, port = await serve(garbage)
+        client = AsyncModbusClient("127.0.0.1", port, timeout=5)
+        await client.connect()
+
+        started = time.monotonic()
+        with pytest.raises(ConnectionError):
+            await client.execute(1, cst.READ_HOLDING_REGISTERS, 8000, 1)
+        assert time.monotonic() - started < 1
+        assert not client.connected
+
+        # A new connection works again
+        await client.connect()
+        assert client.connected
+        await client.close()
+        server.close()
+
+    asyncio.run(scenario())
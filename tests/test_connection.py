@@ -0,0 +1,97 @@
+import socket
+
+import modbus_tk.defines as cst
+import pytest
+from modbus_tk.exceptions import ModbusError
+
+import connection
+from connection import ModbusConnection, percentile
+from machines import CarmoMaq10
+from simulator import Simulator
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def simulator():
+    simulator = Simulator(port=free_port())
+    simulator.start()
+    yield simulator
+    simulator.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    result = []
+    monkeypatch.setattr(connection.time, "sleep", result.append)
+    return result
+
+
+def read_pid(link):
+    return link.execute(1, cst.READ_HOLDING_REGISTERS, CarmoMaq10.ADDR_PID_P, 3)
+
+
+def test_percentile():
+    assert percentile([], 0.5) is None
+    assert percentile([3, 1, 2], 0.5) == 2
+    assert percentile(list(range(1, 101)), 0.99) == 99
+
+
+def test_latency_stats(simulator):
+    link = ModbusConnection(simulator.host, simulator.port)
+    for _ in range(5):
+        assert read_pid(link) == (30, 5, 0)
+    link.close()
+
+    stats = link.stats()["read_holding_registers"]
+    assert stats["count"] == 5 and stats["errors"] == 0
+    assert 0 < stats["p50"] <= stats["max"]
+
+
+def test_reconnects_when_the_roaster_comes_back(monkeypatch):
+    port = free_port()
+    first, second = Simulator(port=port), Simulator(port=port)
+    first.start()
+    link = ModbusConnection(first.host, port, timeout=1, backoff=0.05)
+    read_pid(link)
+    first.stop()  # like a PLC restart
+    sleeps = []
+
+    def sleep(seconds):
+        if not sleeps:
+            second.start()
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(connection.time, "sleep", sleep)
+    try:
+        assert read_pid(link) == (30, 5, 0)
+    finally:
+        link.close()
+        second.stop()
+    assert link.reconnects == len(sleeps) >= 1
+    assert sleeps[0] == 0.05
+    assert link.stats()["read_holding_registers"]["errors"] == len(sleeps)
+
+
+def test_gives_up_with_exponential_backoff(sleeps):
+    link = ModbusConnection(
+        "127.0.0.1", free_port(), timeout=1, retries=4, backoff=0.5, max_backoff=1.5
+    )
+    with pytest.raises(OSError):
+        read_pid(link)
+
+    assert sleeps == [0.5, 1.0, 1.5, 1.5]
+    assert link.stats()["read_holding_registers"]["errors"] == 5
+
+
+def test_modbus_exceptions_are_not_retried(simulator, sleeps):
+    link = ModbusConnection(simulator.host, simulator.port)
+    with pytest.raises(ModbusError):
+        link.execute(1, cst.READ_HOLDING_REGISTERS, 1, 1)  # not mapped
+
+    assert sleeps == [] and link.reconnects == 0
+    link.close()
@@ -0,0 +1,83 @@
+import json
+import time
+
+from redis.exceptions import ConnectionError
+
+from hub import Hub
+
+
+class FakeSubscription:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def subscribe(self, *channels):
+        pass
+
+    def psubscribe(self, *patterns):
+        pass
+
+    def get_message(self, timeout=None):
+        if self.messages:
+            return self.messages.pop(0)
+        time.sleep(0.01)
+
+    def close(self):
+        pass
+
+
+class FlakyRedis:
+    """Fails to subscribe `failures` times, then delivers `messages`"""
+
+    def __init__(self, failures, messages):
+        self.failures = failures
+        self.messages = messages
+
+    def pubsub(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("Connection refused")
+        return FakeSubscription(self.messages)
+
+
+def message(channel, data):
+    return {"type": "message", "channel": channel.encode(), "data": data}
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_publish_fans_out_by_channel():
+    hub = Hub(None, ["torra"])
+    everything = hub.connect()
+    roaster = hub.connect(channel="torra:r1")
+    hub.publish("torra:r1", json.dumps({"temp_bean": 150}))
+    hub.publish("torra:r2", json.dumps({"temp_bean": 160}))
+
+    assert [item.channel for item in everything.get(0)] == ["torra:r1", "torra:r2"]
+    assert [item.data for item in roaster.get(0)] == [{"temp_bean": 150}]
+    late = hub.connect(since=1)
+    assert [item.channel for item in late.get(0)] == ["torra:r2"]
+
+
+def test_run_retries_and_skips_malformed_messages():
+    redis = FlakyRedis(
+        failures=2,
+        messages=[
+            message("torra", b"{not json"),
+            message("torra", b"[1, 2]"),
+            message("torra", json.dumps({"message": "ok"}).encode()),
+        ],
+    )
+    hub = Hub(redis, ["torra"])
+    hub.retry_delay = (0.01, 0.02)
+    client = hub.connect()
+    hub.start()
+
+    assert wait_for(lambda: hub.received == 1)
+    assert hub.errors == 2
+    assert hub.malformed == 2
+    assert client.get(0)[0].data == {"message": "ok"}
@@ -0,0 +1,35 @@
+import json
+
+import fakeredis
+from redis import Redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from logger import Logger
+
+
+def test_start_roast_with_redis_down():
+    redis = Redis("127.0.0.1", 1, retry=Retry(NoBackoff(), 0))
+    logger = Logger(redis=redis, redis_channel="torra", history_size=100)
+    logger.start_roast(42)
+    logger.log("Conectando ao controlador... ")
+    logger.close()
+
+    assert logger.publisher.stats["errors"] >= 1
+
+
+def test_start_roast_records_the_history():
+    redis = fakeredis.FakeRedis()
+    logger = Logger(redis=redis, redis_channel="torra", history_size=100)
+    logger.start_roast(42)
+    logger.log("Iniciando torra... ")
+    logger.log({"roast_time": 1, "temp_bean": 150}, message_type="data")
+    logger.close()
+
+    assert redis.get("torra:current") == b"42"
+    entries = logger.history.range()
+    assert [json.loads(message)["message_type"] for _, message in entries] == [
+        "text",
+        "data",
+    ]
+    assert logger.publisher.stats["published"] == 2
@@ -0,0 +1,201 @@
+import modbus_tk.defines as cst
+import pytest
+
+import machines
+from machines import CarmoMaq10, RegisterCache, ShadowRegisters, plan_reads
+
+
+class FakeMaster:
+    """Modbus master keeping the registers in dicts and recording requests"""
+
+    def __init__(self):
+        self.values = {cst.COILS: {}, cst.HOLDING_REGISTERS: {}}
+        self.requests = []
+        self.fail = False
+
+    def execute(
+        self, slave, function_code, starting_address, quantity_of_x=0, output_value=0
+    ):
+        self.requests.append((function_code, starting_address, output_value))
+        if self.fail:
+            raise ConnectionError("link down")
+        if function_code in (cst.READ_COILS, cst.READ_HOLDING_REGISTERS):
+            block_type = (
+                cst.COILS if function_code == cst.READ_COILS else cst.HOLDING_REGISTERS
+            )
+            values = self.values[block_type]
+            return tuple(
+                values.get(address, 0)
+                for address in range(starting_address, starting_address + quantity_of_x)
+            )
+        block_type = (
+            cst.COILS
+            if function_code in (cst.WRITE_SINGLE_COIL, cst.WRITE_MULTIPLE_COILS)
+            else cst.HOLDING_REGISTERS
+        )
+        if not isinstance(output_value, (list, tuple)):
+            output_value = [output_value]
+        for address, value in enumerate(output_value, start=starting_address):
+            self.values[block_type][address] = value
+
+    def writes(self):
+        return [
+            request
+            for request in self.requests
+            if request[0] not in (cst.READ_COILS, cst.READ_HOLDING_REGISTERS)
+        ]
+
+
+@pytest.fixture
+def roaster():
+    roaster = CarmoMaq10(shadow=True)
+    roaster._master = FakeMaster()
+    return roaster
+
+
+def test_plan_reads():
+    assert plan_reads([]) == []
+    assert plan_reads([5, 3, 4, 4]) == [(3, 3)]
+    assert plan_reads([1, 2, 5]) == [(1, 2), (5, 1)]
+    assert plan_reads([1, 2, 5], max_gap=2) == [(1, 5)]
+    assert plan_reads(range(10), max_quantity=4) == [(0, 4), (4, 4), (8, 2)]
+
+
+def test_snapshot_plan_covers_the_register_map():
+    reads = CarmoMaq10._plan_snapshot()
+    for block_type, start_address, quantity in CarmoMaq10.REGISTER_MAP:
+        for address in range(start_address, start_address + quantity):
+            assert any(
+                kind == block_type and start <= address < start + size
+                for kind, start, size in reads
+            )
+    assert len(reads) < len(CarmoMaq10.REGISTER_MAP)
+
+
+def test_register_cache_expires(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(machines.time, "monotonic", lambda: now[0])
+    cache = RegisterCache(ttl=1)
+    cache.update(cst.COILS, 10, [True, False])
+
+    assert cache.get(cst.COILS, 10, 2) == [True, False]
+    assert cache.get(cst.COILS, 10, 3) is None
+    now[0] += 2
+    assert cache.get(cst.COILS, 10, 1) is None
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 2
+
+
+def test_shadow_registers_elide_unchanged_values(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(machines.time, "monotonic", lambda: now[0])
+    shadow = ShadowRegisters(refresh=10)
+
+    assert not shadow.unchanged(cst.HOLDING_REGISTERS, 8003, [200])
+    shadow.update(cst.HOLDING_REGISTERS, 8003, [200])
+    assert shadow.unchanged(cst.HOLDING_REGISTERS, 8003, [200])
+    assert not shadow.unchanged(cst.HOLDING_REGISTERS, 8003, [201])
+    now[0] += 11
+    assert not shadow.unchanged(cst.HOLDING_REGISTERS, 8003, [200])
+    assert shadow.stats["elided"] == 1
+
+
+def test_roaster_skips_repeated_writes(roaster):
+    roaster.set_setpoint(200)
+    roaster.set_setpoint(200)
+    roaster.set_setpoint(210)
+
+    assert roaster._master.writes() == [
+        (cst.WRITE_SINGLE_REGISTER, CarmoMaq10.ADDR_SETPOINT, 200),
+        (cst.WRITE_SINGLE_REGISTER, CarmoMaq10.ADDR_SETPOINT, 210),
+    ]
+
+
+def test_batch_merges_contiguous_writes(roaster):
+    with roaster.batch():
+        roaster.set_pid_parameters(10, 20, 30)
+        roaster.set_setpoint(200)
+        roaster.set_mode("recipe")
+        assert roaster._master.writes() == []
+
+    assert roaster._master.writes() == [
+        (cst.WRITE_MULTIPLE_REGISTERS, CarmoMaq10.ADDR_PID_P, [10, 20, 30]),
+        (cst.WRITE_SINGLE_REGISTER, CarmoMaq10.ADDR_SETPOINT, 200),
+        (cst.WRITE_SINGLE_COIL, CarmoMaq10.ADDR_OPERATIONAL_MODE, 0),
+    ]
+
+
+def test_batch_sends_interlocks_right_away(roaster):
+    with roaster.batch():
+        roaster.set_setpoint(200)
+        roaster.set_burner(True)
+        assert roaster._master.writes() == [
+            (cst.WRITE_SINGLE_REGISTER, CarmoMaq10.ADDR_SETPOINT, 200),
+            (cst.WRITE_SINGLE_COIL, CarmoMaq10.ADDR_BURNER, 1),
+        ]
+
+
+def test_batch_failure_raises_and_forgets(roaster):
+    roaster.set_setpoint(200)
+    roaster._master.fail = True
+    with pytest.raises(machines.BatchWriteError):
+        with roaster.batch():
+            roaster.set_setpoint(210)
+
+    assert roaster._batch is None
+    roaster._master.fail = False
+    roaster.set_setpoint(200)  # not skipped: it may not have arrived
+    assert roaster._master.writes()[-1] == (
+        cst.WRITE_SINGLE_REGISTER,
+        CarmoMaq10.ADDR_SETPOINT,
+        200,
+    )
+
+
+def test_interlock_failure_is_raised_by_the_call(roaster):
+    with roaster.batch():
+        roaster._master.fail = True
+        with pytest.raises(machines.BatchWriteError):
+            roaster.set_setpoint(200)
+            roaster.set_burner(False)
+        roaster._master.fail = False
+
+
+def test_interlock_failure_with_nothing_queued(roaster):
+    # Same error as a failed batch, not the connection's own
+    roaster._master.fail = True
+    with roaster.batch():
+        with pytest.raises(machines.BatchWriteError):
+            roaster.set_burner(False)
+        roaster._master.fail = False
+    assert roaster._master.writes()[-1] == (
+        cst.WRITE_SINGLE_COIL,
+        CarmoMaq10.ADDR_BURNER,
+        0,
+    )
+
+
+def test_hold_serves_reads_from_one_snapshot(roaster):
+    roaster._master.values[cst.HOLDING_REGISTERS][CarmoMaq10.ADDR_DATA_WORDS] = 180
+    with roaster.hold() as state:
+        requests = len(roaster._master.requests)
+        assert roaster.data["temp_bean"] == state.data["temp_bean"]
+        roaster.set_setpoint(150)
+        assert roaster.data["temp_goal"] == 150
+        assert roaster.burner is False
+        assert len(roaster._master.writes()) == 1
+        assert len(roaster._master.requests) == requests + 1
+
+
+def test_hold_keeps_the_door_sensors_until_the_next_snapshot(roaster):
+    coils = roaster._master.values[cst.COILS]
+    with roaster.hold():
+        requests = len(roaster._master.requests)
+        roaster.set_burner(True)
+        roaster.open_bean_entrance()
+        # The burner written is held, the sensor still reads the closed door
+        assert roaster.burner is True
+        assert roaster.bean_entrance is False
+        assert len(roaster._master.requests) == requests + 2  # no reads
+    coils[CarmoMaq10.ADDR_READ_BEAN_ENTRANCE] = 1  # the piston moved
+    with roaster.hold():
+        assert roaster.bean_entrance is True
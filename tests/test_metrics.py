@@ -0,0 +1,74 @@
+import urllib.request
+
+import modbus_tk.defines as cst
+from prometheus_client.parser import text_string_to_metric_families
+
+import machines
+import metrics
+
+
+def families():
+    return {
+        family.name: family
+        for family in text_string_to_metric_families(metrics.render())
+    }
+
+
+def test_exposition_is_valid():
+    metrics.MODBUS_SECONDS.labels("r1", "READ_COILS", "16005").observe(0.003)
+    metrics.MODBUS_ERRORS.labels("r1", "READ_COILS", "16005").inc()
+    metrics.LOOP_TICKS.labels("r1").inc()
+    with metrics.RECORD_WRITE_SECONDS.labels("r1").time():
+        pass
+
+    result = families()
+    assert result["carmomaq_modbus_request_seconds"].type == "histogram"
+    assert result["carmomaq_modbus_errors"].type == "counter"
+    buckets = [
+        sample
+        for sample in result["carmomaq_modbus_request_seconds"].samples
+        if sample.name.endswith("_bucket")
+        and sample.labels["roaster"] == "r1"
+        and sample.labels["address"] == "16005"
+    ]
+    assert len(buckets) == len(metrics.DEFAULT_BUCKETS) + 1
+    assert buckets[-1].labels["le"] == "+Inf" and buckets[-1].value >= 1
+    assert any(
+        sample.name == "carmomaq_loop_ticks_total"
+        and sample.labels == {"roaster": "r1"}
+        and sample.value >= 1
+        for sample in result["carmomaq_loop_ticks"].samples
+    )
+
+
+def elided(roaster):
+    return metrics.REGISTRY.get_sample_value(
+        "carmomaq_modbus_writes_elided_total", {"roaster": roaster}
+    )
+
+
+def test_labelled_by_roaster():
+    first = machines.ShadowRegisters(roaster="first")
+    second = machines.ShadowRegisters(roaster="second")
+    unnamed = machines.ShadowRegisters()
+    for shadow in (first, second, unnamed):
+        shadow.update(cst.COILS, 10, [True])
+    assert first.unchanged(cst.COILS, 10, [True])
+    assert first.unchanged(cst.COILS, 10, [True])
+    assert second.unchanged(cst.COILS, 10, [True])
+    assert unnamed.unchanged(cst.COILS, 10, [True])
+
+    assert elided("first") == 2
+    assert elided("second") == 1
+    assert elided("") >= 1
+
+
+def test_serve():
+    server = metrics.serve(0, "127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            content = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+    assert "# TYPE carmomaq_loop_ticks_total counter" in content
@@ -0,0 +1,29 @@
+import json
+
+import pytest
+
+import monitor
+import settings
+from hub import Hub
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    result = Hub(None, [])
+    monkeypatch.setattr(monitor, "hub", result)
+    return result
+
+
+def channels(response):
+    return [message["channel"] for message in response.get_json()["messages"]]
+
+
+def test_message_defaults_to_the_single_roaster(hub):
+    single, other = settings.REDIS_CHANNEL, f"{settings.REDIS_CHANNEL}:r1"
+    hub.publish(single, json.dumps({"type": "data", "content": 1}))
+    hub.publish(other, json.dumps({"type": "data", "content": 2}))
+    client = monitor.app.test_client()
+
+    assert channels(client.get("/message?since=0")) == [single]
+    assert channels(client.get("/message?since=0&roaster=r1")) == [other]
+    assert channels(client.get("/message?since=0&roaster=r2")) == []
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+import replay
+from simulator import Simulator
+from torrador import Preheat
+
+
+@pytest.fixture
+def machine():
+    clock = replay.VirtualClock()
+    simulator = Simulator()
+    clock.listeners.append(lambda seconds: simulator.step(seconds))
+    roaster = replay.ReplayMachine(simulator, clock)
+    roaster.connect()
+    roaster.set_burner(True)
+    return roaster, clock, replay.ReportLogger(clock)
+
+
+def preheat(machine, target, **kwargs):
+    roaster, clock, logger = machine
+    return Preheat(
+        roaster, target, logger, sleep=clock.sleep, clock=clock.time, **kwargs
+    )
+
+
+def test_reaches_the_target(machine):
+    roaster = machine[0]
+    stage = preheat(machine, 320, timeout=900)
+
+    assert stage.run() is True
+    assert abs(roaster.data["temp_fire"] - 320) <= stage.tolerance
+    assert stage.stats["iterations"] < 500
+
+
+def test_abort_turns_the_burner_off(machine):
+    roaster = machine[0]
+    stage = preheat(machine, 600, timeout=60, on_timeout="abort")
+
+    with pytest.raises(RuntimeError):
+        stage.run()
+    assert stage.timed_out
+    assert roaster.burner is False
+
+
+def test_charge_on_timeout_keeps_the_burner(machine):
+    roaster = machine[0]
+    stage = preheat(machine, 600, timeout=60, on_timeout="charge")
+
+    assert stage.run() is False
+    assert roaster.burner is True
+
+
+def test_stop_turns_the_burner_off(machine):
+    roaster, clock, _ = machine
+    stop = threading.Event()
+    clock.listeners.append(lambda seconds: clock.now > 30 and stop.set())
+    stage = preheat(machine, 600, timeout=900, stop=stop)
+
+    assert stage.run() is False
+    assert stage.stopped and not stage.timed_out
+    assert clock.now < 40
+    assert roaster.burner is False
+
+
+@pytest.mark.parametrize(
+    "failing",
+    [
+        replay.cst.WRITE_SINGLE_REGISTER,  # servo, sent with the batch
+        replay.cst.WRITE_SINGLE_COIL,  # burner, sent right away
+        replay.cst.READ_HOLDING_REGISTERS,  # snapshot
+    ],
+)
+def test_link_errors_are_logged_and_retried(machine, monkeypatch, failing):
+    roaster, _, logger = machine
+    execute = roaster._master.execute
+    failures = [3]
+
+    def flaky(slave, function_code, *args, **kwargs):
+        if function_code == failing and failures[0]:
+            failures[0] -= 1
+            raise ConnectionError("link down")
+        return execute(slave, function_code, *args, **kwargs)
+
+    monkeypatch.setattr(roaster._master, "execute", flaky)
+    stage = preheat(machine, 320, timeout=900)
+
+    assert stage.run() is True
+    assert failures == [0]
+    errors = [message for _, message in logger.messages if "Erro" in message]
+    assert len(errors) == 3
@@ -0,0 +1,99 @@
+import collections
+import itertools
+
+import numpy as np
+import pytest
+
+import profiles
+import utils
+
+
+Row = collections.namedtuple("Row", ["roast_time", "temp_bean", "servo_position"])
+
+
+@pytest.fixture
+def setup():
+    return utils.SetupProfile(
+        [Row(0, 100, 10), Row(10, 120, None), Row(20, 100, 20), Row(30, 130, 20)]
+    )
+
+
+def test_resample_linear(setup):
+    profile = profiles.resample(setup, resolution=0.5)
+
+    assert profile.size == 61
+    assert profile.value(5, "temp_bean") == 110
+    assert profile.value(12.5, "temp_bean") == 115
+    assert profile.value(5, "servo_position") == 12.5
+    assert profile.value(99, "temp_bean") == 130
+
+
+def test_resample_previous_reproduces_the_lookup(setup):
+    profile = profiles.resample(setup, method="previous")
+
+    for seconds in range(31):
+        assert profile.value(seconds, "temp_bean") == setup.value(seconds, "temp_bean")
+
+
+def test_resample_spline_goes_through_the_rows(setup):
+    profile = profiles.resample(setup, method="spline")
+
+    for seconds, row in setup.rows.items():
+        assert profile.value(seconds, "temp_bean") == pytest.approx(row.temp_bean)
+
+
+def test_target_looks_ahead(setup):
+    profile = profiles.resample(setup)
+
+    assert profile.target(0, "temp_bean", seconds_ahead=10) == 120
+    assert profile.target(25, "temp_bean", seconds_ahead=10) == 130
+    assert profile.target(5, "temp_bean") == profile.value(5, "temp_bean")
+
+
+def _brute_force(times, values, points):
+    best = None
+    for middle in itertools.combinations(range(1, len(times) - 1), points - 2):
+        indexes = [0, *middle, len(times) - 1]
+        line = np.interp(times, times[indexes], values[indexes])
+        error = np.sum((line - values) ** 2)
+        if best is None or error < best[0]:
+            best = (error, indexes)
+    return best[1]
+
+
+def test_simplify_is_optimal():
+    rng = np.random.default_rng(1)
+    times = np.arange(12, dtype=float)
+    values = np.cumsum(rng.normal(size=12))
+    indexes = _brute_force(times, values, 4)
+
+    result = profiles.simplify(times, values, 4)
+    assert list(result[0]) == list(times[indexes])
+
+
+def test_simplify_keeps_the_corners():
+    times = np.arange(0, 601, dtype=float)
+    values = np.interp(times, [0, 100, 400, 600], [200, 90, 180, 210])
+
+    result_times, result_values = profiles.simplify(times, values, 4)
+    assert list(result_times) == [0, 100, 400, 600]
+    assert list(result_values) == [200, 90, 180, 210]
+
+
+def test_simplify_downsamples_long_curves():
+    times = np.arange(0, 2000, 0.1)
+    values = 100 + np.sqrt(times)
+
+    result_times, _ = profiles.simplify(times, values, 30, max_samples=500)
+    assert len(result_times) == 30
+    assert (result_times[0], result_times[-1]) == (times[0], times[-1])
+
+
+def test_recipe_points(setup_filename):
+    setup, _ = utils.load_setup_file(setup_filename, interval=1)
+    profile = profiles.resample(setup)
+
+    points = profiles.recipe_points(profile, "temp_bean", size=30)
+    assert len(points) == 30
+    assert points[0][0] == 0 and points[-1][0] == 600
+    assert all(type(value) is int for point in points for value in point)
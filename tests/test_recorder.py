@@ -0,0 +1,113 @@
+import csv
+import math
+
+import pytest
+
+import recorder
+from signals import RoastSignals
+
+
+def sample(seconds, **values):
+    return {
+        "roast_time": seconds,
+        "temp_bean": 150,
+        "temp_goal": 200,
+        "servo_position": 10,
+        "roasting": True,
+        "datetime": f"2024-05-01T10:00:{seconds:02d}",
+        "ror_bean": None,
+        **values,
+    }
+
+
+@pytest.fixture
+def record_filename(tmp_path):
+    filename = tmp_path / "torra-1.bin"
+    with recorder.Recorder(filename, chunk=2) as writer:
+        writer.append(sample(0))
+        writer.append(sample(1, temp_goal=201.5, ror_bean=12.25))
+        writer.append(sample(2, servo_position=None, roasting=False))
+    return filename
+
+
+def test_round_trip(record_filename):
+    records = list(recorder.read_records(record_filename))
+
+    assert records == [
+        sample(0),
+        sample(1, temp_goal=201.5, ror_bean=12.25),
+        sample(2, servo_position=None, roasting=False),
+    ]
+    assert type(records[0]["temp_bean"]) is int
+
+
+def test_read_array(record_filename):
+    array = recorder.read_array(record_filename)
+
+    assert len(array) == 3
+    assert list(array["temp_goal"]) == [200, 201.5, 200]
+    assert math.isnan(array["servo_position"][2])
+    assert array["datetime"][0] == b"2024-05-01T10:00:00"
+
+
+def test_readers_trust_the_file_size(record_filename):
+    # A crash may leave the count ahead of the records actually written
+    content = record_filename.read_bytes()
+    record_filename.write_bytes(content[:-10])
+
+    assert len(list(recorder.read_records(record_filename))) == 2
+    assert len(recorder.read_array(record_filename)) == 2
+
+
+def test_export_and_load(record_filename, tmp_path):
+    output = recorder.export(record_filename, tmp_path / "torra-1.csv")
+    with open(output, encoding="utf8") as fobj:
+        exported = list(csv.DictReader(fobj))
+
+    assert exported[0]["temp_bean"] == "150"
+    assert exported[1]["temp_goal"] == "201.5"
+    assert [item["roast_time"] for item in recorder.load(record_filename)] == [
+        0,
+        1,
+        2,
+    ]
+
+
+def test_not_a_record_file(tmp_path):
+    filename = tmp_path / "torra-1.bin"
+    filename.write_bytes(b"\x00" * 100)
+    with pytest.raises(ValueError):
+        list(recorder.read_records(filename))
+
+
+def test_fields_out_of_the_schema_raise(tmp_path):
+    with recorder.Recorder(tmp_path / "torra-1.bin") as writer:
+        writer.append(sample(0))
+        with pytest.raises(ValueError, match="temp_bean_smooth"):
+            writer.append(sample(1, temp_bean_smooth=150.0))
+        writer.append({"roast_time": 2})  # missing fields are recorded as missing
+    records = list(recorder.read_records(tmp_path / "torra-1.bin"))
+
+    assert [record["roast_time"] for record in records] == [0, 2]
+    assert records[1]["temp_bean"] is None
+
+
+def test_smoothed_values_after_a_missing_bean_temperature(tmp_path):
+    roast_signals = RoastSignals()
+    with recorder.Recorder(tmp_path / "torra-1.bin") as writer:
+        writer.append(roast_signals.update(sample(0, temp_bean=None)))
+        writer.append(roast_signals.update(sample(1, temp_bean=150)))
+    records = list(recorder.read_records(tmp_path / "torra-1.bin"))
+
+    assert records[0]["temp_bean_smooth"] is None
+    assert records[1]["temp_bean_smooth"] == 150
+
+
+def test_strings_are_cut_on_a_character_boundary(tmp_path):
+    text = "x" * (recorder.STRING_SIZE - 1) + "ção"  # "ç" crosses the limit
+    with recorder.Recorder(tmp_path / "torra-1.bin") as writer:
+        writer.append(sample(0, datetime=text))
+    (record,) = recorder.read_records(tmp_path / "torra-1.bin")
+
+    assert len(record["datetime"].encode("utf-8")) <= recorder.STRING_SIZE
+    assert text.startswith(record["datetime"])
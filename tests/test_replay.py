@@ -0,0 +1,64 @@
+import pytest
+
+import replay
+import sweep
+from conftest import roast_rows
+
+
+def test_trace_of_the_setup(setup_filename, cache_path):
+    report = replay.replay(setup_filename, trace=roast_rows())
+    summary = report.summary()
+
+    assert summary["ticks"] == 601
+    assert summary["rms_error_temp_bean"] == summary["max_error_temp_bean"] == 0
+    assert summary["turning_point_temp"] == 94
+    assert 100 < summary["turning_point_seconds"] < 130
+    # The beans leave when the final temperature is reached, with the
+    # mixer already running
+    assert summary["bean_exit_seconds"] == 580
+    assert summary["mixer_start_seconds"] < 580
+    since = summary["turning_point_seconds"]
+    assert report.setup_time_to(198, since=since) == 580
+    # The trace is the setup, so it's never early or late
+    reached = report.time_to(190, since=since)
+    assert reached is not None and reached == report.setup_time_to(190, since=since)
+    assert summary["commands_by_name"]["write_bean_exit"] == 1
+
+
+def test_deterministic(setup_filename, cache_path):
+    first = replay.replay(setup_filename, minutes=3)
+    second = replay.replay(setup_filename, minutes=3)
+
+    assert first.commands == second.commands
+    assert first.samples == second.samples
+    seconds = [sample["roast_time"] for sample in first.samples]
+    assert len(seconds) == 181 and seconds == sorted(seconds)
+
+
+@pytest.mark.parametrize(
+    "control_type", ["fire-temperature", "bean-temperature", "servo-position"]
+)
+def test_controllers(setup_filename, cache_path, control_type):
+    report = replay.replay(setup_filename, control_type=control_type, interval=2)
+
+    assert len(report.samples) == 301
+    assert report.first_command("burner").value == 1
+    rms, max_error = report.tracking_error()
+    assert 0 < rms <= max_error
+
+
+def test_sweep_configuration(setup_filename, cache_path):
+    configuration = sweep.Configuration("fire-temperature", 10, None, None, 20)
+    configured = []
+
+    def configure(roaster, controller):
+        sweep.configure(configuration, roaster, controller)
+        configured.append((roaster.pid_parameters, controller.seconds_ahead))
+
+    replay.replay(setup_filename, minutes=1, configure=configure)
+    ((pid, seconds_ahead),) = configured
+    assert int(pid[0]) == 10 and seconds_ahead == 20
+
+    result = sweep.evaluate((configuration, setup_filename, 198, 113))
+    assert set(result) == {"rms_error", "overshoot", "final_delay"}
+    assert result["rms_error"] > 0
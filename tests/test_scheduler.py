@@ -0,0 +1,70 @@
+import pytest
+
+from scheduler import FixedRateScheduler
+
+
+class FakeClock:
+    """Monotonic clock whose `sleep` oversleeps by `late` seconds"""
+
+    def __init__(self, late=0.0):
+        self.now = 100.0
+        self.late = late
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds + self.late
+
+
+def scheduler(clock, **kwargs):
+    return FixedRateScheduler(clock=clock, sleep=clock.sleep, **kwargs).start()
+
+
+def test_no_drift():
+    clock = FakeClock(late=0.01)
+    loop = scheduler(clock, interval=1.0)
+    wakes = []
+    for _ in range(10):
+        clock.now += 0.3  # work
+        loop.wait()
+        wakes.append(round(clock.now - 100, 6))
+
+    # Each wake up is late by the sleep imprecision only, never more
+    assert wakes == [tick + 0.01 for tick in range(1, 11)]
+    assert loop.busy == pytest.approx(0.3)
+    assert loop.period == pytest.approx(1.0)
+    stats = loop.stats()
+    assert stats["ticks"] == 10 and stats["overruns"] == 0
+    assert stats["jitter_max"] == pytest.approx(0.01)
+
+
+def test_skip_missed_deadlines():
+    clock = FakeClock()
+    loop = scheduler(clock, interval=1.0, policy="skip")
+    clock.now += 2.5  # a slow tick
+    loop.wait()
+
+    assert clock.now == 103.0  # back on the grid
+    assert (loop.overruns, loop.skipped) == (1, 2)
+
+
+def test_catch_up_missed_deadlines():
+    clock = FakeClock()
+    loop = scheduler(clock, interval=1.0, policy="catch-up")
+    clock.now += 2.5
+    wakes = []
+    for _ in range(3):
+        loop.wait()
+        wakes.append(clock.now - 100)
+
+    # The missed deadline (2.0) runs right away, then the schedule is kept
+    assert wakes == [2.5, 2.5, 3.0]
+    assert (loop.overruns, loop.skipped) == (2, 0)
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        FixedRateScheduler(interval=0)
+    with pytest.raises(ValueError):
+        FixedRateScheduler(policy="later")
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from signals import (
+    EMA,
+    MovingMedian,
+    RateOfRise,
+    RingBuffer,
+    RoastSignals,
+    TurningPointDetector,
+)
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(3)
+    assert buffer.oldest is None and buffer.newest is None
+    replaced = [buffer.append(value) for value in range(5)]
+
+    assert replaced == [None, None, None, 0, 1]
+    assert list(buffer) == [2, 3, 4]
+    assert (buffer.oldest, buffer.newest, len(buffer)) == (2, 4, 3)
+
+
+def test_moving_median_removes_spikes():
+    median = MovingMedian(5)
+    results = [median.update(value) for value in [100, 101, 500, 102, 103, 104]]
+
+    assert max(results) < 110
+
+
+def test_ema():
+    ema = EMA(alpha=0.5)
+    assert [ema.update(value) for value in (10, 20, 20)] == [10, 15, 17.5]
+    with pytest.raises(ValueError):
+        EMA(alpha=0)
+
+
+@pytest.mark.parametrize("interval", [0.25, 1, 2, 5])
+def test_rate_of_rise_over_the_window_at_any_interval(interval):
+    ror = RateOfRise(window=30)
+    seconds = 0
+    while seconds <= 120:
+        # 10 degrees/minute, then 20 degrees/minute after 60 seconds
+        value = 100 + seconds / 6 + max(0, seconds - 60) / 6
+        rate = ror.update(seconds, value)
+        seconds += interval
+
+    assert rate == pytest.approx(20)
+
+
+def test_rate_of_rise_with_irregular_samples():
+    ror = RateOfRise(window=10)
+    seconds = 0.0
+    for step in [0.2, 1.7, 0.4, 2.0, 0.9, 1.3, 0.2, 2.0, 1.1, 0.6, 1.9, 0.8]:
+        seconds += step
+        rate = ror.update(seconds, 2 * seconds)  # 120 degrees/minute
+
+    assert rate == pytest.approx(120)
+    assert ror.samples[0][0] <= seconds - 10 < ror.samples[1][0]
+
+
+def test_rate_of_rise_restarts_with_the_roast():
+    ror = RateOfRise(window=30)
+    for seconds in range(40):
+        ror.update(seconds, 200 - seconds)
+    assert ror.update(0, 100) == 0.0
+    assert ror.update(0, 101) == 0.0  # the time didn't move
+    assert ror.update(6, 102) == pytest.approx(20)
+
+
+def test_turning_point_ignores_noise():
+    random.seed(1)
+    detector = TurningPointDetector(rise=1.5)
+    for seconds in range(300):
+        temperature = 200 - seconds if seconds < 100 else 100 + (seconds - 100) / 4
+        detector.update(seconds, temperature + random.choice((-0.5, 0, 0.5)))
+
+    assert detector.found
+    assert 95 <= detector.seconds <= 105
+    assert detector.temperature < 101
+
+
+def test_roast_signals_without_bean_temperature():
+    roast_signals = RoastSignals()
+    data = roast_signals.update(
+        {"roast_time": 0, "temp_bean": None, "temp_air": 250, "temp_fire": 400}
+    )
+
+    assert data["ror_bean"] == 0.0
+    assert data["temp_bean_smooth"] is None
+    assert data["temp_air_smooth"] == 250
+
+    for seconds in range(1, 61):
+        data = roast_signals.update(
+            {"roast_time": seconds, "temp_bean": 100 + seconds / 6}
+        )
+    assert data["ror_bean"] == pytest.approx(10, abs=0.5)
@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+import machines
+import settings
+import supervisor
+
+
+@pytest.fixture
+def roasts_filename(tmp_path, setup_filename, cache_path, monkeypatch):
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    monkeypatch.setattr(settings, "DATA_PATH", data_path)
+    monkeypatch.setattr(settings, "ARCHIVE_FILENAME", data_path / "torras.sqlite")
+    filename = tmp_path / "torras.txt"
+    filename.write_text(
+        "# number, minutes, setup and options, like torrador.py\n"
+        f"101 0.01 {setup_filename} --fake --interval 0.1 --roaster r1\n"
+        "\n"
+        f"102 0.01 {setup_filename} --fake --interval 0.1\n",
+        encoding="utf-8",
+    )
+    return filename
+
+
+def test_load_roasts(roasts_filename):
+    roasts = supervisor.load_roasts(roasts_filename)
+
+    assert [args.numero_torra for args in roasts] == ["101", "102"]
+    assert [args.roaster for args in roasts] == ["r1", None]
+    assert all(args.fake for args in roasts)
+
+
+def test_names(roasts_filename):
+    roasts = supervisor.load_roasts(roasts_filename)
+    assert [args.roaster for args in supervisor.Supervisor(roasts).roasts] == [
+        "r1",
+        "torrador2",
+    ]
+
+    roasts = supervisor.load_roasts(roasts_filename)
+    roasts[1].roaster = "r1"
+    with pytest.raises(ValueError, match="r1"):
+        supervisor.Supervisor(roasts)
+
+
+def test_roasts_run_concurrently(roasts_filename):
+    roasts = supervisor.Supervisor(supervisor.load_roasts(roasts_filename))
+    roasts.start()
+
+    assert roasts.wait(timeout=30)
+    assert roasts.errors == {}
+    assert sorted(path.name for path in settings.DATA_PATH.glob("*.bin")) == [
+        "torra-r1-101.bin",
+        "torra-torrador2-102.bin",
+    ]
+
+
+def test_stop_while_waiting_for_the_beans(roasts_filename, monkeypatch):
+    # Nobody opens the hopper of the manual roasts
+    monkeypatch.setattr(machines.FakeMachine, "close_bean_entrance", lambda self: None)
+    burners = []
+    monkeypatch.setattr(
+        machines.FakeMachine,
+        "set_burner",
+        lambda self, value: burners.append(value),
+    )
+    roasts = supervisor.Supervisor(supervisor.load_roasts(roasts_filename))
+    roasts.start()
+    time.sleep(0.5)
+    assert sorted(roasts.running()) == ["r1", "torrador2"]
+
+    assert roasts.stop(timeout=5)
+    assert roasts.errors == {}
+    assert burners[-2:] == [False, False]
+    assert not list(settings.DATA_PATH.glob("*.bin"))
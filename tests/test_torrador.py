@@ -0,0 +1,46 @@
+import pytest
+
+import archive
+import replay
+import settings
+import torrador
+
+
+@pytest.fixture
+def data_path(tmp_path, monkeypatch, cache_path):
+    path = tmp_path / "data"
+    path.mkdir()
+    monkeypatch.setattr(settings, "DATA_PATH", path)
+    monkeypatch.setattr(settings, "ARCHIVE_FILENAME", path / "torras.sqlite")
+    return path
+
+
+def run(setup_filename, *arguments):
+    args = torrador.get_parser().parse_args(
+        ["101", "0.01", str(setup_filename), "--fake", "--interval", "0.1"]
+        + list(arguments)
+    )
+    logger = replay.ReportLogger(replay.VirtualClock())
+    torrador.roast(args, logger)
+    return [message for _, message in logger.messages]
+
+
+def test_roast_number_run_again(setup_filename, data_path):
+    run(setup_filename, "--roaster", "r1")
+    messages = run(setup_filename, "--roaster", "r1")
+
+    assert any("arquivada" in message for message in messages)
+    with archive.Archive(settings.ARCHIVE_FILENAME) as roast_archive:
+        roasts = roast_archive.roasts(number="101")
+        assert len(roasts) == 2
+        assert roasts[0]["source"] == roasts[1]["source"]
+        assert all(roast_archive.samples(roast["id"]) for roast in roasts)
+
+
+def test_archive_errors_dont_stop_the_roast(setup_filename, data_path, monkeypatch):
+    # A directory can't be opened as a database
+    monkeypatch.setattr(settings, "ARCHIVE_FILENAME", data_path)
+    messages = run(setup_filename)
+
+    assert any("torra não arquivada" in message for message in messages)
+    assert (data_path / "torra-101.bin").exists()
@@ -0,0 +1,77 @@
+import os
+import threading
+
+import utils
+
+
+def test_load_setup_file_with_empty_cache(setup_filename, cache_path):
+    setup, metadata = utils.load_setup_file(
+        setup_filename, interval=1, cache_path=cache_path
+    )
+
+    assert setup.end == 600
+    assert metadata["final_temperature"] == 198
+    assert metadata["turning_point"] == (113, 94)
+    assert len(list(cache_path.glob("setup-*.pickle"))) == 1
+
+
+def test_load_setup_file_reuses_the_cache(setup_filename, cache_path):
+    expected = utils.load_setup_file(setup_filename, interval=1, cache_path=cache_path)
+    # A touched (but unchanged) file keeps its entry, checked by the hash
+    stat = setup_filename.stat()
+    os.utime(setup_filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    setup, metadata = utils.load_setup_file(
+        setup_filename, interval=1, cache_path=cache_path
+    )
+
+    assert metadata == expected[1]
+    assert setup.value(300, "temp_bean") == expected[0].value(300, "temp_bean")
+
+
+def test_load_setup_file_recompiles_a_changed_file(setup_filename, cache_path):
+    utils.load_setup_file(setup_filename, interval=1, cache_path=cache_path)
+    with open(setup_filename, mode="a", encoding="utf8") as fobj:
+        fobj.write("601,60,100,440,0,20\n")
+    setup, _ = utils.load_setup_file(setup_filename, interval=1, cache_path=cache_path)
+
+    assert setup.end == 601
+
+
+def test_setup_profile_forward_fills(setup_filename):
+    setup, _ = utils.load_setup_file(setup_filename, interval=15)
+
+    assert setup.value(20, "temp_bean") == setup[15].temp_bean
+    assert setup.value(10_000, "temp_bean") == setup[600].temp_bean
+    assert setup.value(-1, "temp_bean") is None
+
+
+def test_load_setup_file_from_several_threads(setup_filename, cache_path):
+    # Roasters started together by the supervisor may share a setup
+    barrier = threading.Barrier(8)
+    results, errors = [], []
+
+    def load():
+        barrier.wait()
+        try:
+            results.append(
+                utils.load_setup_file(setup_filename, interval=1, cache_path=cache_path)
+            )
+        except Exception as exception:
+            errors.append(exception)
+
+    for _ in range(5):
+        for path in cache_path.glob("*"):
+            path.unlink()
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert not errors
+    assert len(results) == 40
+    assert [path.suffix for path in cache_path.iterdir()] == [".pickle"]
+    _, metadata = utils.load_setup_file(
+        setup_filename, interval=1, cache_path=cache_path
+    )
+    assert all(result[1] == metadata for result in results)
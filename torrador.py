@@ -1,56 +1,392 @@
 ﻿# encoding: utf-8
 
 import argparse
-import csv
+import collections
 import datetime
-import os
+import sqlite3
 import sys
 import time
 
-import rows
 import rows.utils
 
+import archive
 import controllers
 import machines
+import metrics
+import recorder
+import scheduler
 import settings
+import signals
 import utils
+from connection import ModbusConnection, percentile
 from logger import Logger
 
 # TODO: we may reproduce other features than temperature (like burner on/off)
 # during roasting
 # TODO: must close cylinder if `roaster.automatic`, even on manual mode
-# TODO: `utils.max_temp` is getting a wrong temperature
 # TODO: if on `--auto` and the time for this roast is taking more than the
 # setup, will get zero values and the roast may never finish
 # TODO: add debug logs on roaster actions
 
 
-def roast(args, logger):
+class RoastLogic:
+    """Decisions taken at each tick of the roast (also used by `replay.py`)
+
+    Filters the sensor data (adding the smoothed values and the rate of
+    rise to it, see `signals.RoastSignals`), detects the turning point and,
+    with a `controller` (automatic mode), steps it, starts the mixer/cooler
+    near the final temperature and opens (then closes) the bean exit when
+    it's reached.
+    """
+
+    show_interval = 15
+    start_mixer_remaining_degrees = 5
+
+    def __init__(
+        self, roaster, setup, logger, last_setup_temperature, controller=None
+    ):
+        self.roaster = roaster
+        self.setup = setup
+        self.logger = logger
+        self.last_setup_temperature = last_setup_temperature
+        self.controller = controller
+        self.passed_turning_point = False
+        self.turning_point_temp = 0
+        self.turning_point_seconds = None
+        self.opened_bean_exit = 99999999
+        self.signals = signals.RoastSignals()
+        if controller is not None:
+            controller.signals = self.signals
+            self.controller_step_seconds = metrics.CONTROLLER_STEP_SECONDS.labels(
+                metrics.roaster_label(logger.name), type(controller).__name__
+            )
+
+    def tick(self, data):
+        roaster, logger = self.roaster, self.logger
+        seconds = int(data["roast_time"])
+
+        if roaster.automatic and seconds > 30 and roaster.bean_entrance:
+            try:
+                roaster.close_bean_entrance()
+            except:
+                logger.log("Error trying to close bean entrance.")
+
+        self.signals.update(data)
+        current_bean_temperature = int(data["temp_bean"])
+        turning_point = self.signals.turning_point
+        if not self.passed_turning_point and turning_point.found:
+            self.passed_turning_point = True
+            self.turning_point_temp = int(round(turning_point.temperature))
+            self.turning_point_seconds = turning_point.seconds
+
+        if self.controller is not None:
+            with self.controller_step_seconds.time():
+                self.controller.step(
+                    seconds, self.passed_turning_point
+                )  # Set next temperature goal
+
+            if self.passed_turning_point:
+                delta_temperature = (
+                    self.last_setup_temperature - current_bean_temperature
+                )
+
+                # Automatically start mixer when finishing roast
+                if delta_temperature <= self.start_mixer_remaining_degrees:
+                    roaster.set_alarm(current_bean_temperature)
+                    if not roaster.mixer:
+                        roaster.set_mixer(True)
+                    if not roaster.cooler:
+                        roaster.set_cooler(True)
+                    if roaster.cooler_exit:
+                        try:
+                            roaster.close_cooler_exit()
+                        except:
+                            logger.log("FECHE A SAÍDA DO MEXEDOR!")
+
+                # Automatically open bean exit if final temperature is met
+                if self.last_setup_temperature <= current_bean_temperature:
+                    roaster.set_alarm(current_bean_temperature)
+                    if not roaster.bean_exit:
+                        try:
+                            roaster.set_burner(False)
+                        except machines.BatchWriteError:
+                            # The beans must leave anyway
+                            logger.log("APAGUE A CHAMA!")
+                        try:
+                            roaster.open_bean_exit()
+                            self.opened_bean_exit = seconds
+                        except:
+                            logger.log("ABRA O TAMBOR!")
+
+                # Automatically close bean exit after openning it
+                if seconds - self.opened_bean_exit >= 30:
+                    if roaster.bean_exit:
+                        try:
+                            roaster.close_bean_exit()
+                        except:
+                            logger.log("FECHE O TAMBOR!")
+
+        if seconds % self.show_interval == 0:
+            logger.log_stats(data, self.setup, self.turning_point_temp)
+
+
+class Preheat:
+    """Bring the fire to the setup's initial temperature before charging
+
+    Each iteration reads everything in one snapshot (`roaster.hold`) and
+    sends its writes together (`roaster.batch`, unchanged values are
+    skipped). The servo moves in proportion to the error expected
+    `horizon` seconds ahead, from the measured slope of the fire
+    temperature, so it slows down before overshooting; the burner is off
+    while the fire is too hot. The wait between iterations gets shorter as
+    the target gets closer.
+
+    It's done when the temperature is within `tolerance` degrees of the
+    target (or crosses it); after `timeout` seconds it either goes on with
+    the roast anyway or raises `RuntimeError`, as `on_timeout` says. When
+    it doesn't go on with the roast (aborted, `stop` set or an error) the
+    burner is turned off. An iteration whose reads or writes fail (the
+    link is down even after the connection's own retries) is logged and
+    retried after the longest wait.
+    """
+
+    # Failed batches (including the burner, see `UNBATCHED_WRITES`) and
+    # reads that `ModbusConnection` gave up on
+    RETRY_EXCEPTIONS = (machines.BatchWriteError,) + ModbusConnection.RETRY_EXCEPTIONS
+    servo_range = (10, 25)
+    gain = 0.25  # servo percent per degree of expected error
+    max_step = 5  # servo percent per iteration
+    horizon = 30  # seconds
+    interval_range = (0.2, 2.0)  # seconds
+
+    def __init__(
+        self,
+        roaster,
+        target,
+        logger,
+        tolerance=settings.PREHEAT_TOLERANCE,
+        timeout=settings.PREHEAT_TIMEOUT,
+        on_timeout=settings.PREHEAT_ON_TIMEOUT,
+        sleep=time.sleep,
+        clock=time.monotonic,
+        stop=None,
+    ):
+        if on_timeout not in ("charge", "abort"):
+            raise ValueError(f"Unknown timeout policy: {on_timeout}")
+        self.roaster = roaster
+        self.target = target
+        self.logger = logger
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.sleep = sleep
+        self.clock = clock
+        self.stop = stop  # a `threading.Event` (see `roast`)
+        self.slope = signals.RateOfRise(window=10)
+        self.servo = None
+        self.error = None
+        self.initial_error = None
+        self.converged = False
+        self.timed_out = False
+        self.stopped = False
+        self.iterations = 0
+        self.elapsed = 0.0
+        self.busy = collections.deque(maxlen=1000)  # seconds per iteration
+
+    def _step(self, elapsed):
+        """One iteration; returns the seconds to wait (`None` when done)"""
+
+        roaster = self.roaster
+        with roaster.hold() as state, roaster.batch():
+            temperature = state.data["temp_fire"]
+            if self.servo is None:
+                self.servo = state.data["servo_position"]
+                self.initial_error = self.target - temperature
+            self.error = self.target - temperature
+            slope = self.slope.update(elapsed, temperature) / 60  # per second
+            if abs(self.error) <= self.tolerance or self.error * self.initial_error < 0:
+                return None
+
+            if state.bean_exit:
+                try:
+                    roaster.close_bean_exit()
+                except:
+                    self.logger.log("ERRO: feche o cilindro")
+            expected_error = self.target - (temperature + slope * self.horizon)
+            step = max(-self.max_step, min(self.max_step, self.gain * expected_error))
+            self.servo = max(
+                self.servo_range[0], min(self.servo_range[1], self.servo + step)
+            )
+            roaster.set_burner(self.error > 0)
+            roaster.set_servo_position(int(round(self.servo)))
+
+        if slope and self.error * slope > 0:  # going to the target
+            remaining = self.error / slope
+        else:
+            remaining = float("inf")
+        return max(self.interval_range[0], min(self.interval_range[1], remaining / 4))
+
+    def run(self):
+        """Preheat, returning whether the target was reached (check
+        `stopped` before going on with the roast)"""
+
+        charge = False
+        try:
+            self._run()
+            self.log_stats()
+            if self.timed_out and self.on_timeout == "abort":
+                raise RuntimeError(
+                    f"Pré-aquecimento não chegou a {self.target} em {self.timeout}s"
+                )
+            charge = not self.stopped
+            return self.converged
+        finally:
+            if not charge:
+                self._turn_burner_off()
+
+    def _run(self):
+        start = self.clock()
+        while not self.converged and not self.timed_out:
+            if self.stop is not None and self.stop.is_set():
+                self.stopped = True
+                break
+            iteration_start = self.clock()
+            try:
+                wait = self._step(iteration_start - start)
+            except self.RETRY_EXCEPTIONS as exception:
+                self.logger.log(f"Erro comunicando com o torrador: {exception!r}")
+                wait = self.interval_range[1]
+            self.iterations += 1
+            self.busy.append(self.clock() - iteration_start)
+            self.elapsed = self.clock() - start
+            if wait is None:
+                self.converged = True
+            elif self.timeout is not None and self.elapsed >= self.timeout:
+                self.timed_out = True
+            else:
+                self.sleep(wait)
+
+    def _turn_burner_off(self):
+        try:
+            self.roaster.set_burner(False)
+        except Exception:
+            self.logger.log("ERRO: desligue a chama!")
+
+    @property
+    def stats(self):
+        busy = list(self.busy)
+        return {
+            "converged": self.converged,
+            "timed_out": self.timed_out,
+            "iterations": self.iterations,
+            "elapsed": self.elapsed,
+            "error": self.error,
+            "busy_mean": sum(busy) / len(busy) if busy else None,
+            "busy_p99": percentile(busy, 0.99),
+        }
+
+    def log_stats(self):
+        stats = self.stats
+        if stats["converged"]:
+            result = "atingida"
+        elif self.stopped:
+            result = "NÃO ATINGIDA (interrompido)"
+        else:
+            result = "NÃO ATINGIDA (tempo esgotado)"
+        self.logger.log(
+            f"  Temperatura do fogo {result}: erro {stats['error']}, "
+            f"{stats['iterations']} ciclos em {stats['elapsed']:.1f}s"
+        )
+        if stats["iterations"]:
+            self.logger.log(
+                f"  Ciclos de pré-aquecimento: médio "
+                f"{stats['busy_mean'] * 1000:.1f} ms, "
+                f"p99 {stats['busy_p99'] * 1000:.1f} ms"
+            )
+
+
+def start_archive(args, logger, setup_final_temperature, record_filename):
+    """Register the roast in the archive, returning `(archive, roast ID)`
+
+    Both are `None` when the archive is disabled or fails: the roast goes
+    on anyway (the recording has every sample).
+    """
+
+    if not settings.ARCHIVE_FILENAME:
+        return None, None
+    roast_archive = None
+    try:
+        roast_archive = archive.Archive()
+        roast_id = roast_archive.start_roast(
+            args.numero_torra,
+            setup_filename=args.setup_filename,
+            control_type=args.control_type if args.auto else None,
+            roaster=args.roaster,
+            setup_final_temperature=setup_final_temperature,
+            source=record_filename.resolve(),
+        )
+    except sqlite3.Error as exception:
+        logger.log(f"Erro no arquivo de torras, torra não arquivada: {exception!r}")
+        if roast_archive is not None:
+            roast_archive.connection.close()
+        return None, None
+    return roast_archive, roast_id
+
+
+def finish_archive(roast_archive, roast_id, logger):
+    """Save what is pending in the archive (`False` if it fails)"""
+
+    try:
+        roast_archive.finish_roast(roast_id)
+        roast_archive.close()
+    except sqlite3.Error as exception:
+        logger.log(f"Erro no arquivo de torras: {exception!r}")
+        roast_archive.connection.close()
+        return False
+    return True
+
+
+def roast(args, logger, stop=None):
+    """Run one roast; `stop` (a `threading.Event`) ends it before the time"""
+
     control_type = args.control_type
     numero_torra = args.numero_torra
     minutos_totais = args.minutos_totais
     total_time = minutos_totais * 60
-    show_interval = 15
-    wait_interval = 1
     setup_interval = 1
-    start_mixer_remaining_degrees = 5
-    setup = utils.load_setup(args.setup_filename, interval=setup_interval)
-    last_setup_temperature = args.last_bean_temperature or utils.max_temp(
-        args.setup_filename
+    setup, setup_metadata = utils.load_setup_file(
+        args.setup_filename,
+        interval=setup_interval,
+        cache_path=settings.SETUP_CACHE_PATH,
+    )
+    last_setup_temperature = (
+        args.last_bean_temperature or setup_metadata["final_temperature"]
     )
-    last_setup_time = max(setup.keys())
-    hour, minute, second = [int(part) for part in last_setup_time.split(":")]
-    last_setup_seconds = hour * 3600 + minute * 60 + second
+    last_setup_seconds = setup.end
 
 
     logger.log("Conectando ao controlador... ")
     if not args.fake:
-        roaster = machines.CarmoMaq10(settings.ROASTER_HOST, settings.ROASTER_PORT)
+        roaster = machines.CarmoMaq10(
+            args.host,
+            args.port,
+            cache_ttl=settings.ROASTER_CACHE_TTL,
+            shadow=settings.ROASTER_SHADOW_WRITES,
+            shadow_refresh=settings.ROASTER_SHADOW_REFRESH,
+            name=args.roaster,
+        )
     else:
         roaster = machines.FakeMachine()
     roaster.connect()
     logger.log("  Conectado ao controlador!")
 
+    # Registered before charging: an archive error must not stop a roast
+    # with the beans in the drum
+    record_name = f"{args.roaster}-{numero_torra}" if args.roaster else numero_torra
+    record_filename = settings.DATA_PATH / f"torra-{record_name}.bin"
+    roast_archive, roast_id = start_archive(
+        args, logger, last_setup_temperature, record_filename
+    )
 
     if not roaster.cylinder:
         logger.log("Ligando cilindro... ")
@@ -87,6 +423,7 @@ def roast(args, logger):
         logger.log("  Saída do mexedor fechada!")
 
     if not args.auto:
+        controller = None
         logger.log("TORRANDO NO MODO MANUAL")
         logger.log("Alterando torrador para manual...")
         roaster.set_mode("manual")
@@ -97,6 +434,16 @@ def roast(args, logger):
         if args.fake:
             roaster.close_bean_entrance()
         while not roaster.bean_entrance:
+            if stop is not None and stop.is_set():
+                logger.log("Torra interrompida antes da carga, apagando chama...")
+                try:
+                    roaster.set_burner(False)
+                except Exception:
+                    logger.log("ERRO: desligue a chama!")
+                if roast_archive is not None:
+                    finish_archive(roast_archive, roast_id, logger)
+                roaster.close()
+                return
             time.sleep(0.05)
 
         logger.log("Iniciando torra... ")
@@ -109,7 +456,7 @@ def roast(args, logger):
         controller = controllers.get_controller(control_type)(roaster, setup, logger)
         controller.before_start()
 
-        initial = setup["00:00:00"]
+        initial = setup.initial
         logger.log(
             f"Temperaturas iniciais do setup - GRÃO: {initial.temp_bean}, "
             f"AR:  {initial.temp_air}, "
@@ -118,42 +465,14 @@ def roast(args, logger):
         logger.log("Ajustando temperaturas para iniciar...")
 
         roaster.set_mode("manual")
-        drop_temp = initial.temp_fire
-        if roaster.data["temp_fire"] <= drop_temp:
-            direction = "up"
-        else:
-            direction = "down"
-        while True:
-            data = roaster.data
-            current_temp = data["temp_fire"]
-            servo_position = data["servo_position"]
-            if current_temp == drop_temp:
-                break
-
-            elif current_temp < drop_temp:
-                if direction == "down":
-                    break
-
-                if roaster.bean_exit:
-                    try:
-                        roaster.close_bean_exit()
-                    except:
-                        logger.log("ERRO: feche o cilindro")
-                servo_position += 3
-                if servo_position < 10:
-                    servo_position = 10
-                elif servo_position > 25:
-                    servo_position = 25
-                roaster.set_burner(True)
-                roaster.set_servo_position(servo_position)
-
-            elif current_temp >= drop_temp:
-                if direction == "up":
-                    break
-
-                roaster.set_burner(False)
-
-            time.sleep(0.1)
+        preheat = Preheat(roaster, initial.temp_fire, logger, stop=stop)
+        preheat.run()
+        if preheat.stopped:
+            logger.log("Pré-aquecimento interrompido, chama apagada.")
+            if roast_archive is not None:
+                finish_archive(roast_archive, roast_id, logger)
+            roaster.close()
+            return
 
         if roaster.bean_exit:
             roaster.close_bean_exit()
@@ -169,109 +488,109 @@ def roast(args, logger):
         logger.log("  Torra iniciada!")
         logger.log(f"Temperatura final: {last_setup_temperature}")
 
-    csv_filename = str(settings.DATA_PATH / f"torra-{numero_torra}.csv")
-    xls_filename = str(settings.DATA_PATH / f"torra-{numero_torra}.xls")
-    with open(csv_filename, mode="w", encoding="utf8") as fobj:
-        writer = None
+    with recorder.Recorder(record_filename) as writer:
         finished = False
-        passed_turning_point = False
-        turning_point_temp = 0
-        opened_bean_exit = 99999999
-        last_bean_temperature = 999999999
-        start_time = time.time()
+        logic = RoastLogic(
+            roaster,
+            setup,
+            logger,
+            last_setup_temperature,
+            controller=controller,
+        )
+        loop = scheduler.FixedRateScheduler(args.interval, args.late_policy).start()
+        label = metrics.roaster_label(args.roaster)
 
         try:
             while not finished:
-                start_loop = time.time()
-
-                data = roaster.data
-                data["datetime"] = utils.pretty_now()
-                if writer is None:
-                    writer = csv.DictWriter(fobj, fieldnames=list(data.keys()),)
-                    writer.writeheader()
-                writer.writerow(data)
-                logger.log(data, message_type="data")
-
-                seconds = int(data["roast_time"])
-
-                if roaster.automatic and seconds > 30 and roaster.bean_entrance:
-                    try:
-                        roaster.close_bean_entrance()
-                    except:
-                        logger.log("Error trying to close bean entrance.")
-
-                current_bean_temperature = int(data["temp_bean"])
-                if (
-                    not passed_turning_point
-                    and seconds > 10
-                    and last_bean_temperature < current_bean_temperature
-                ):
-                    passed_turning_point = True
-                    turning_point_temp = current_bean_temperature
-
-                if args.auto:
-                    controller.step(
-                        seconds, passed_turning_point
-                    )  # Set next temperature goal
-
-                    if passed_turning_point:
-                        delta_temperature = (
-                            last_setup_temperature - current_bean_temperature
-                        )
-
-                        # Automatically start mixer when finishing roast
-                        if delta_temperature <= start_mixer_remaining_degrees:
-                            roaster.set_alarm(current_bean_temperature)
-                            if not roaster.mixer:
-                                roaster.set_mixer(True)
-                            if not roaster.cooler:
-                                roaster.set_cooler(True)
-                            if roaster.cooler_exit:
-                                try:
-                                    roaster.close_cooler_exit()
-                                except:
-                                    logger.log("FECHE A SAÍDA DO MEXEDOR!")
-
-                        # Automatically open bean exit if final temperature is met
-                        if last_setup_temperature <= current_bean_temperature:
-                            roaster.set_alarm(current_bean_temperature)
-                            if not roaster.bean_exit:
-                                roaster.set_burner(False)
+                # One snapshot per tick serves every read below and the
+                # writes are sent together at the end of the tick (a write
+                # that fails is logged, like in `RoastLogic.tick`)
+                try:
+                    with roaster.hold(), roaster.batch():
+                        data = roaster.data
+                        data["datetime"] = utils.pretty_now()
+                        # The tick adds the filtered signals to `data`
+                        logic.tick(data)
+
+                        with metrics.RECORD_WRITE_SECONDS.labels(label).time():
+                            writer.append(data)
+                            writer.flush()
+                            if roast_archive is not None:
                                 try:
-                                    roaster.open_bean_exit()
-                                    opened_bean_exit = seconds
-                                except:
-                                    logger.log("ABRA O TAMBOR!")
-
-                        # Automatically close bean exit after openning it
-                        if seconds - opened_bean_exit >= 30:
-                            if roaster.bean_exit:
-                                try:
-                                    roaster.close_bean_exit()
-                                except:
-                                    logger.log("FECHE O TAMBOR!")
-
-                last_bean_temperature = current_bean_temperature
-
-                if seconds % show_interval == 0:
-                    logger.log_stats(data, setup, turning_point_temp)
-
-                finished = time.time() - start_time > total_time
-                while time.time() - start_loop <= wait_interval:
-                    time.sleep(0.05)
+                                    roast_archive.append(roast_id, data)
+                                except sqlite3.Error as exception:
+                                    logger.log(
+                                        "Erro no arquivo de torras, arquivamento "
+                                        f"interrompido: {exception!r}"
+                                    )
+                                    roast_archive.connection.close()
+                                    roast_archive = None
+                        logger.log(data, message_type="data")
+                except machines.BatchWriteError as exception:
+                    logger.log(f"Erro enviando comandos ao torrador: {exception}")
+
+                finished = loop.elapsed > total_time or (
+                    stop is not None and stop.is_set()
+                )
+                if not finished:
+                    overruns, skipped = loop.overruns, loop.skipped
+                    loop.wait()
+                    metrics.LOOP_TICKS.labels(label).inc()
+                    metrics.LOOP_OVERRUNS.labels(label).inc(loop.overruns - overruns)
+                    metrics.LOOP_SKIPPED.labels(label).inc(loop.skipped - skipped)
+                    metrics.LOOP_PERIOD_SECONDS.labels(label).observe(loop.period)
+                    metrics.LOOP_BUSY_SECONDS.labels(label).observe(loop.busy)
 
         except KeyboardInterrupt:
             pass
 
-    logger.log("Finalizada a gravação. Fechando conexão e convertendo arquivo... ")
+    logger.log("Finalizada a gravação. Fechando conexão... ")
+    if roast_archive is not None and not finish_archive(
+        roast_archive, roast_id, logger
+    ):
+        roast_archive = None
+    stats = loop.stats()
+    if stats["ticks"]:
+        logger.log(
+            f"  Ciclos: {stats['ticks']}, {stats['overruns']} atrasados, "
+            f"{stats['skipped']} pulados, "
+            f"jitter médio {stats['jitter_mean'] * 1000:.1f} ms, "
+            f"p99 {stats['jitter_p99'] * 1000:.1f} ms, "
+            f"máx {stats['jitter_max'] * 1000:.1f} ms"
+        )
+    if getattr(roaster, "cache", None) is not None:
+        stats = roaster.cache.stats
+        logger.log(
+            f"  Cache de leituras: {stats['hits']} acertos, "
+            f"{stats['misses']} falhas ({stats['hit_ratio']:.0%})"
+        )
+    if getattr(roaster, "shadow", None) is not None:
+        stats = roaster.shadow.stats
+        logger.log(
+            f"  Escritas repetidas evitadas: {stats['elided']} de "
+            f"{stats['checked']} ({stats['elided_ratio']:.0%})"
+        )
+    if hasattr(roaster, "link_stats"):
+        for function, stats in roaster.link_stats.items():
+            if not stats["count"]:
+                continue
+            logger.log(
+                f"  {function}: {stats['count']} chamadas, "
+                f"{stats['errors']} erros, "
+                f"p50 {stats['p50'] * 1000:.1f} ms, "
+                f"p99 {stats['p99'] * 1000:.1f} ms"
+            )
     roaster.close()
-    table = rows.import_from_csv(csv_filename)
-    rows.export_to_xls(table, xls_filename)
-    os.unlink(csv_filename)
-    logger.log(f"  Arquivo gravado: {xls_filename}")
+    logger.log(f"  Arquivo gravado: {record_filename}")
+    if roast_archive is not None:
+        logger.log(f"  Torra {roast_id} arquivada: {settings.ARCHIVE_FILENAME}")
+    if args.export:
+        export_filename = record_filename.with_suffix(f".{args.export}")
+        recorder.export(record_filename, export_filename, args.export)
+        logger.log(f"  Arquivo exportado: {export_filename}")
 
 
-if __name__ == "__main__":
+def get_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("numero_torra", type=str)
     parser.add_argument("minutos_totais", type=float)
@@ -279,22 +598,74 @@ if __name__ == "__main__":
     parser.add_argument("--auto", action="store_true")
     parser.add_argument("--redis", action="store_true")
     parser.add_argument("--fake", action="store_true")
+    parser.add_argument("--host", default=settings.ROASTER_HOST)
+    parser.add_argument("--port", type=int, default=settings.ROASTER_PORT)
     parser.add_argument(
         "--control_type",
-        choices=["bean-temperature", "fire-temperature", "servo-position"],
+        choices=[
+            "bean-temperature",
+            "fire-temperature",
+            "servo-position",
+            "bean-temperature-recipe",
+            "fire-temperature-recipe",
+        ],
         default="fire-temperature",
     )
     parser.add_argument("--last_bean_temperature", type=int)
-    args = parser.parse_args()
-
-    if args.redis:
-        logger = Logger(
-            redis_host=settings.REDIS_HOST,
-            redis_port=settings.REDIS_PORT,
-            redis_db=settings.REDIS_DB,
-            redis_channel=settings.REDIS_CHANNEL,
-        )
-    else:
-        logger = Logger()
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=settings.LOOP_INTERVAL,
+        help="Control loop period in seconds",
+    )
+    parser.add_argument(
+        "--late-policy",
+        choices=scheduler.FixedRateScheduler.POLICIES,
+        default=settings.LOOP_POLICY,
+        help="What to do with the ticks missed by a slow iteration",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=settings.METRICS_PORT,
+        help="Serve Prometheus metrics on this port (see metrics.py)",
+    )
+    parser.add_argument(
+        "--export",
+        choices=["csv", "xls"],
+        help="Also export the recording when the roast ends (see recorder.py)",
+    )
+    parser.add_argument(
+        "--roaster",
+        help="Roaster name, used in its Redis channel and recording filename",
+    )
+    return parser
+
+
+def get_logger(args, redis=None):
+    if not args.redis:
+        return Logger(name=args.roaster)
+    return Logger(
+        redis_host=settings.REDIS_HOST,
+        redis_port=settings.REDIS_PORT,
+        redis_db=settings.REDIS_DB,
+        redis_channel=utils.roaster_channel(settings.REDIS_CHANNEL, args.roaster),
+        max_queue=settings.REDIS_QUEUE_SIZE,
+        queue_policy=settings.REDIS_QUEUE_POLICY,
+        history_size=settings.REDIS_HISTORY_SIZE,
+        redis=redis,
+        name=args.roaster,
+    )
+
 
-    roast(args, logger)
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    logger = get_logger(args)
+    logger.start_roast(args.numero_torra)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+
+    try:
+        roast(args, logger)
+    finally:
+        logger.close()
@@ -1,41 +1,239 @@
-﻿import datetime
+﻿import collections
+import datetime
+import hashlib
+import os
+import pathlib
+import pickle
+import tempfile
 
 import rows.utils
 
+import analytics
 
-def load_setup(filename, interval=15):
-    data = rows.utils.import_from_uri(filename, default_encoding="utf8")
 
-    setup = {}
+# Bump when the compiled setup format changes, so old caches are ignored
+SETUP_CACHE_VERSION = 2
+
+
+class SetupProfile:
+    """Setup rows indexed by the integer roast second
+
+    For each variable a list with one entry per second holds the last
+    non-empty value up to that second (forward-filled), so looking up the
+    value for any second is a single list index instead of a backward
+    search. Seconds after the end of the setup repeat the last value.
+    """
+
+    def __init__(self, rows):
+        self.rows = {row.roast_time: row for row in rows}
+        self.end = max(self.rows) if self.rows else 0
+        self.fields = next(iter(self.rows.values()))._fields if self.rows else ()
+        self._sources = {field: self._fill(field) for field in self.fields}
+
+    def _fill(self, field):
+        """Second of the row holding the last non-empty `field`, per second"""
+
+        sources, source = [], None
+        for seconds in range(self.end + 1):
+            row = self.rows.get(seconds)
+            if row is not None and getattr(row, field) is not None:
+                source = seconds
+            sources.append(source)
+        return sources
+
+    def _source(self, seconds, variable):
+        if seconds < 0:
+            return None
+        return self._sources[variable][min(seconds, self.end)]
+
+    def row_for(self, seconds, variable):
+        """Last row up to `seconds` having a value for `variable`"""
+
+        source = self._source(seconds, variable)
+        return self.rows[source] if source is not None else None
+
+    def value(self, seconds, variable):
+        """Last value of `variable` up to `seconds` (`None` if there's none)"""
+
+        source = self._source(seconds, variable)
+        return getattr(self.rows[source], variable) if source is not None else None
+
+    def get(self, seconds, default=None):
+        """Row recorded exactly at `seconds`"""
+
+        return self.rows.get(seconds, default)
+
+    def __getitem__(self, seconds):
+        return self.rows[seconds]
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def initial(self):
+        return self.rows[0]
+
+
+def _non_empty(data):
+    return [row for row in data if any(row._asdict().values())]
+
+
+def _started(setup_rows, interval):
+    """Rows from the start of the roast on, one each `interval` seconds"""
+
+    result = []
     started = False
-    for row in data:
-        if not any(row._asdict().values()):
-            continue
+    for row in setup_rows:
         if row.roast_time == 0:
             started = True
         if not started:
             continue
         if row.roast_time % interval == 0:
-            setup[pretty_seconds(row.roast_time)] = row
+            result.append(row)
+    return result
+
 
-    return setup
+def _final_temperature(setup_rows):
+    """Bean temperature when the beans were dropped (see `analytics`)"""
+
+    points = [
+        (row.roast_time, row.temp_bean)
+        for row in setup_rows
+        if row.roast_time is not None and row.temp_bean is not None
+    ]
+    temperature = analytics.samples_final_temperature(points)
+    return None if temperature is None else int(round(temperature))
+
+
+def _turning_point(setup_rows):
+    """`(seconds, temperature)` where the bean temperature starts rising"""
+
+    last = None
+    for row in _started(setup_rows, 1):
+        if row.temp_bean is None:
+            continue
+        if last is not None and row.roast_time > 10 and row.temp_bean > last[1]:
+            return last
+        last = (row.roast_time, row.temp_bean)
+
+
+def load_setup(filename, interval=15):
+    data = rows.utils.import_from_uri(filename, default_encoding="utf8")
+    return SetupProfile(_started(_non_empty(data), interval))
 
 
 def max_temp(filename):
     data = rows.utils.import_from_uri(filename, default_encoding="utf8")
+    return _final_temperature(_non_empty(data))
 
-    last_temp = 9999999999
-    turning_point = False  # reversed turning point
-    for row in reversed(data):
-        if not any(row._asdict().values()):
-            continue
-        temp = row.temp_bean
-        if not turning_point and temp > last_temp and row.roast_time > 30:
-            turning_point = True
-        elif turning_point and temp < last_temp:
-            return last_temp
 
-        last_temp = temp
+def compile_setup(filename):
+    """Parse a setup spreadsheet once into plain (picklable) data"""
+
+    setup_rows = _non_empty(
+        rows.utils.import_from_uri(str(filename), default_encoding="utf8")
+    )
+    return {
+        "version": SETUP_CACHE_VERSION,
+        "fields": list(setup_rows[0]._fields) if setup_rows else [],
+        "rows": [tuple(row) for row in setup_rows],
+        "final_temperature": _final_temperature(setup_rows),
+        "turning_point": _turning_point(setup_rows),
+    }
+
+
+def file_hash(filename):
+    return hashlib.sha256(pathlib.Path(filename).read_bytes()).hexdigest()
+
+
+def _compiled_setup(filename, cache_path):
+    """Compiled setup from the cache, compiling (and caching) when needed
+
+    The cache entry is keyed by the file path and is valid while the
+    file's mtime and size match; if they don't but the content hash does
+    (the file was just copied or touched) the entry is reused.
+    """
+
+    filename = pathlib.Path(filename).resolve()
+    stat = filename.stat()
+    key = hashlib.sha256(str(filename).encode("utf-8")).hexdigest()
+    cache_filename = pathlib.Path(cache_path) / f"setup-{key}.pickle"
+
+    compiled, content_hash = None, None
+    if cache_filename.exists():
+        try:
+            with open(cache_filename, mode="rb") as fobj:
+                compiled = pickle.load(fobj)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            compiled = None
+        if compiled is not None and compiled.get("version") != SETUP_CACHE_VERSION:
+            compiled = None
+        if compiled is not None and (compiled["mtime"], compiled["size"]) != (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            content_hash = file_hash(filename)
+            if compiled["hash"] != content_hash:
+                compiled = None
+            else:
+                compiled["mtime"], compiled["size"] = stat.st_mtime_ns, stat.st_size
+                _write_pickle(cache_filename, compiled)
+        if compiled is not None:
+            return compiled
+
+    compiled = compile_setup(filename)
+    compiled.update(
+        {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": content_hash or file_hash(filename),
+        }
+    )
+    _write_pickle(cache_filename, compiled)
+    return compiled
+
+
+def _write_pickle(filename, data):
+    """Write atomically, so a crash never leaves a truncated cache file
+
+    Each writer has its own temporary file (roasters started together by
+    `supervisor.py` may compile the same setup at the same time); the last
+    one replaced wins, and every version is complete.
+    """
+
+    filename = pathlib.Path(filename)
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=filename.parent, prefix=f"{filename.stem}-", suffix=".tmp", delete=False
+    ) as fobj:
+        try:
+            pickle.dump(data, fobj, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            fobj.close()
+            os.remove(fobj.name)
+            raise
+    os.replace(fobj.name, filename)
+
+
+def load_setup_file(filename, interval=15, cache_path=None):
+    """Read a setup once, returning its `SetupProfile` and metadata
+
+    The metadata has the `final_temperature` (same as `max_temp`) and the
+    `turning_point` (`(seconds, temperature)`). With `cache_path` the
+    parsed setup is stored there and reused on the next runs.
+    """
+
+    if cache_path is None:
+        compiled = compile_setup(filename)
+    else:
+        compiled = _compiled_setup(filename, cache_path)
+    row_class = collections.namedtuple("SetupRow", compiled["fields"])
+    setup_rows = [row_class(*values) for values in compiled["rows"]]
+    metadata = {
+        "final_temperature": compiled["final_temperature"],
+        "turning_point": compiled["turning_point"],
+    }
+    return SetupProfile(_started(setup_rows, interval)), metadata
 
 
 def pretty_seconds(seconds):
@@ -50,16 +248,12 @@ def pretty_now():
     return str(datetime.datetime.now()).split(".")[0].replace(" ", "T")
 
 
+def roaster_channel(channel, roaster=None):
+    """Redis channel (and history prefix) of a roaster: `channel:roaster`"""
+
+    return f"{channel}:{roaster}" if roaster else channel
+
+
 def get_last_setup_for(setup, seconds, variable):
-    found = False
-    while not found:
-        next_time = pretty_seconds(seconds)
-        row = setup.get(next_time)
-        if row:
-            # TODO: if roast is not finished, calculate a proper temp
-            value = getattr(row, variable)
-            if value is not None:
-                found = True
-                break
-        seconds -= 1
-    return row
+    # TODO: if roast is not finished, calculate a proper temp
+    return setup.row_for(seconds, variable)